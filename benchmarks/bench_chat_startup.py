@@ -0,0 +1,110 @@
+"""
+Measures what chat_interface pays at process start and on every message:
+
+- cold start: importing the modules chat_interface needs, in a fresh process each time, and
+  loading the tokenizer (which warm-up now does before the first message);
+- per message: building a new OpenAI client and ElasticClient on each Streamlit rerun (the old
+  behaviour) against reusing process-wide ones, each making one embeddings request and one
+  Elasticsearch request per message.
+
+The per-message comparison runs against the local fake servers over plain HTTP, so it counts
+client construction and TCP connection setup only; against the real APIs every new connection also
+pays a TLS handshake, which makes reuse matter more.
+
+Run with `PYTHONPATH=./src:. pipenv run python ./benchmarks/bench_chat_startup.py`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from openai import OpenAI
+
+from benchmarks.fake_elasticsearch import FakeElasticsearchServer
+from benchmarks.fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer
+from clients.connections import make_openai_client
+from clients.elastic_client import ElasticClient
+from core.embedding import EMBEDDING_MODEL
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+# what chat_interface imports, apart from streamlit itself
+CHAT_IMPORTS = (
+    "import completion, openai, clients.async_elastic_client, clients.cached_client, clients.connections, "
+    "clients.elastic_client, core.async_bridge, core.async_completion, core.embedding, core.route_names"
+)
+COLD_IMPORT_SCRIPT = f"""
+import json, sys, time
+start_time = time.perf_counter()
+{CHAT_IMPORTS}
+print(json.dumps({{"seconds": time.perf_counter() - start_time, "pandas_loaded": "pandas" in sys.modules}}))
+"""
+TOKENIZER_SCRIPT = """
+import json, time
+from core.embedding import get_encoding
+start_time = time.perf_counter()
+get_encoding()
+print(json.dumps({"seconds": time.perf_counter() - start_time}))
+"""
+
+
+def run_fresh(script: str) -> dict:
+    env = {**os.environ, "PYTHONPATH": f"{SRC_DIR}{os.pathsep}{SRC_DIR / 'core'}"}
+    output = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def message(openai_client: OpenAI, elastic_client: ElasticClient):
+    openai_client.embeddings.create(model=EMBEDDING_MODEL, input=["warm crimps"])
+    elastic_client.es.indices.exists(index="openbeta")
+
+
+def per_message_ms(messages: int, make_clients, shared: bool) -> float:
+    clients = make_clients() if shared else None
+    durations = []
+    for _ in range(messages):
+        start_time = time.perf_counter()
+        message(*(clients if shared else make_clients()))
+        durations.append(time.perf_counter() - start_time)
+    return statistics.median(durations) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per cold start measurement")
+    parser.add_argument("--messages", type=int, default=50)
+    args = parser.parse_args()
+
+    imports = [run_fresh(COLD_IMPORT_SCRIPT) for _ in range(args.runs)]
+    print(f"cold imports: median {statistics.median(run['seconds'] for run in imports) * 1000:.0f} ms, "
+          f"pandas loaded: {imports[0]['pandas_loaded']}")
+    try:
+        tokenizer = [run_fresh(TOKENIZER_SCRIPT) for _ in range(args.runs)]
+        print(f"tokenizer load: median {statistics.median(run['seconds'] for run in tokenizer) * 1000:.0f} ms")
+    except subprocess.CalledProcessError:
+        print("tokenizer load: skipped, the cl100k_base tiktoken encoding is not cached")
+
+    config = FakeOpenAIConfig(dimensions=256, embedding_latency_seconds=0)
+    with FakeOpenAIServer(config) as openai_server, FakeElasticsearchServer(bulk_latency_seconds=0) as es_server:
+        def per_rerun_clients():
+            return (
+                OpenAI(api_key="fake", base_url=openai_server.base_url),
+                ElasticClient(es_server.url, "fake", connections_per_node=10),
+            )
+
+        def shared_clients():
+            return make_openai_client("fake", base_url=openai_server.base_url), ElasticClient(es_server.url, "fake")
+
+        # one untimed pass so both sides start with imports and lazy module state loaded
+        message(*per_rerun_clients())
+        rebuilt = per_message_ms(args.messages, per_rerun_clients, shared=False)
+        shared = per_message_ms(args.messages, shared_clients, shared=True)
+    print(f"per message, clients rebuilt on every rerun: {rebuilt:.2f} ms")
+    print(f"per message, process-wide clients:           {shared:.2f} ms ({rebuilt / shared:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Load test for many chat sessions in one process. N sessions start together and each runs --turns
+chat turns (a search_climbs round, then a streamed answer) against fake_openai_server and
+fake_elasticsearch. The fakes run in a separate process, so their threads don't compete with the
+sessions for the GIL.
+
+Three ways of serving the sessions are compared, all on process-wide clients:
+
+- threads: a thread per session running get_completions_stream, with searches on the shared tool
+  executor. This is chat_interface's default, as Streamlit runs each session's script on a thread;
+- bridge: a thread per session reading get_completions_stream_async through
+  EventLoopThread.iterate, as chat_interface does with ASYNC_CHAT;
+- asyncio: every session a coroutine on one event loop, with no thread per session.
+
+Each row reports turn time and time to first token percentiles, turns per second, CPU time per
+turn and the peak number of threads the process ran. "Sessions per process" is the most sessions whose p95 turn time
+stayed within --slo times the single-session p95.
+
+Both OpenAI clients get the same --openai-connections pool, since a streamed answer holds a
+connection for the whole turn and the default pool would cap both at the same number of sessions.
+
+Run with `PYTHONPATH=./src:. pipenv run python ./benchmarks/bench_concurrent_sessions.py`. Like
+bench_suite, it needs the cl100k_base tiktoken encoding in its cache.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import multiprocessing
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.fake_elasticsearch import FakeElasticsearchServer
+from benchmarks.fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer
+from clients.async_elastic_client import AsyncElasticClient
+from clients.connections import make_async_openai_client, make_openai_client
+from clients.elastic_client import ElasticClient
+from core.async_bridge import EventLoopThread
+from core.async_completion import get_completions_stream_async
+from core.completion import get_completions_stream
+from core.embedding import AsyncQueryEmbedder, QueryEmbedder, get_encoding
+
+MODES = ("threads", "bridge", "asyncio")
+MODEL = "fake-model"
+
+
+def route_documents(count: int = 10) -> list[dict]:
+    return [
+        {
+            "route_name": f"Route {i}", "route_id": 1000 + i, "sector_id": "1", "sector_name": "Buttermilks",
+            "grade": "V5", "style": "boulder", "description": "Crimps on perfect granite to a slopey topout.",
+            "rating": 3.5, "location": {"lat": 37.33, "lon": -118.58},
+        }
+        for i in range(count)
+    ]
+
+
+def serve_fakes(config: FakeOpenAIConfig, search_latency_seconds: float, urls, stop):
+    with FakeOpenAIServer(config) as openai_server, FakeElasticsearchServer(
+        search_latency_seconds=search_latency_seconds, documents=route_documents(),
+    ) as es_server:
+        urls.put((openai_server.base_url, es_server.url))
+        stop.wait()
+
+
+def question(session: int, turn: int) -> list[dict]:
+    return [{"role": "user", "content": f"Session {session}, turn {turn}: where are crimpy boulders near Bishop?"}]
+
+
+class Turns:
+    """Thread-safe record of (time to first token, turn time) per turn."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.first_token_seconds = []
+        self.total_seconds = []
+
+    def record(self, start_time: float, first_token_time: float):
+        with self._lock:
+            self.first_token_seconds.append(first_token_time - start_time)
+            self.total_seconds.append(time.perf_counter() - start_time)
+
+
+class ThreadCounter:
+    """Samples the process's thread count from a thread of its own (counted out) while in use."""
+
+    def __init__(self, interval_seconds: float = 0.01):
+        self.interval_seconds = interval_seconds
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.peak = max(self.peak, threading.active_count() - 1)
+
+    def __enter__(self) -> "ThreadCounter":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_threads(clients: dict, sessions: int, turns: int, recorded: Turns):
+    openai_client, climbing_data_client = clients["sync"]
+
+    def session(number):
+        for turn in range(turns):
+            start_time, first_token_time = time.perf_counter(), None
+            for _ in get_completions_stream(openai_client, climbing_data_client, MODEL, question(number, turn)):
+                first_token_time = first_token_time or time.perf_counter()
+            recorded.record(start_time, first_token_time)
+
+    _run_on_threads(session, sessions)
+
+
+def run_bridge(clients: dict, sessions: int, turns: int, recorded: Turns):
+    openai_client, climbing_data_client = clients["async"]
+    event_loop_thread = clients["event_loop_thread"]
+
+    def session(number):
+        for turn in range(turns):
+            start_time, first_token_time = time.perf_counter(), None
+            for _ in event_loop_thread.iterate(functools.partial(
+                get_completions_stream_async, openai_client, climbing_data_client, MODEL, question(number, turn),
+            )):
+                first_token_time = first_token_time or time.perf_counter()
+            recorded.record(start_time, first_token_time)
+
+    _run_on_threads(session, sessions)
+
+
+def run_asyncio(clients: dict, sessions: int, turns: int, recorded: Turns):
+    openai_client, climbing_data_client = clients["async"]
+
+    async def session(number):
+        for turn in range(turns):
+            start_time, first_token_time = time.perf_counter(), None
+            async for _ in get_completions_stream_async(openai_client, climbing_data_client, MODEL, question(number, turn)):
+                first_token_time = first_token_time or time.perf_counter()
+            recorded.record(start_time, first_token_time)
+
+    async def all_sessions():
+        await asyncio.gather(*(session(number) for number in range(sessions)))
+
+    clients["event_loop_thread"].run(all_sessions())
+
+
+def _run_on_threads(session, sessions: int):
+    threads = [threading.Thread(target=session, args=(number,)) for number in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+RUNNERS = {"threads": run_threads, "bridge": run_bridge, "asyncio": run_asyncio}
+
+
+def measure(mode: str, clients: dict, sessions: int, turns: int) -> dict:
+    recorded = Turns()
+    start_time, start_cpu_time = time.perf_counter(), time.process_time()
+    with ThreadCounter() as thread_counter:
+        RUNNERS[mode](clients, sessions, turns, recorded)
+    duration = time.perf_counter() - start_time
+    cpu_seconds = time.process_time() - start_cpu_time
+    total_ms = np.asarray(recorded.total_seconds) * 1000
+    first_token_ms = np.asarray(recorded.first_token_seconds) * 1000
+    return {
+        "sessions": sessions,
+        "turns": len(total_ms),
+        "turn_p50_ms": round(float(np.percentile(total_ms, 50)), 1),
+        "turn_p95_ms": round(float(np.percentile(total_ms, 95)), 1),
+        "ttft_p95_ms": round(float(np.percentile(first_token_ms, 95)), 1),
+        "turns_per_second": round(len(total_ms) / duration, 1),
+        # the process's CPU time, all threads included; one core's worth caps turns_per_second
+        "cpu_ms_per_turn": round(cpu_seconds * 1000 / len(total_ms), 1),
+        "peak_threads": thread_counter.peak,
+    }
+
+
+def sessions_per_process(rows: list[dict], slo: float) -> int:
+    single = rows[0]["turn_p95_ms"]
+    return max((row["sessions"] for row in rows if row["turn_p95_ms"] <= slo * single), default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 16, 64, 128, 256])
+    parser.add_argument("--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="seconds before a chat response starts")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds between streamed chat chunks")
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per embeddings request")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="seconds per Elasticsearch search")
+    parser.add_argument("--openai-connections", type=int, default=512)
+    parser.add_argument("--slo", type=float, default=1.5, help="allowed p95 turn time, as a multiple of one session's")
+    parser.add_argument("--output", type=Path, help="also write the results here as JSON")
+    args = parser.parse_args()
+
+    try:
+        get_encoding()
+    except Exception:
+        print("Skipping: the cl100k_base tiktoken encoding is not cached")
+        sys.exit(1)
+
+    config = FakeOpenAIConfig(
+        dimensions=256,
+        embedding_latency_seconds=args.embedding_latency,
+        chat_first_token_seconds=args.first_token_latency,
+        chat_token_seconds=args.token_latency,
+    )
+    context = multiprocessing.get_context("spawn")
+    urls, stop = context.Queue(), context.Event()
+    server_process = context.Process(target=serve_fakes, args=(config, args.search_latency, urls, stop), daemon=True)
+    server_process.start()
+    openai_url, es_url = urls.get(timeout=30)
+
+    event_loop_thread = EventLoopThread()
+    sync_openai = make_openai_client("fake", base_url=openai_url, max_connections=args.openai_connections)
+    async_openai = make_async_openai_client("fake", base_url=openai_url, max_connections=args.openai_connections)
+    clients = {
+        "event_loop_thread": event_loop_thread,
+        "sync": (sync_openai, ElasticClient(es_url, "fake", embed_query=QueryEmbedder(sync_openai))),
+        "async": (async_openai, AsyncElasticClient(es_url, "fake", embed_query=AsyncQueryEmbedder(async_openai))),
+    }
+    results = {}
+    try:
+        for mode in args.modes:
+            # one untimed turn opens connections and fills the query embedding cache
+            measure(mode, clients, 1, 1)
+            rows = [measure(mode, clients, sessions, args.turns) for sessions in args.sessions]
+            results[mode] = {"rows": rows, "sessions_per_process": sessions_per_process(rows, args.slo)}
+    finally:
+        event_loop_thread.run(clients["async"][1].close())
+        event_loop_thread.stop()
+        stop.set()
+        server_process.join(timeout=5)
+
+    print(f"{'mode':8s} {'sessions':>8s} {'turn p50':>9s} {'turn p95':>9s} {'ttft p95':>9s} {'turns/s':>8s} {'cpu/turn':>9s} {'threads':>8s}")
+    for mode, result in results.items():
+        for row in result["rows"]:
+            print(f"{mode:8s} {row['sessions']:8d} {row['turn_p50_ms']:7.0f}ms {row['turn_p95_ms']:7.0f}ms "
+                  f"{row['ttft_p95_ms']:7.0f}ms {row['turns_per_second']:8.1f} {row['cpu_ms_per_turn']:7.1f}ms {row['peak_threads']:8d}")
+    for mode, result in results.items():
+        print(f"sessions per process ({mode}, p95 turn within {args.slo}x of one session): {result['sessions_per_process']}")
+    if args.output:
+        args.output.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()}, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
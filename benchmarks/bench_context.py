@@ -0,0 +1,67 @@
+"""
+Prompt tokens per turn of a synthetic multi-turn planning conversation, sending search results as
+raw JSON with the full history (the old behaviour) against fitting the prompt with ContextBudget.
+Each turn runs three searches against an in-process index of synthetic routes.
+
+Run with `PYTHONPATH=./src:. pipenv run python ./benchmarks/bench_context.py`. tiktoken needs to be
+able to load the cl100k_base encoding.
+"""
+import argparse
+import json
+
+from benchmarks.synthetic_openbeta import make_openbeta_dataframe
+from clients.local_client import LocalClimbingDataClient
+from core.completion import SYSTEM_PROMPT, ContextBudget
+from scripts.load_climbing_data import iter_documents
+
+SEARCHES = [
+    {"style": "boulder", "grades": ["V5", "V6", "V7"]},
+    {"style": "trad", "rating_min": 3},
+    {"description": "crimp landing"},
+]
+
+
+def run_conversation(client, turns, budget: ContextBudget):
+    raw_history = [{"role": "system", "content": SYSTEM_PROMPT}]
+    fitted_history = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for turn in range(turns):
+        question = {"role": "user", "content": f"Turn {turn}: where should the three of us climb this weekend? " * 3}
+        tool_call_message = {"role": "assistant", "content": None, "tool_calls": [
+            {"id": f"{turn}-{i}", "type": "function", "function": {"name": "search_climbs", "arguments": json.dumps(search)}}
+            for i, search in enumerate(SEARCHES)
+        ]}
+        results = [client.search_climbs(**search) for search in SEARCHES]
+
+        raw_prompt = raw_history + [question, tool_call_message] + [
+            {"role": "tool", "tool_call_id": f"{turn}-{i}", "content": json.dumps(result)} for i, result in enumerate(results)
+        ]
+        fitted_prompt = budget.fit(fitted_history + [question, tool_call_message] + [
+            {"role": "tool", "tool_call_id": f"{turn}-{i}", "content": budget.format_tool_result(result)}
+            for i, result in enumerate(results)
+        ])
+        yield turn, budget.count_prompt_tokens(raw_prompt), budget.count_prompt_tokens(fitted_prompt)
+
+        answer = {"role": "assistant", "content": " ".join(route["route_name"] for result in results for route in result["routes"]) * 4}
+        raw_history += [question, answer]
+        fitted_history += [question, answer]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=20000)
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--budget", type=int, default=ContextBudget().token_budget)
+    args = parser.parse_args()
+
+    documents = list(iter_documents(make_openbeta_dataframe(args.routes)))
+    client = LocalClimbingDataClient(documents)
+    raw_total = fitted_total = 0
+    for turn, raw_tokens, fitted_tokens in run_conversation(client, args.turns, ContextBudget(token_budget=args.budget)):
+        raw_total += raw_tokens
+        fitted_total += fitted_tokens
+        print(f"turn {turn:2d}: raw JSON {raw_tokens:6d} tokens, budgeted {fitted_tokens:6d} tokens")
+    print(f"total: raw JSON {raw_total} tokens, budgeted {fitted_total} tokens ({fitted_total / raw_total:.0%})")
+
+
+if __name__ == "__main__":
+    main()
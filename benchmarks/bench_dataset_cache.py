@@ -0,0 +1,101 @@
+"""
+Compares startup time and peak RSS of unpickling the zipped OpenBeta dataset against reading the
+Parquet cache. Each measurement runs in a fresh process so peak RSS isn't shared between them.
+
+Run with `PYTHONPATH=./src:. pipenv run python ./benchmarks/bench_dataset_cache.py`. Pass --data-dir
+to use a directory that already holds the real climbing_data.pkl.zip.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from zipfile import ZIP_DEFLATED, ZipFile
+
+import pandas as pd
+
+from benchmarks.synthetic_openbeta import make_openbeta_dataframe
+from scripts.load_climbing_data import SOURCE_COLUMNS, download_and_load_data
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss survives exec, so a child would report its parent's peak; VmHWM is per address space
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(mode: str, data_dir: Path) -> dict:
+    os.environ["DATA_DIR"] = str(data_dir)
+    baseline_rss_mb = peak_rss_mb()
+    start_time = time.perf_counter()
+    if mode == "pickle":
+        with ZipFile(data_dir / "climbing_data.pkl.zip") as zip_file:
+            with zip_file.open(zip_file.namelist()[0]) as pkl_file:
+                df = pd.read_pickle(pkl_file)
+    else:
+        df = download_and_load_data()
+    duration = time.perf_counter() - start_time
+    return {
+        "mode": mode,
+        "rows": len(df),
+        "seconds": duration,
+        "peak_rss_mb": peak_rss_mb(),
+        "baseline_rss_mb": baseline_rss_mb,
+    }
+
+
+def run_in_subprocess(mode: str, data_dir: Path) -> dict:
+    output = subprocess.run(
+        [sys.executable, __file__, "--measure", mode, "--data-dir", str(data_dir)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def write_synthetic_source(data_dir: Path, num_routes: int):
+    df = make_openbeta_dataframe(num_routes)
+    # pad with the kinds of columns the real dataset has but the loader never reads
+    df["nopm_YDS"] = df["YDS"]
+    df["safety"] = ""
+    df["protection"] = [["Standard rack, doubles to #2."] * 3] * len(df)
+    pkl_path = data_dir / "climbing_data.pkl"
+    df.to_pickle(pkl_path)
+    with ZipFile(data_dir / "climbing_data.pkl.zip", "w", ZIP_DEFLATED) as zip_file:
+        zip_file.write(pkl_path, "climbing_data.pkl")
+    pkl_path.unlink()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=200000)
+    parser.add_argument("--data-dir", type=Path)
+    parser.add_argument("--measure", choices=["pickle", "parquet"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.data_dir)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or Path(tmp_dir)
+        if args.data_dir is None:
+            write_synthetic_source(data_dir, args.routes)
+        # first run converts to Parquet, so it is not part of the comparison
+        run_in_subprocess("parquet", data_dir)
+        for mode in ("pickle", "parquet"):
+            result = run_in_subprocess(mode, data_dir)
+            print(f"{mode}: {result['rows']} rows, {len(SOURCE_COLUMNS) if mode == 'parquet' else 'all'} columns "
+                  f"in {result['seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f} MB "
+                  f"({result['peak_rss_mb'] - result['baseline_rss_mb']:.0f} MB over the {result['baseline_rss_mb']:.0f} MB after imports)")
+
+
+if __name__ == "__main__":
+    main()
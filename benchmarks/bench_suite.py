@@ -0,0 +1,265 @@
+"""
+Offline performance baseline: transform_data throughput, add_embeddings throughput, bulk indexing
+throughput, search_climbs latency and chat-turn time to first token, all against synthetic data
+and local stand-ins for OpenAI (fake_openai_server) and Elasticsearch (fake_elasticsearch), with
+latencies set by the flags below. Searches and the chat's tool calls go through ElasticClient, so
+query building, the HTTP round trip and response parsing are all timed.
+
+Results are written as JSON. Pass --compare with an earlier results file to print the change in
+every metric and exit non-zero if any got worse by more than --tolerance.
+
+Run with `PYTHONPATH=./src:. pipenv run python ./benchmarks/bench_suite.py`. When the cl100k_base
+tiktoken encoding is neither cached (TIKTOKEN_CACHE_DIR) nor downloadable, the embedding and chat
+benchmarks run on stub_encoding instead; the results record which encoding was used.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from openai import OpenAI
+
+from benchmarks.fake_elasticsearch import FakeElasticsearchServer
+from benchmarks.fake_openai_server import FakeOpenAIConfig, FakeOpenAIServer
+from benchmarks.synthetic_openbeta import make_openbeta_dataframe
+from benchmarks.stub_encoding import STUB_ENCODING_NAME, use_stub_encoding_if_uncached
+from clients.elastic_client import ElasticClient
+from core.completion import get_completions_stream
+from core.embedding import QueryEmbedder, add_embeddings
+from scripts.load_climbing_data import bulk_index, transform_data
+
+RESULTS_DIR = Path(__file__).parent / "results"
+BENCHMARKS = ("transform", "embeddings", "bulk_index", "search", "chat")
+SEARCHES = {
+    "route_name": {"route_name": "crimp jug"},
+    "sector_name": {"sector_name": "sector 12"},
+    "location": {"location": {"lat": 37.0, "lon": -100.0}, "location_radius_miles": 150},
+    "grade_range": {"style": "boulder", "grade_min": "V4", "grade_max": "V6", "rating_min": 2},
+    # numbered per repeat, so every description search waits on a query embedding like a new question would
+    "description": {"description": "sloper traverse to a highball topout {}"},
+}
+
+
+def percentiles_ms(seconds: list[float]) -> dict:
+    milliseconds = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+    }
+
+
+def bench_transform(df) -> tuple[dict, list[dict]]:
+    start_time = time.perf_counter()
+    documents = transform_data(df)
+    duration = time.perf_counter() - start_time
+    return {"rows": len(df), "seconds": round(duration, 3), "rows_per_second": round(len(df) / duration, 1)}, documents
+
+
+def bench_embeddings(documents: list[dict], openai_client: OpenAI, server: FakeOpenAIServer) -> dict:
+    requests_before = server.requests["embeddings"]
+    with tempfile.TemporaryDirectory() as data_dir:
+        # an empty embedding cache, so every description goes to the API
+        previous_data_dir = os.environ.get("DATA_DIR")
+        os.environ["DATA_DIR"] = data_dir
+        try:
+            start_time = time.perf_counter()
+            add_embeddings({doc["route_id"]: doc for doc in documents}, openai_client)
+            duration = time.perf_counter() - start_time
+        finally:
+            if previous_data_dir is None:
+                del os.environ["DATA_DIR"]
+            else:
+                os.environ["DATA_DIR"] = previous_data_dir
+    return {
+        "documents": len(documents),
+        "requests": server.requests["embeddings"] - requests_before,
+        "seconds": round(duration, 3),
+        "documents_per_second": round(len(documents) / duration, 1),
+    }
+
+
+def bench_bulk_index(documents: list[dict], args) -> dict:
+    with FakeElasticsearchServer(bulk_latency_seconds=args.bulk_latency) as server:
+        start_time = time.perf_counter()
+        failed = bulk_index(server.client(), "openbeta-bench", documents, args.chunk_size, args.workers)
+        duration = time.perf_counter() - start_time
+    return {
+        "documents": len(documents),
+        "with_vectors": sum(doc.get("description_vector") is not None for doc in documents),
+        "failed": len(failed),
+        "seconds": round(duration, 3),
+        "documents_per_second": round(len(documents) / duration, 1),
+    }
+
+
+def bench_search(client: ElasticClient, repeats: int) -> dict:
+    results = {}
+    all_durations = []
+    for kind, search in SEARCHES.items():
+        durations = []
+        for repeat in range(repeats):
+            query = {key: value.format(repeat) if key == "description" else value for key, value in search.items()}
+            start_time = time.perf_counter()
+            client.search_climbs(**query)
+            durations.append(time.perf_counter() - start_time)
+        results[kind] = percentiles_ms(durations)
+        all_durations += durations
+    return {"searches": len(all_durations), **percentiles_ms(all_durations), "by_kind": results}
+
+
+def bench_chat(openai_client: OpenAI, client: ElasticClient, turns: int) -> dict:
+    first_token_seconds = []
+    total_seconds = []
+    for turn in range(turns):
+        messages = [{"role": "user", "content": f"Turn {turn}: where can I find crimpy boulders near Bishop?"}]
+        start_time = time.perf_counter()
+        first_token_time = None
+        for _ in get_completions_stream(openai_client, client, "fake-model", messages):
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+        first_token_seconds.append(first_token_time - start_time)
+        total_seconds.append(time.perf_counter() - start_time)
+    return {
+        "turns": turns,
+        "time_to_first_token": percentiles_ms(first_token_seconds),
+        "total": percentiles_ms(total_seconds),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    """Prints every timed metric's change from baseline and returns the ones that got worse by more than tolerance."""
+    ignored = {"output", "compare", "tolerance"}
+    changed = [
+        key for key, value in current["meta"]["args"].items()
+        if key not in ignored and baseline["meta"]["args"].get(key) != value
+    ]
+    if changed:
+        print(f"Note: the runs used different settings for {', '.join(changed)}")
+    if baseline["meta"].get("encoding") != current["meta"].get("encoding"):
+        print(f"Note: the runs tokenized with different encodings, {baseline['meta'].get('encoding')} "
+              f"and {current['meta'].get('encoding')}")
+    regressions = []
+    baseline_metrics, current_metrics = flatten(baseline["results"]), flatten(current["results"])
+    for name, value in current_metrics.items():
+        old = baseline_metrics.get(name)
+        higher_is_better = name.endswith("_per_second")
+        if not (higher_is_better or name.endswith("_ms")) or not old:
+            continue
+        change = (value - old) / old
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > tolerance else ""
+        print(f"{name:55s} {old:12.3f} -> {value:12.3f} ({change:+.1%}){flag}")
+        if worse > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=20000)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--embed-routes", type=int, default=2000, help="routes to embed; the rest stay without vectors")
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--embedding-latency", type=float, default=0.05, help="seconds per embeddings request")
+    parser.add_argument("--first-token-latency", type=float, default=0.3, help="seconds before a chat response starts")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="seconds between streamed chat chunks")
+    parser.add_argument("--bulk-latency", type=float, default=0.005, help="seconds per bulk request")
+    parser.add_argument("--search-latency", type=float, default=0.005, help="seconds per Elasticsearch search")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--search-repeats", type=int, default=50)
+    parser.add_argument("--chat-turns", type=int, default=10)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path, help="an earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    selected = set(args.only)
+    encoding = use_stub_encoding_if_uncached()
+    if encoding == STUB_ENCODING_NAME and selected & {"embeddings", "chat"}:
+        print(f"The cl100k_base tiktoken encoding is not cached, tokenizing with the {encoding} encoding")
+
+    config = FakeOpenAIConfig(
+        dimensions=args.dimensions,
+        embedding_latency_seconds=args.embedding_latency,
+        chat_first_token_seconds=args.first_token_latency,
+        chat_token_seconds=args.token_latency,
+    )
+    results = {}
+    df = make_openbeta_dataframe(args.routes)
+    with FakeOpenAIServer(config) as openai_server:
+        openai_client = OpenAI(api_key="fake", base_url=openai_server.base_url)
+
+        transform_results, documents = bench_transform(df)
+        if "transform" in selected:
+            results["transform"] = transform_results
+            print(f"transform: {transform_results['rows_per_second']:.0f} rows/s")
+        if "embeddings" in selected:
+            results["embeddings"] = bench_embeddings(documents[:args.embed_routes], openai_client, openai_server)
+            print(f"embeddings: {results['embeddings']['documents_per_second']:.0f} documents/s "
+                  f"in {results['embeddings']['requests']} requests")
+        if "bulk_index" in selected:
+            results["bulk_index"] = bench_bulk_index(documents, args)
+            print(f"bulk_index: {results['bulk_index']['documents_per_second']:.0f} documents/s")
+
+        if selected & {"search", "chat"}:
+            with FakeElasticsearchServer(search_latency_seconds=args.search_latency, documents=documents) as es_server:
+                client = ElasticClient(es_server.url, None, embed_query=QueryEmbedder(openai_client))
+                if "search" in selected:
+                    results["search"] = bench_search(client, args.search_repeats)
+                    print(f"search: p50 {results['search']['p50_ms']:.1f} ms, p99 {results['search']['p99_ms']:.1f} ms")
+                if "chat" in selected:
+                    results["chat"] = bench_chat(openai_client, client, args.chat_turns)
+                    print(f"chat: time to first token p50 {results['chat']['time_to_first_token']['p50_ms']:.0f} ms, "
+                          f"p99 {results['chat']['time_to_first_token']['p99_ms']:.0f} ms")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "encoding": encoding,
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+        },
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"bench-{datetime.now().strftime('%Y%m%d%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+
+    if args.compare:
+        regressions = compare(json.loads(args.compare.read_text()), report, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
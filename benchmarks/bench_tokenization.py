@@ -0,0 +1,71 @@
+"""
+Compares tokenization throughput of the old embedding pipeline against the current one.
+
+Run with `PYTHONPATH=./src pipenv run python ./benchmarks/bench_tokenization.py`.
+"""
+import argparse
+import random
+import time
+
+import tiktoken
+
+from core.embedding import MAX_TOKENS_PER_BATCH, encode_batch, get_encoding
+
+WORDS = ("crimp", "jug", "sloper", "pinch", "crack", "arete", "dihedral", "roof", "slab", "mantle",
+         "traverse", "topout", "highball", "landing", "pocket", "flake", "undercling", "heel", "hook", "bolt")
+
+
+def make_descriptions(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    descriptions = []
+    for _ in range(count):
+        # mostly short descriptions with a long tail, like OpenBeta; a few exceed the input limit
+        num_words = min(int(rng.paretovariate(1.2) * 40), 12000)
+        descriptions.append(" ".join(rng.choice(WORDS) for _ in range(num_words)))
+    return descriptions
+
+
+def legacy_tokenize(descriptions: list[str]) -> int:
+    # what add_embeddings used to do: count with a fresh encoder, halve oversized strings, then encode again to send
+    def num_tokens_from_string(string):
+        return len(tiktoken.get_encoding("cl100k_base").encode(string))
+
+    total_tokens = 0
+    batch = []
+    for description in descriptions:
+        next_doc_tokens = num_tokens_from_string(description)
+        while next_doc_tokens >= MAX_TOKENS_PER_BATCH:
+            description = description[0:len(description) // 2]
+            next_doc_tokens = num_tokens_from_string(description)
+        batch.append(description)
+    encoding = tiktoken.get_encoding("cl100k_base")
+    for line in batch:
+        total_tokens += len(encoding.encode(line))
+    return total_tokens
+
+
+def current_tokenize(descriptions: list[str], chunk_size: int = 1000) -> int:
+    total_tokens = 0
+    for start in range(0, len(descriptions), chunk_size):
+        for tokens in encode_batch(descriptions[start:start + chunk_size]):
+            total_tokens += len(tokens[:MAX_TOKENS_PER_BATCH - 1])
+    return total_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    descriptions = make_descriptions(args.count)
+    get_encoding()  # load the BPE ranks up front so both runs start warm
+
+    for name, tokenize in (("before", legacy_tokenize), ("after", current_tokenize)):
+        start_time = time.perf_counter()
+        total_tokens = tokenize(descriptions)
+        duration = time.perf_counter() - start_time
+        print(f"{name}: {total_tokens} tokens in {duration:.2f}s - {total_tokens / duration:,.0f} tokens/s")
+
+
+if __name__ == "__main__":
+    main()
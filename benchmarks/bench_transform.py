@@ -0,0 +1,72 @@
+"""
+Times the row-by-row transform against the columnar iter_documents.
+
+Run with `PYTHONPATH=./src:. pipenv run python ./benchmarks/bench_transform.py`. Pass --full to use the
+real OpenBeta dataset from DATA_DIR instead of a synthetic one.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from benchmarks.synthetic_openbeta import make_openbeta_dataframe
+from scripts.load_climbing_data import download_and_load_data, iter_documents
+
+
+def legacy_transform(df):
+    def extract_coordinates(location):
+        try:
+            if pd.isna(location).any():
+                return None
+            if not hasattr(location, '__len__') or len(location) != 2:
+                return None
+            lon, lat = float(location[0]), float(location[1])
+            if not (np.isfinite(lon) and np.isfinite(lat)):
+                return None
+            return {"lat": lat, "lon": lon}
+        except Exception:
+            return None
+
+    documents = []
+    for _, row in df.iterrows():
+        doc = {
+            "route_name": row["route_name"],
+            "route_id": row["route_ID"],
+            "sector_id": row["sector_ID"],
+            "grade": row["YDS"] if pd.notna(row["YDS"]) else row["Vermin"],
+            "sector_name": row["parent_sector"],
+            "location": extract_coordinates(row["parent_loc"]),
+            "style": row["type_string"],
+            "description": "\n".join(row["description"] or []),
+            "description_vector": None,
+            "rating": float(np.mean([rating[1] for rating in row["corrected_users_ratings"]])) if isinstance(row["corrected_users_ratings"], (list, np.ndarray)) and len(row["corrected_users_ratings"]) > 0 else None
+        }
+        if doc["route_name"] and doc["grade"] and doc["route_id"]:
+            documents.append(doc)
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=100000)
+    parser.add_argument("--full", action="store_true", help="use the real OpenBeta dataset")
+    args = parser.parse_args()
+
+    if args.full:
+        load_dotenv()
+        df = download_and_load_data()
+    else:
+        df = make_openbeta_dataframe(args.routes)
+
+    for name, transform in (("iterrows", legacy_transform), ("columnar", lambda df: list(iter_documents(df)))):
+        start_time = time.perf_counter()
+        documents = transform(df)
+        duration = time.perf_counter() - start_time
+        print(f"{name}: {len(documents)} documents from {len(df)} rows in {duration:.2f}s - "
+              f"{len(df) / duration:,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
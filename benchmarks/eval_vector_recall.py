@@ -0,0 +1,154 @@
+"""
+Recall of shorter and quantized description embeddings against full-size float32 vectors, to pick
+EMBEDDING_DIMENSIONS, EMBEDDING_CACHE_DTYPE and --vector-index-type with data rather than by guess.
+
+Offline (the default), --queries description vectors are held out of the embedding cache and every
+other vector is searched exactly for each, once at full precision (the expected top k) and once per
+dimensions x representation. Shorter vectors are the full ones truncated and renormalized, which is
+what the API returns for text-embedding-3 models, so nothing is embedded again. int4 and bbq
+candidates are rescored with the float vectors, as Elasticsearch does for those index types. Each
+row reports recall@k, the bytes per vector the index holds and the brute-force milliseconds per
+query. Without a cache (or with --synthetic) clustered random vectors stand in for the descriptions;
+they exercise the evaluation, but their recall depends on how they are generated and says little
+about real descriptions.
+
+With --index, kNN searches against the live index are compared with an exact script_score search
+over the same index, for each --num-candidates, giving recall@k and the kNN search's took times as
+loaded (dimensions and index type included).
+
+Run with `PYTHONPATH=./src:. pipenv run python ./benchmarks/eval_vector_recall.py`.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from constants import ELASTICSEARCH_INDEX_NAME
+from core.embedding import EMBEDDING_DIMENSIONS, load_embedding_cache
+from core.vector_recall import BYTES_PER_DIMENSION, quantize, recall_at_k, rescored_top_k, shorten_embeddings, top_k
+
+RESCORED = ("int4", "bbq")
+
+
+def synthetic_vectors(count: int, dimensions: int = EMBEDDING_DIMENSIONS, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """
+    Unit vectors around random cluster centers. The centers differ most in the leading components,
+    as in Matryoshka embeddings, while every component carries the same noise.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions)) * 2 / np.sqrt(np.arange(1, dimensions + 1)) ** 0.5
+    vectors = centers[rng.integers(clusters, size=count)] + rng.standard_normal((count, dimensions))
+    return shorten_embeddings(vectors, dimensions)
+
+
+def evaluate_offline(vectors: np.ndarray, queries: int, k: int, dimensions: list[int], representations: list[str],
+                     oversample: float, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    held_out = rng.choice(len(vectors), size=min(queries, len(vectors) // 2), replace=False)
+    query_vectors = vectors[held_out]
+    corpus = np.delete(vectors, held_out, axis=0)
+    expected = top_k(query_vectors, corpus, k)
+
+    rows = []
+    for size in dimensions:
+        short_queries, short_corpus = shorten_embeddings(query_vectors, size), shorten_embeddings(corpus, size)
+        for representation in representations:
+            stored = quantize(short_corpus, representation)
+            start_time = time.perf_counter()
+            if representation in RESCORED:
+                found = rescored_top_k(short_queries, stored, short_corpus, k, oversample)
+            else:
+                found = top_k(short_queries, stored, k)
+            duration = time.perf_counter() - start_time
+            rows.append({
+                "dimensions": size,
+                "representation": representation,
+                "bytes_per_vector": int(size * BYTES_PER_DIMENSION[representation]),
+                "recall": round(recall_at_k(expected, found), 4),
+                "ms_per_query": round(duration * 1000 / len(short_queries), 3),
+            })
+    return rows
+
+
+def evaluate_index(es, queries: int, k: int, num_candidates: list[int], seed: int = 0) -> list[dict]:
+    sample = es.search(
+        index=ELASTICSEARCH_INDEX_NAME,
+        size=queries,
+        query={"function_score": {"query": {"exists": {"field": "description_vector"}}, "random_score": {"seed": seed, "field": "_seq_no"}}},
+        source=["description_vector"],
+    )["hits"]["hits"]
+    rows = {candidates: {"num_candidates": candidates, "recall": [], "took_ms": []} for candidates in num_candidates}
+    for hit in sample:
+        vector = hit["_source"]["description_vector"]
+        # each sampled document finds itself first, so ask for one more and drop it from both searches
+        exact = es.search(
+            index=ELASTICSEARCH_INDEX_NAME,
+            size=k + 1,
+            source=False,
+            query={"script_score": {
+                "query": {"exists": {"field": "description_vector"}},
+                "script": {"source": "cosineSimilarity(params.vector, 'description_vector') + 1.0", "params": {"vector": vector}},
+            }},
+        )["hits"]["hits"]
+        expected = [h["_id"] for h in exact if h["_id"] != hit["_id"]][:k]
+        for candidates in num_candidates:
+            response = es.search(
+                index=ELASTICSEARCH_INDEX_NAME,
+                size=k + 1,
+                source=False,
+                knn={"field": "description_vector", "query_vector": vector, "k": k + 1, "num_candidates": max(candidates, k + 1)},
+            )
+            found = {h["_id"] for h in response["hits"]["hits"] if h["_id"] != hit["_id"]}
+            rows[candidates]["recall"].append(len(found & set(expected)) / max(len(expected), 1))
+            rows[candidates]["took_ms"].append(response["took"])
+    return [
+        {
+            "num_candidates": row["num_candidates"],
+            "recall": round(float(np.mean(row["recall"])), 4),
+            "took_p50_ms": float(np.percentile(row["took_ms"], 50)),
+            "took_p95_ms": float(np.percentile(row["took_ms"], 95)),
+        }
+        for row in rows.values()
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[1536, 1024, 768, 512, 256])
+    parser.add_argument("--representations", nargs="+", choices=list(BYTES_PER_DIMENSION), default=list(BYTES_PER_DIMENSION))
+    parser.add_argument("--oversample", type=float, default=3.0, help="candidates per result rescored for int4 and bbq")
+    parser.add_argument("--synthetic", type=int, help="evaluate this many synthetic vectors instead of the embedding cache")
+    parser.add_argument("--index", action="store_true", help="measure kNN recall and latency on the live index instead")
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[50, 100, 200, 500])
+    parser.add_argument("--output", type=Path, help="also write the results here as JSON")
+    args = parser.parse_args()
+
+    if args.index:
+        from scripts.load_climbing_data import get_elasticsearch_client
+
+        rows = evaluate_index(get_elasticsearch_client(), args.queries, args.k, args.num_candidates)
+        print(f"{'num_candidates':>14s} {f'recall@{args.k}':>10s} {'took p50':>9s} {'took p95':>9s}")
+        for row in rows:
+            print(f"{row['num_candidates']:14d} {row['recall']:10.3f} {row['took_p50_ms']:7.0f}ms {row['took_p95_ms']:7.0f}ms")
+    else:
+        vectors = None if args.synthetic else load_embedding_cache().vectors()
+        if vectors is None or len(vectors) < 2 * args.k:
+            print(f"Using {args.synthetic or 20000} synthetic vectors")
+            vectors = synthetic_vectors(args.synthetic or 20000)
+        dimensions = [size for size in args.dimensions if size <= vectors.shape[1]]
+        rows = evaluate_offline(vectors, args.queries, args.k, dimensions, args.representations, args.oversample)
+        print(f"{len(vectors)} vectors, {min(args.queries, len(vectors) // 2)} held-out queries")
+        print(f"{'dimensions':>10s} {'stored as':>10s} {'bytes':>6s} {f'recall@{args.k}':>10s} {'ms/query':>9s}")
+        for row in rows:
+            print(f"{row['dimensions']:10d} {row['representation']:>10s} {row['bytes_per_vector']:6d} "
+                  f"{row['recall']:10.3f} {row['ms_per_query']:9.3f}")
+    if args.output:
+        args.output.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()}, "rows": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+A local stand-in for the Elasticsearch endpoints the loader writes to and the chat searches, so bulk
+indexing and searches can be timed offline with the real client, serialization and HTTP included.
+Every bulk item is acknowledged after `bulk_latency_seconds`. Searches (_search and each search of an
+_msearch) answer after `search_latency_seconds` with the first `size` of `documents` as hits, best
+first, keeping only the requested `_source` fields. Other requests get an empty success response.
+Nothing is stored, so what it measures is the client side of a load.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Sequence
+
+from elasticsearch import Elasticsearch
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # load tests open many connections at once; the default backlog of 5 would drop some of them
+    request_queue_size = 256
+
+
+class FakeElasticsearchServer:
+    def __init__(
+        self,
+        bulk_latency_seconds: float = 0.005,
+        search_latency_seconds: float = 0.01,
+        documents: Sequence[dict] = (),
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.bulk_latency_seconds = bulk_latency_seconds
+        self.search_latency_seconds = search_latency_seconds
+        self.documents = list(documents)
+        self.bulk_requests = 0
+        self.indexed = 0
+        self.searches = 0
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def client(self) -> Elasticsearch:
+        return Elasticsearch(self.url)
+
+    def __enter__(self) -> "FakeElasticsearchServer":
+        threading.Thread(target=self._server.serve_forever, name="fake-elasticsearch", daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes; with Nagle on, keep-alive requests stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def _respond(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = self.path.split("?")[0]
+                if path.endswith("/_bulk"):
+                    self._send(server._bulk_response(body))
+                elif path.endswith("/_msearch"):
+                    self._send(server._msearch_response(body))
+                elif path.endswith("/_search"):
+                    self._send(server._search_response(json.loads(body or b"{}")))
+                else:
+                    self._send({"acknowledged": True})
+
+            do_GET = do_PUT = do_POST = do_DELETE = _respond
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _send(self, body: dict):
+                encoded = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("X-Elastic-Product", "Elasticsearch")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _bulk_response(self, body: bytes) -> dict:
+        time.sleep(self.bulk_latency_seconds)
+        items = []
+        lines = iter(body.splitlines())
+        for line in lines:
+            if not line.strip():
+                continue
+            action = json.loads(line)
+            op_type, meta = next(iter(action.items()))
+            if op_type != "delete":
+                next(lines)  # the document source
+            items.append({op_type: {"_index": meta.get("_index"), "_id": meta.get("_id"), "status": 201, "result": "created"}})
+        with self._lock:
+            self.bulk_requests += 1
+            self.indexed += len(items)
+        return {"took": int(self.bulk_latency_seconds * 1000), "errors": False, "items": items}
+
+    def _hits(self, request: dict) -> dict:
+        fields = request.get("_source")
+        hits = [
+            {"_index": "openbeta", "_id": str(doc["route_id"]), "_score": 1 / (rank + 1),
+             # a list of fields is honoured, so vectors aren't sent back when a search leaves them out
+             "_source": {field: doc[field] for field in fields if field in doc} if isinstance(fields, list) else doc,
+             "sort": [1 / (rank + 1), doc["route_id"]]}
+            for rank, doc in enumerate(self.documents[:request.get("size", 10)])
+        ]
+        return {"total": {"value": len(self.documents), "relation": "eq"}, "max_score": 1.0 if hits else None, "hits": hits}
+
+    def _search_response(self, request: dict) -> dict:
+        time.sleep(self.search_latency_seconds)
+        with self._lock:
+            self.searches += 1
+        return {"took": int(self.search_latency_seconds * 1000), "timed_out": False, "hits": self._hits(request)}
+
+    def _msearch_response(self, body: bytes) -> dict:
+        # header and body lines alternate; the searches of one request run in parallel on a real cluster
+        requests = [json.loads(line) for line in body.splitlines()[1::2]]
+        time.sleep(self.search_latency_seconds)
+        with self._lock:
+            self.searches += len(requests)
+        took = int(self.search_latency_seconds * 1000)
+        return {"took": took, "responses": [
+            {"took": took, "timed_out": False, "hits": self._hits(request), "status": 200} for request in requests
+        ]}
@@ -0,0 +1,175 @@
+"""
+A local stand-in for the OpenAI embeddings and chat completions endpoints, so benchmarks can drive
+the real OpenAI client over HTTP with no network and a chosen latency.
+
+Embeddings are deterministic unit vectors seeded from each input. Chat completions stream like the
+API does: a request offering tools whose last message is from the user gets a search_climbs tool
+call, anything else gets an answer of `answer_words` words, each followed by usage when asked for.
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+DEFAULT_TOOL_ARGUMENTS = {"description": "crimpy boulder problems with a good landing", "style": "boulder", "size": 10}
+
+
+@dataclass
+class FakeOpenAIConfig:
+    dimensions: int = 1536
+    # per request, before anything is sent back
+    embedding_latency_seconds: float = 0.05
+    chat_first_token_seconds: float = 0.3
+    # between streamed chunks after the first
+    chat_token_seconds: float = 0.01
+    answer_words: int = 60
+    tool_arguments: dict = field(default_factory=lambda: dict(DEFAULT_TOOL_ARGUMENTS))
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # load tests open many connections at once; the default backlog of 5 would drop some of them
+    request_queue_size = 256
+
+
+def fake_embedding(value, dimensions: int) -> list[float]:
+    seed = int.from_bytes(hashlib.blake2b(json.dumps(value).encode(), digest_size=8).digest(), "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def _chunk(model: str, delta: dict, finish_reason=None) -> dict:
+    return {
+        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def chat_chunks(request: dict, config: FakeOpenAIConfig) -> list[dict]:
+    model = request.get("model", "fake")
+    messages = request.get("messages", [])
+    if request.get("tools") and messages and messages[-1]["role"] == "user":
+        arguments = json.dumps(config.tool_arguments)
+        middle = len(arguments) // 2
+        chunks = [
+            _chunk(model, {"role": "assistant", "tool_calls": [{
+                "index": 0, "id": "call_fake", "type": "function", "function": {"name": "search_climbs", "arguments": ""},
+            }]}),
+            _chunk(model, {"tool_calls": [{"index": 0, "function": {"arguments": arguments[:middle]}}]}),
+            _chunk(model, {"tool_calls": [{"index": 0, "function": {"arguments": arguments[middle:]}}]}),
+            _chunk(model, {}, "tool_calls"),
+        ]
+        completion_tokens = len(arguments) // 4
+    else:
+        words = [("" if i == 0 else " ") + f"word{i}" for i in range(config.answer_words)]
+        chunks = [_chunk(model, {"role": "assistant", "content": word}) for word in words] + [_chunk(model, {}, "stop")]
+        completion_tokens = len(words)
+    if request.get("stream_options", {}).get("include_usage"):
+        prompt_tokens = sum(len(json.dumps(message)) for message in messages) // 4
+        chunks.append({
+            "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+    return chunks
+
+
+class FakeOpenAIServer:
+    """Serves the fake endpoints under /v1 from a daemon thread; use base_url as the OpenAI client's base_url."""
+
+    def __init__(self, config: FakeOpenAIConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeOpenAIConfig()
+        self.requests = {"embeddings": 0, "chat": 0}
+        self._server = _Server((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and body go out in separate writes; with Nagle on, keep-alive requests stall on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path.endswith("/embeddings"):
+                    server.requests["embeddings"] += 1
+                    self._embeddings(request)
+                elif self.path.endswith("/chat/completions"):
+                    server.requests["chat"] += 1
+                    self._chat(request)
+                else:
+                    self.send_error(404)
+
+            def _embeddings(self, request):
+                time.sleep(server.config.embedding_latency_seconds)
+                inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+                dimensions = request.get("dimensions", server.config.dimensions)
+                self._send_json({
+                    "object": "list",
+                    "model": request.get("model"),
+                    "data": [
+                        {"object": "embedding", "index": i, "embedding": fake_embedding(value, dimensions)}
+                        for i, value in enumerate(inputs)
+                    ],
+                    "usage": {"prompt_tokens": sum(len(value) for value in inputs), "total_tokens": sum(len(value) for value in inputs)},
+                })
+
+            def _chat(self, request):
+                chunks = chat_chunks(request, server.config)
+                time.sleep(server.config.chat_first_token_seconds)
+                if not request.get("stream"):
+                    self._send_json(_completion(request, chunks))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for i, chunk in enumerate(chunks):
+                    if i > 0:
+                        time.sleep(server.config.chat_token_seconds)
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def _send_json(self, body: dict):
+                encoded = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _completion(request: dict, chunks: list[dict]) -> dict:
+    content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks if chunk["choices"])
+    return {
+        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": request.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
@@ -0,0 +1,37 @@
+"""
+A stand-in for the cl100k_base tiktoken encoding, for benchmarking without network access to
+download it. It encodes one token per character, as the tests' FakeEncoding does, so token
+budgets cut more text than they would with the real encoding and tokenization itself is nearly
+free; timings taken with it are comparable with each other but not with ones taken with tiktoken.
+"""
+import core.completion
+import core.embedding
+
+STUB_ENCODING_NAME = "stub (one token per character)"
+
+
+class StubEncoding:
+    name = STUB_ENCODING_NAME
+
+    def encode(self, text):
+        return [ord(c) for c in text]
+
+    def encode_batch(self, texts, num_threads=1):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+def use_stub_encoding_if_uncached() -> str:
+    """
+    Loads cl100k_base, or when it isn't cached and can't be downloaded, makes core.embedding and
+    core.completion use StubEncoding for the rest of the process. Returns the encoding's name.
+    """
+    try:
+        return core.embedding.get_encoding().name
+    except Exception:
+        stub = StubEncoding()
+        # core.completion imported get_encoding by name, so it is replaced there too
+        core.embedding.get_encoding = core.completion.get_encoding = lambda: stub
+        return stub.name
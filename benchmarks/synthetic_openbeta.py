@@ -0,0 +1,46 @@
+"""Generates DataFrames shaped like the curated OpenBeta pickle, for benchmarks that must run offline."""
+import numpy as np
+import pandas as pd
+
+WORDS = ("crimp", "jug", "sloper", "pinch", "crack", "arete", "dihedral", "roof", "slab", "mantle",
+         "traverse", "topout", "highball", "landing", "pocket", "flake", "undercling", "heel", "hook", "bolt")
+YDS_GRADES = [f"5.{n}" for n in range(4, 10)] + [f"5.{n}{letter}" for n in range(10, 15) for letter in "abcd"]
+VERMIN_GRADES = ["V-easy"] + [f"V{n}" for n in range(0, 17)]
+STYLES = ("trad", "sport", "boulder", "mixed")
+
+
+def make_openbeta_dataframe(num_routes: int, seed: int = 0, routes_per_sector: int = 20) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    num_sectors = max(num_routes // routes_per_sector, 1)
+    sector_ids = rng.integers(0, num_sectors, num_routes)
+    sector_lon = rng.uniform(-124, -70, num_sectors)
+    sector_lat = rng.uniform(25, 49, num_sectors)
+    styles = rng.choice(STYLES, num_routes, p=[0.35, 0.35, 0.25, 0.05])
+    is_boulder = styles == "boulder"
+
+    rows = []
+    for i in range(num_routes):
+        sector = int(sector_ids[i])
+        num_paragraphs = int(rng.integers(0, 4))
+        num_ratings = int(rng.integers(0, 8))
+        parent_loc = [float(sector_lon[sector]), float(sector_lat[sector])]
+        if rng.random() < 0.01:
+            parent_loc = [float("nan"), parent_loc[1]]
+        rows.append({
+            "route_name": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}",
+            "parent_sector": f"Sector {sector}",
+            "route_ID": 100000000 + i,
+            "sector_ID": str(200000000 + sector),
+            "type_string": styles[i],
+            "fa": "unknown",
+            "YDS": None if is_boulder[i] else rng.choice(YDS_GRADES),
+            "Vermin": rng.choice(VERMIN_GRADES) if is_boulder[i] else None,
+            "parent_loc": parent_loc,
+            "description": [
+                " ".join(rng.choice(WORDS, int(rng.integers(5, 80)))) for _ in range(num_paragraphs)
+            ] or None,
+            "location": "",
+            "protection": [],
+            "corrected_users_ratings": [(f"user{j}", float(rng.integers(0, 5))) for j in range(num_ratings)],
+        })
+    return pd.DataFrame(rows)
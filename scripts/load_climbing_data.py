@@ -1,4 +1,4 @@
-from constants import ELASTICSEARCH_INDEX_NAME
+from constants import ELASTICSEARCH_INDEX_NAME, INDEX_GENERATION_META_KEY, SECTORS_INDEX_NAME, ClimbStyle
 import pandas as pd
 import requests
 from elasticsearch import Elasticsearch, helpers
@@ -9,147 +9,616 @@ from dotenv import load_dotenv
 from pathlib import Path
 from openai import OpenAI
 import time
-from core.embedding import add_embeddings
+import argparse
+import copy
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+from core import tracing
+from core.embedding import EMBEDDING_DIMENSIONS, embed_documents_stream, embedding_dimensions
+from core.load_manifest import LoadManifest, content_hash, mappings_hash
+from core.pipeline import Pipeline
+from core.columnar_cache import ColumnarCache
+from core.grades import parse_grade
+from core.route_names import RouteNameIndex, route_name_index_path
+from core.sectors import build_sector_documents
 
+logger = logging.getLogger(__name__)
 
-def download_and_load_data():
+# The only source columns iter_documents reads
+SOURCE_COLUMNS = [
+    "route_name", "parent_sector", "route_ID", "sector_ID", "type_string", "YDS", "Vermin",
+    "parent_loc", "description", "corrected_users_ratings",
+]
+
+
+# What build_sector_documents and RouteNameIndex.from_documents read from each route document
+ROUTE_SUMMARY_FIELDS = ("route_name", "route_id", "sector_id", "sector_name", "style", "grade", "rating", "location")
+
+
+def join_descriptions(descriptions: pd.Series) -> pd.Series:
+    """Joins each row's description paragraphs; rows that are already strings are left as they are."""
+    if pd.api.types.is_string_dtype(descriptions):
+        return descriptions.fillna("")
+    return descriptions.str.join("\n").fillna("")
+
+
+def _rating_values(ratings: pd.Series) -> pd.Series:
+    # the user ids in the (user, rating) pairs are never used, so the columnar cache only keeps the ratings
+    return ratings.map(
+        lambda r: [rating for _, rating in r] if isinstance(r, (list, np.ndarray)) else None
+    )
+
+
+# Paragraph lists are stored pre-joined: one string per row is far smaller in memory than a list of them
+COLUMNAR_CONVERTERS = {
+    "description": join_descriptions,
+    "corrected_users_ratings": _rating_values,
+}
+
+
+def download_and_load_data(columns=SOURCE_COLUMNS, lazy=False):
+    """
+    Returns the OpenBeta dataset's `columns`. The first run after downloading converts the pickle
+    to a Parquet cache, and later runs read only the requested columns from it (one at a time on
+    first access if lazy=True).
+    """
     data_dir = Path(os.getenv("DATA_DIR", "data"))
     data_dir.mkdir(exist_ok=True)
     
     data_file = data_dir / "climbing_data.pkl.zip"
     
     if not data_file.exists():
-        print("Downloading data file...")
+        logger.info("Downloading data file...")
         url = "https://github.com/OpenBeta/climbing-data/raw/main/curated_datasets/CuratedWithRatings_OpenBetaAug2020_RytherAnderson.pkl.zip"
-        response = requests.get(url)
+        with tracing.span("etl.download"):
+            response = requests.get(url)
         
         data_file.write_bytes(response.content)
-        print("Data file downloaded and saved locally.")
+        logger.info("Data file downloaded and saved locally.")
     else:
-        print("Using cached data file.")
-    
-    with ZipFile(data_file) as zip_file:
-        pkl_filename = zip_file.namelist()[0]
-        with zip_file.open(pkl_filename) as pkl_file:
-            df = pd.read_pickle(pkl_file)
-    return df
-
-def extract_coordinates(location):
-    try:
-        if pd.isna(location).any():  
-            print("Location contains NaN values:", location)
-            return None
-        if not hasattr(location, '__len__') or len(location) != 2:
-            print("Expected location to be a sequence of length 2, got", location)
-            return None
-        lon, lat = float(location[0]), float(location[1])  
-        if not (np.isfinite(lon) and np.isfinite(lat)):
-            print("Expected coordinates to be finite numbers, got", lon, lat)
-            return None
-        return {"lat": lat, "lon": lon}
-    except Exception as e:
-        print("Exception extracting coordinates:", e)
-        return None
+        logger.info("Using cached data file.")
 
-def transform_data(df):
-    openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    columnar_cache = ColumnarCache(data_file, data_dir / "climbing_data.parquet")
+    if not columnar_cache.is_valid(columns):
+        logger.info("Converting data file to Parquet...")
+        with tracing.span("etl.convert"):
+            with ZipFile(data_file) as zip_file:
+                pkl_filename = zip_file.namelist()[0]
+                with zip_file.open(pkl_filename) as pkl_file:
+                    df = pd.read_pickle(pkl_file)
+            columnar_cache.write(df, SOURCE_COLUMNS, converters=COLUMNAR_CONVERTERS)
+            del df
 
-    documents = []
-    total_routes = len(df)
-    start_time = time.time()
-    _last_progress_time = start_time
-    
-    print(f"Starting to transform {total_routes} routes...")
-    
-    for _, row in df.iterrows():
-        description = "\n".join(row["description"] or [])
-        doc = {
-            "route_name": row["route_name"],
-            "route_id": row["route_ID"],
-            "sector_id": row["sector_ID"],
-            "grade": row["YDS"] if pd.notna(row["YDS"]) else row["Vermin"],
-            "sector_name": row["parent_sector"],
-            "location": extract_coordinates(row["parent_loc"]),
-            "style": row["type_string"],  # trad, sport, mixed, or boulder
+    if lazy:
+        return columnar_cache.read_lazy(columns)
+    with tracing.span("etl.read", columns=len(columns)):
+        return columnar_cache.read(columns)
+
+def extract_coordinates(locations: pd.Series) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Returns (lat, lon, valid) arrays for a column of [lon, lat] pairs."""
+    is_sequence = locations.map(lambda location: isinstance(location, (list, np.ndarray))).to_numpy(dtype=bool)
+    sequences = locations.where(is_sequence, None)
+    lon = pd.to_numeric(sequences.str[0], errors="coerce").to_numpy(dtype=float)
+    lat = pd.to_numeric(sequences.str[1], errors="coerce").to_numpy(dtype=float)
+    valid = is_sequence & (sequences.str.len() == 2).to_numpy(dtype=bool) & np.isfinite(lon) & np.isfinite(lat)
+    if not valid.all():
+        logger.info(f"Found {(~valid).sum()} routes without valid coordinates")
+    return lat, lon, valid
+
+
+def mean_ratings(ratings: pd.Series) -> np.ndarray:
+    """
+    Mean rating of each row, NaN for rows without ratings. Rows hold (user, rating) pairs in the
+    source pickle and bare ratings in the columnar cache.
+    """
+    has_ratings = ratings.map(lambda r: isinstance(r, (list, np.ndarray)) and len(r) > 0).to_numpy(dtype=bool)
+    positions = np.flatnonzero(has_ratings)
+    rated = ratings.iloc[positions].reset_index(drop=True)
+    counts = rated.map(len).to_numpy(dtype=int)
+    exploded = rated.explode()
+    if len(exploded) > 0 and isinstance(exploded.iloc[0], (tuple, list, np.ndarray)):
+        exploded = exploded.str[1]
+    values = pd.to_numeric(exploded, errors="coerce").to_numpy(dtype=float)
+    sums = np.bincount(np.repeat(np.arange(len(rated)), counts), weights=values, minlength=len(rated))
+    means = np.full(len(ratings), np.nan)
+    means[positions] = sums / np.maximum(counts, 1)
+    return means
+
+
+def iter_documents(df: pd.DataFrame):
+    """Lazily yields one document per valid route, computing every field as a whole-column operation."""
+    yds = df["YDS"].to_numpy(dtype=object)
+    grades = np.where(pd.notna(yds), yds, df["Vermin"].to_numpy(dtype=object))
+    descriptions = join_descriptions(df["description"])
+    lat, lon, has_location = extract_coordinates(df["parent_loc"])
+    ratings = mean_ratings(df["corrected_users_ratings"])
+    has_rating = ~np.isnan(ratings)
+
+    # few distinct grades repeat across every route, and parse_grade caches each one
+    parsed_grades = [parse_grade(grade) for grade in grades.tolist()]
+
+    route_names = df["route_name"].to_numpy(dtype=object)
+    route_ids = df["route_ID"].to_numpy(dtype=object)
+    # Only include documents with valid data
+    keep = (
+        pd.Series(route_names).astype(bool).to_numpy()
+        & pd.Series(grades).astype(bool).to_numpy()
+        & pd.Series(route_ids).astype(bool).to_numpy()
+    )
+
+    columns = zip(
+        route_names.tolist(),
+        route_ids.tolist(),
+        df["sector_ID"].tolist(),
+        grades.tolist(),
+        parsed_grades,
+        df["parent_sector"].tolist(),
+        lat.tolist(),
+        lon.tolist(),
+        has_location.tolist(),
+        df["type_string"].tolist(),  # trad, sport, mixed, or boulder
+        descriptions.tolist(),
+        ratings.tolist(),
+        has_rating.tolist(),
+        keep.tolist(),
+    )
+    for (route_name, route_id, sector_id, grade, parsed_grade, sector_name, doc_lat, doc_lon, doc_has_location,
+         style, description, rating, doc_has_rating, doc_keep) in columns:
+        if not doc_keep:
+            continue
+        yield {
+            "route_name": route_name,
+            "route_id": route_id,
+            "sector_id": sector_id,
+            "grade": grade,
+            "grade_system": parsed_grade.system if parsed_grade else None,
+            "grade_numeric": parsed_grade.numeric if parsed_grade else None,
+            "sector_name": sector_name,
+            "location": {"lat": doc_lat, "lon": doc_lon} if doc_has_location else None,
+            "style": style,
             "description": description,
             "description_vector": None,
-            "rating": float(np.mean([rating[1] for rating in row["corrected_users_ratings"]])) if isinstance(row["corrected_users_ratings"], (list, np.ndarray)) and len(row["corrected_users_ratings"]) > 0 else None
+            "rating": rating if doc_has_rating else None,
         }
-        # Only include document if it has valid data
-        if doc["route_name"] and doc["grade"] and doc["route_id"]:
-            documents.append(doc)
-    
-    print("Adding embeddings for all routes...")
-    add_embeddings({document['route_id']: document for document in documents}, openai_client)
 
-    total_time = time.time() - start_time
-    print(f"\nProcessing completed in {total_time/60:.1f} minutes")
-    print(f"Average processing time per route: {total_time/len(documents):.2f} seconds")
-    
+
+def tap_route_summaries(documents, summaries: list):
+    """
+    Passes documents through unchanged, appending each one's ROUTE_SUMMARY_FIELDS to summaries, so
+    the sectors index and route name index are built from the pass that loads the routes instead
+    of transforming every route again.
+    """
+    for doc in documents:
+        summaries.append({field: doc[field] for field in ROUTE_SUMMARY_FIELDS})
+        yield doc
+
+
+def hash_documents(documents):
+    for doc in documents:
+        doc["content_hash"] = content_hash(doc)
+        yield doc
+
+
+def transform_data(df):
+    start_time = time.time()
+    logger.info(f"Starting to transform {len(df)} routes...")
+    with tracing.span("etl.transform", routes=len(df)):
+        documents = list(hash_documents(iter_documents(df)))
+    logger.info(f"Transformed {len(documents)} routes in {time.time() - start_time:.1f}s")
     return documents
 
-def load_to_elasticsearch(documents):
+INDEX_MAPPINGS = {
+    "properties": {
+        "route_name": {"type": "text"},
+        "sector_name": {"type": "text"},
+        "description": {"type": "text"},
+        "location": {"type": "geo_point"},
+        "rating": {"type": "float"},
+        "style": {"type": "keyword"},
+        "grade": {"type": "keyword"},
+        "grade_system": {"type": "keyword"},
+        "grade_numeric": {"type": "float"},
+        "route_id": {"type": "keyword"},
+        "sector_id": {"type": "keyword"},
+        "content_hash": {"type": "keyword", "index": False},
+        "description_vector": {
+            "type": "dense_vector",
+            "dims": EMBEDDING_DIMENSIONS,
+            "index": True,
+            "similarity": "cosine"
+        },
+    }
+}
+
+# HNSW over float32 vectors, or over vectors quantized to int8 (4x less memory), int4 (8x) or one
+# bit per dimension with bbq (32x). Quantized kNN rescoring still uses the float vectors in _source.
+VECTOR_INDEX_TYPES = ("hnsw", "int8_hnsw", "int4_hnsw", "bbq_hnsw")
+BBQ_MIN_DIMENSIONS = 64
+
+
+def index_mappings(dimensions: Optional[int] = None, vector_index_type: Optional[str] = None) -> dict:
+    """
+    INDEX_MAPPINGS with description vectors of `dimensions` components (None for the embedding
+    model's full size) indexed as vector_index_type, one of VECTOR_INDEX_TYPES. None leaves the
+    index type to Elasticsearch's default for the cluster version.
+    """
+    mappings = copy.deepcopy(INDEX_MAPPINGS)
+    vector = mappings["properties"]["description_vector"]
+    vector["dims"] = dimensions or EMBEDDING_DIMENSIONS
+    if vector_index_type is not None:
+        if vector_index_type not in VECTOR_INDEX_TYPES:
+            raise ValueError(f"Unknown vector index type {vector_index_type}, expected one of {VECTOR_INDEX_TYPES}")
+        if vector_index_type == "bbq_hnsw" and vector["dims"] < BBQ_MIN_DIMENSIONS:
+            raise ValueError(f"bbq_hnsw needs at least {BBQ_MIN_DIMENSIONS} dimensions, got {vector['dims']}")
+        if vector_index_type == "int4_hnsw" and vector["dims"] % 2:
+            raise ValueError(f"int4_hnsw needs an even number of dimensions, got {vector['dims']}")
+        vector["index_options"] = {"type": vector_index_type}
+    return mappings
+
+
+SECTOR_INDEX_MAPPINGS = {
+    "properties": {
+        "sector_id": {"type": "keyword"},
+        "sector_name": {"type": "text"},
+        "location": {"type": "geo_point"},
+        "route_count": {"type": "integer"},
+        "rating": {"type": "float"},
+        "style_counts": {"properties": {style.value: {"type": "integer"} for style in ClimbStyle}},
+        # one entry per style and grade, so a nested query can count a sector's routes in a grade range
+        "grade_buckets": {
+            "type": "nested",
+            "properties": {
+                "style": {"type": "keyword"},
+                "grade": {"type": "keyword"},
+                "grade_system": {"type": "keyword"},
+                "grade_numeric": {"type": "float"},
+                "count": {"type": "integer"},
+            },
+        },
+    }
+}
+
+# Bulk load settings: no refreshes or replicas while loading, restored before the alias swap
+LOADING_INDEX_SETTINGS = {"number_of_replicas": 0, "refresh_interval": "-1"}
+BULK_CHUNK_SIZE = 500
+BULK_THREAD_COUNT = 4
+BULK_MAX_RETRIES = 3
+INDEX_VERSIONS_TO_KEEP = 2
+PIPELINE_QUEUE_SIZE = 1000
+CHECKPOINT_BATCH_SIZE = 500
+
+
+def get_elasticsearch_client() -> Elasticsearch:
     load_dotenv()
-    
+
     es_url = os.getenv('ELASTICSEARCH_NODE_URL')
     es_api_key = os.getenv('ELASTICSEARCH_API_KEY')
-    index_name = ELASTICSEARCH_INDEX_NAME
-    
+
     if es_api_key:
-        es = Elasticsearch(
+        return Elasticsearch(
             es_url,
             api_key=es_api_key
         )
     else:
         raise Exception('Missing required env var: ELASTICSEARCH_API_KEY')
-    
-    mappings = {
-        "properties": {
-            "route_name": {"type": "text"},
-            "sector_name": {"type": "text"},
-            "description": {"type": "text"},
-            "location": {"type": "geo_point"},
-            "rating": {"type": "float"},
-            "style": {"type": "keyword"},
-            "grade": {"type": "keyword"},
-            "route_id": {"type": "keyword"},
-            "sector_id": {"type": "keyword"},
-            "description_vector": {
-                "type": "dense_vector",
-                "dims": 1536,
-                "index": True,
-                "similarity": "cosine"
-            },
-        }
-    }
-    
-    if es.indices.exists(index=index_name):
-        es.indices.delete(index=index_name)
-    
-    es.indices.create(index=index_name, mappings=mappings)
-    
-    actions = [
-        {
-            "_index": index_name,
-            "_source": doc
-        }
-        for doc in documents
-    ]
-    
-    helpers.bulk(es, actions)
+
+
+def versioned_index_name(alias: str) -> str:
+    return f"{alias}-{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+
+
+def iter_bulk_index(es, index_name, documents, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT,
+                    id_field="route_id"):
+    """Streams documents into index_name with parallel_bulk, yielding (ok, document) as each is acknowledged."""
+    in_flight = deque()
+
+    def actions():
+        for doc in documents:
+            in_flight.append(doc)
+            yield {"_index": index_name, "_id": doc[id_field], "_source": doc}
+
+    # parallel_bulk yields results in the same order the actions were consumed,
+    # so each result lines up with the oldest in-flight document
+    for ok, info in helpers.parallel_bulk(
+        es,
+        actions(),
+        chunk_size=chunk_size,
+        thread_count=thread_count,
+        raise_on_error=False,
+        raise_on_exception=False,
+    ):
+        yield ok, in_flight.popleft()
+
+
+def bulk_index(es, index_name, documents, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT,
+               id_field="route_id") -> list[dict]:
+    """Streams documents into index_name, returning the documents that failed."""
+    failed = []
+    indexed = 0
+    start_time = time.time()
+    with tracing.span("etl.bulk_index", index=index_name) as span:
+        for ok, doc in iter_bulk_index(es, index_name, documents, chunk_size, thread_count, id_field):
+            if ok:
+                indexed += 1
+            else:
+                failed.append(doc)
+        span.set(indexed_count=indexed, failed_count=len(failed))
+    duration = max(time.time() - start_time, 1e-9)
+    logger.info(f"Indexed {indexed} documents into {index_name} in {duration:.1f}s "
+                f"({indexed / duration:.0f} docs/s), {len(failed)} failed")
+    return failed
+
+
+def bulk_index_with_retries(es, index_name, documents, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT,
+                            max_retries=BULK_MAX_RETRIES, id_field="route_id"):
+    failed = bulk_index(es, index_name, documents, chunk_size, thread_count, id_field)
+    for attempt in range(max_retries):
+        if not failed:
+            return
+        backoff = 2 ** attempt
+        logger.warning(f"Retrying {len(failed)} failed documents in {backoff}s")
+        time.sleep(backoff)
+        failed = bulk_index(es, index_name, failed, chunk_size, thread_count, id_field)
+    if failed:
+        raise Exception(f"Failed to index {len(failed)} documents into {index_name}")
+
+
+def delete_documents(es, index_name, route_ids):
+    actions = ({"_op_type": "delete", "_index": index_name, "_id": route_id} for route_id in route_ids)
+    deleted, errors = helpers.bulk(es, actions, raise_on_error=False, ignore_status=404)
+    logger.info(f"Deleted {deleted} documents from {index_name}")
+    if errors:
+        raise Exception(f"Failed to delete {len(errors)} documents from {index_name}")
+
+
+def swap_alias(es, alias, index_name):
+    actions = []
+    if es.indices.exists_alias(name=alias):
+        for old_index in es.indices.get_alias(name=alias):
+            actions.append({"remove": {"index": old_index, "alias": alias}})
+    elif es.indices.exists(index=alias):
+        # a concrete index from before versioned loads is in the way of the alias; drop it in the same atomic update
+        actions.append({"remove_index": {"index": alias}})
+    actions.append({"add": {"index": index_name, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+
+
+def delete_old_index_versions(es, alias, keep=INDEX_VERSIONS_TO_KEEP):
+    live_indices = set(es.indices.get_alias(name=alias)) if es.indices.exists_alias(name=alias) else set()
+    versions = sorted(es.indices.get(index=f"{alias}-*"), reverse=True)
+    for index_name in versions[keep:]:
+        if index_name not in live_indices:
+            logger.info(f"Deleting old index version {index_name}")
+            es.indices.delete(index=index_name)
+
+
+def create_loading_index(es, alias=ELASTICSEARCH_INDEX_NAME, mappings=INDEX_MAPPINGS) -> str:
+    index_name = versioned_index_name(alias)
+    logger.info(f"Creating index {index_name}")
+    es.indices.create(index=index_name, mappings=mappings, settings=LOADING_INDEX_SETTINGS)
+    return index_name
+
+
+def finalize_index(es, index_name, alias=ELASTICSEARCH_INDEX_NAME):
+    """Restores normal index settings, then atomically points the alias (ELASTICSEARCH_INDEX_NAME by default) at the index."""
+    with tracing.span("etl.finalize", index=index_name):
+        es.indices.put_settings(index=index_name, settings={
+            "number_of_replicas": int(os.getenv("ELASTICSEARCH_NUMBER_OF_REPLICAS", 1)),
+            "refresh_interval": None,  # back to the default
+        })
+        es.indices.refresh(index=index_name)
+
+    logger.info(f"Pointing alias {alias} at {index_name}")
+    swap_alias(es, alias, index_name)
+    delete_old_index_versions(es, alias)
+
+
+def load_to_elasticsearch(documents, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT, es=None,
+                          mappings=INDEX_MAPPINGS) -> str:
+    """
+    Builds a new versioned index from the documents iterable, then atomically points the
+    ELASTICSEARCH_INDEX_NAME alias at it, so searches keep working for the whole reload.
+    Pass index_mappings(...) as mappings for smaller or quantized description vectors.
+    Returns the name of the new index.
+    """
+    es = es or get_elasticsearch_client()
+    index_name = create_loading_index(es, mappings=mappings)
+    bulk_index_with_retries(es, index_name, documents, chunk_size, thread_count)
+    finalize_index(es, index_name)
+    return index_name
+
+
+def load_sectors(es, documents, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT) -> str:
+    """
+    Rebuilds the SECTORS_INDEX_NAME index from route documents (or their ROUTE_SUMMARY_FIELDS), one
+    summary document per sector.
+    It is small enough to rebuild on every run, and goes through a versioned index and alias swap
+    like the routes index.
+    """
+    start_time = time.time()
+    with tracing.span("etl.summarize_sectors"):
+        sectors = build_sector_documents(documents)
+    logger.info(f"Summarized {len(sectors)} sectors in {time.time() - start_time:.1f}s")
+    index_name = create_loading_index(es, SECTORS_INDEX_NAME, SECTOR_INDEX_MAPPINGS)
+    bulk_index_with_retries(es, index_name, sectors, chunk_size, thread_count, id_field="sector_id")
+    finalize_index(es, index_name, SECTORS_INDEX_NAME)
+    return index_name
+
+
+def save_route_name_index(documents, path: Path) -> RouteNameIndex:
+    """
+    Builds the in-memory route name index the app resolves lookup_route with from route documents
+    (or their ROUTE_SUMMARY_FIELDS) and saves it to path.
+    Like the sectors index it is rebuilt from every route on each run, incremental or not.
+    """
+    start_time = time.time()
+    with tracing.span("etl.index_route_names"):
+        route_name_index = RouteNameIndex.from_documents(documents)
+        route_name_index.save(path)
+    logger.info(f"Indexed {len(route_name_index)} route names in {time.time() - start_time:.1f}s")
+    return route_name_index
+
+
+def index_stage(es, index_name, chunk_size=BULK_CHUNK_SIZE, thread_count=BULK_THREAD_COUNT):
+    def index(documents):
+        failed = []
+        for ok, doc in iter_bulk_index(es, index_name, documents, chunk_size, thread_count):
+            if ok:
+                yield doc
+            else:
+                failed.append(doc)
+        if failed:
+            bulk_index_with_retries(es, index_name, failed, chunk_size, thread_count)
+            yield from failed
+    return index
+
+
+def checkpoint_stage(manifest: LoadManifest):
+    def checkpoint(documents):
+        pending = []
+        for doc in documents:
+            pending.append(doc)
+            if len(pending) >= CHECKPOINT_BATCH_SIZE:
+                manifest.record(pending)
+                pending = []
+            yield doc["route_id"]
+        manifest.record(pending)
+    return checkpoint
+
+
+def run_load_pipeline(es, manifest: LoadManifest, documents, chunk_size=BULK_CHUNK_SIZE,
+                      thread_count=BULK_THREAD_COUNT, dimensions=None) -> int:
+    """
+    Streams new or changed documents through transform -> embed -> index -> checkpoint into
+    manifest.index_name. Every indexed route is journaled to the manifest, so rerunning after a
+    crash picks up where this left off. Descriptions are embedded with `dimensions` components.
+    Returns how many routes were indexed or deleted.
+    """
+    openai_client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    pipeline = Pipeline(documents, queue_size=PIPELINE_QUEUE_SIZE)
+    pipeline.add_stage("transform", lambda docs: manifest.changed_documents(hash_documents(docs)))
+    pipeline.add_stage("embed", lambda docs: embed_documents_stream(docs, openai_client, dimensions=dimensions))
+    pipeline.add_stage("index", index_stage(es, manifest.index_name, chunk_size, thread_count))
+    pipeline.add_stage("checkpoint", checkpoint_stage(manifest))
+    indexed = pipeline.run()[-1].items
+
+    removed = manifest.removed_route_ids()
+    if removed:
+        delete_documents(es, manifest.index_name, removed)
+        manifest.forget(removed)
+    return indexed + len(removed)
+
+
+def bump_index_generation(es, index_name) -> int:
+    """
+    Counts another incremental load in the index's _meta. The alias doesn't move for these, so
+    this is what tells the app (see ElasticClient.index_version) that cached results are stale.
+    """
+    meta = es.indices.get_mapping(index=index_name)[index_name]["mappings"].get("_meta", {})
+    generation = meta.get(INDEX_GENERATION_META_KEY, 0) + 1
+    es.indices.put_mapping(index=index_name, meta={**meta, INDEX_GENERATION_META_KEY: generation})
+    return generation
+
+
+def update_elasticsearch(es, manifest: LoadManifest, documents, chunk_size=BULK_CHUNK_SIZE,
+                         thread_count=BULK_THREAD_COUNT, dimensions=None):
+    """Embeds and upserts only new or changed routes into the live index, and deletes removed ones."""
+    logger.info(f"Updating {manifest.index_name} incrementally...")
+    changed = run_load_pipeline(es, manifest, documents, chunk_size, thread_count, dimensions)
+    es.indices.refresh(index=manifest.index_name)
+    if changed:
+        generation = bump_index_generation(es, manifest.index_name)
+        logger.info(f"Updated {changed} routes, {manifest.index_name} is now at generation {generation}")
+    manifest.save()
+
+
+def rebuild_elasticsearch(es, documents, manifest_path: Path, checkpoint_path: Path, chunk_size=BULK_CHUNK_SIZE,
+                          thread_count=BULK_THREAD_COUNT, mappings=INDEX_MAPPINGS, dimensions=None):
+    """Loads every route into a new versioned index, resuming an interrupted rebuild if there is one."""
+    checkpoint = LoadManifest.load(checkpoint_path)
+    if (checkpoint is not None and checkpoint.mappings_hash == mappings_hash(mappings)
+            and es.indices.exists(index=checkpoint.index_name)):
+        logger.info(f"Resuming interrupted load into {checkpoint.index_name}, "
+                    f"{len(checkpoint.routes)} routes were already indexed")
+    else:
+        if checkpoint is not None:
+            checkpoint.delete()
+        checkpoint = LoadManifest(checkpoint_path, create_loading_index(es, mappings=mappings), mappings_hash(mappings))
+        checkpoint.save()
+
+    run_load_pipeline(es, checkpoint, documents, chunk_size, thread_count, dimensions)
+    finalize_index(es, checkpoint.index_name)
+
+    # the finished checkpoint becomes the manifest that later incremental loads diff against
+    LoadManifest(manifest_path, checkpoint.index_name, checkpoint.mappings_hash, checkpoint.routes).save()
+    checkpoint.delete()
+
+
+def _get_manifest_path() -> Path:
+    return Path(os.getenv("DATA_DIR", "data")) / "load_manifest.json"
+
+
+def _get_checkpoint_path() -> Path:
+    return Path(os.getenv("DATA_DIR", "data")) / "load_checkpoint.json"
+
+
+def _can_update_incrementally(es, manifest, mappings=INDEX_MAPPINGS) -> bool:
+    if _get_checkpoint_path().exists():
+        logger.info("Found an interrupted full load, resuming it")
+        return False
+    if manifest is None:
+        logger.info("No manifest from a previous load found, doing a full load")
+        return False
+    if manifest.mappings_hash != mappings_hash(mappings):
+        logger.info("Index mappings changed since the last load, doing a full load")
+        return False
+    alias = ELASTICSEARCH_INDEX_NAME
+    if not es.indices.exists_alias(name=alias) or manifest.index_name not in es.indices.get_alias(name=alias):
+        logger.info(f"{manifest.index_name} from the last load is no longer behind the {alias} alias, doing a full load")
+        return False
+    return True
+
 
 def main():
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", datefmt="%H:%M:%S")
+    tracing.configure_from_env()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-size", type=int, default=BULK_CHUNK_SIZE, help="documents per bulk request")
+    parser.add_argument("--workers", type=int, default=BULK_THREAD_COUNT, help="concurrent bulk requests")
+    parser.add_argument("--full", action="store_true", help="rebuild the whole index instead of only loading changes")
+    parser.add_argument("--dimensions", type=int, default=embedding_dimensions(),
+                        help=f"description vector size, at most {EMBEDDING_DIMENSIONS} (default: EMBEDDING_DIMENSIONS)")
+    parser.add_argument("--vector-index-type", choices=VECTOR_INDEX_TYPES,
+                        default=os.getenv("ELASTICSEARCH_VECTOR_INDEX_TYPE") or None,
+                        help="kNN index type (default: ELASTICSEARCH_VECTOR_INDEX_TYPE, else Elasticsearch's default)")
+    args = parser.parse_args()
+    dimensions = None if args.dimensions == EMBEDDING_DIMENSIONS else args.dimensions
+    # a change of vector size or index type changes the mappings hash, which forces a full load
+    mappings = index_mappings(dimensions, args.vector_index_type)
 
-    print("Downloading and loading data...")
+    logger.info("Downloading and loading data...")
     df = download_and_load_data()
-    
-    print("Transforming data...")
-    documents = transform_data(df)
-    
-    print("Loading data to Elasticsearch...")
-    load_to_elasticsearch(documents)
-    print("Done!")
+    # every route passes through here once, on its way to the pipeline; the summaries are complete once it has run
+    route_summaries = []
+    documents = tap_route_summaries(iter_documents(df), route_summaries)
+
+    es = get_elasticsearch_client()
+    manifest = LoadManifest.load(_get_manifest_path())
+    if not args.full and _can_update_incrementally(es, manifest, mappings):
+        update_elasticsearch(es, manifest, documents, chunk_size=args.chunk_size, thread_count=args.workers,
+                             dimensions=dimensions)
+    else:
+        rebuild_elasticsearch(es, documents, _get_manifest_path(), _get_checkpoint_path(),
+                              chunk_size=args.chunk_size, thread_count=args.workers, mappings=mappings,
+                              dimensions=dimensions)
+    load_sectors(es, route_summaries, chunk_size=args.chunk_size, thread_count=args.workers)
+    # only once the routes are live, so an interrupted load never leaves a file describing routes
+    # the index doesn't have; the app picks it up after it sees the index change
+    save_route_name_index(route_summaries, route_name_index_path())
+    logger.info("Done!")
 
 if __name__ == "__main__":
     main()
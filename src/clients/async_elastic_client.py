@@ -0,0 +1,149 @@
+from clients.climbing_data_client import DEFAULT_LOOKUP_SIZE, DEFAULT_SIZE, AsyncClimbingDataClient, Location
+from clients.elastic_client import (
+    DEFAULT_NUM_CANDIDATES,
+    ELASTICSEARCH_CONNECTIONS_PER_NODE,
+    ELASTICSEARCH_REQUEST_TIMEOUT_SECONDS,
+    ElasticQueryPlanner,
+    index_version_from_mappings,
+)
+from constants import ELASTICSEARCH_INDEX_NAME, SECTORS_INDEX_NAME, ClimbStyle
+from core import tracing
+from core.route_names import RouteNameIndex
+from elasticsearch import AsyncElasticsearch, NotFoundError
+from pathlib import Path
+from typing import Awaitable, Callable, Optional, Sequence
+import asyncio
+
+
+class AsyncElasticClient(ElasticQueryPlanner, AsyncClimbingDataClient):
+    """
+    ElasticClient on AsyncElasticsearch: the same queries, planned by ElasticQueryPlanner, sent
+    without holding a thread while Elasticsearch answers. embed_query is a coroutine function such
+    as core.embedding.AsyncQueryEmbedder.
+
+    Connections go through elastic-transport's httpx node, on the httpx declared in the Pipfile.
+    """
+
+    def __init__(
+        self,
+        elastic_url,
+        elastic_api_key,
+        embed_query: Optional[Callable[[str], Awaitable[Sequence[float]]]] = None,
+        num_candidates: int = DEFAULT_NUM_CANDIDATES,
+        connections_per_node: int = ELASTICSEARCH_CONNECTIONS_PER_NODE,
+        request_timeout: float = ELASTICSEARCH_REQUEST_TIMEOUT_SECONDS,
+        route_name_index: Optional[RouteNameIndex] = None,
+        route_name_index_path: Optional[Path] = None,
+    ):
+        self.es = AsyncElasticsearch(
+            elastic_url,
+            api_key=elastic_api_key,
+            node_class="httpxasync",
+            connections_per_node=connections_per_node,
+            request_timeout=request_timeout,
+            retry_on_timeout=True,
+        )
+        self.embed_query = embed_query
+        self.num_candidates = num_candidates
+        self.route_name_index_path = route_name_index_path
+        self.route_name_index = route_name_index if route_name_index is not None else self._load_route_name_index()
+        self._index_exists = False
+
+    async def search_climbs(
+        self,
+        route_name: Optional[str] = None,
+        sector_name: Optional[str] = None,
+        description: Optional[str] = None,
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        style: Optional[ClimbStyle] = None,
+        rating_min: Optional[float] = None,
+        grades: Optional[list[str]] = None,
+        grade_min: Optional[str] = None,
+        grade_max: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+        search_after: Optional[list] = None,
+        compact: bool = False,
+    ):
+        await self._check_index_exists()
+        bodies, finish = await self._plan_search_async(
+            route_name=route_name, sector_name=sector_name, description=description, location=location,
+            location_radius_miles=location_radius_miles, style=style, rating_min=rating_min, grades=grades,
+            grade_min=grade_min, grade_max=grade_max, size=size, search_after=search_after, compact=compact,
+        )
+        if len(bodies) == 1:
+            # the client's `source` argument is `_source` in the raw request body
+            search_kwargs = {"source" if key == "_source" else key: value for key, value in bodies[0].items()}
+            return finish([await self._search(ELASTICSEARCH_INDEX_NAME, **search_kwargs)])
+        return finish(await self._msearch(bodies))
+
+    async def search_sectors(
+        self,
+        climbers: list[dict],
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        sector_name: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+    ) -> dict:
+        search_kwargs, finish = self._plan_sector_search(climbers, location, location_radius_miles, sector_name, size)
+        return finish(await self._search(SECTORS_INDEX_NAME, **search_kwargs))
+
+    async def lookup_route(
+        self,
+        route_name: str,
+        location: Optional[Location] = None,
+        size: int = DEFAULT_LOOKUP_SIZE,
+    ) -> dict:
+        if self._claim_route_name_index_reload():
+            # reading the file takes long enough to stall other turns, so it is done off the loop
+            await asyncio.to_thread(self._reload_route_name_index)
+        if self.route_name_index is None:
+            return await super().lookup_route(route_name, location, size)
+        # microseconds in memory, so not worth a thread
+        return self.route_name_index.lookup(route_name, location, size)
+
+    async def index_version(self) -> Optional[str]:
+        try:
+            return index_version_from_mappings(await self.es.indices.get_mapping(index=ELASTICSEARCH_INDEX_NAME))
+        except NotFoundError:
+            return None
+
+    async def index_changed(self, version: Optional[str]):
+        self._route_name_index_stale = self.route_name_index_path is not None
+
+    async def warm_up(self):
+        """Opens a pooled connection (TLS handshake included) and checks the index, ahead of the first search."""
+        await self._check_index_exists()
+
+    async def close(self):
+        await self.es.close()
+
+    async def _plan_search_async(self, **query):
+        query_vector = None
+        if query.get("description") is not None and self.embed_query is not None:
+            query_vector = await self.embed_query(query["description"])
+        return self._plan_search(**query, query_vector=query_vector)
+
+    async def _check_index_exists(self):
+        if self._index_exists:
+            return
+        if not await self.es.indices.exists(index=ELASTICSEARCH_INDEX_NAME):
+            raise Exception(f"Index {ELASTICSEARCH_INDEX_NAME} does not exist")
+        self._index_exists = True
+
+    async def _search(self, index: str, **kwargs):
+        with tracing.span("elasticsearch.search", index=index) as span:
+            response = await self.es.search(index=index, **kwargs)
+            if span.recording:
+                span.set(took_seconds=response["took"] / 1000, hits=len(response["hits"]["hits"]))
+            return response
+
+    async def _msearch(self, bodies: list[dict]) -> list[dict]:
+        searches = []
+        for body in bodies:
+            searches += [{"index": ELASTICSEARCH_INDEX_NAME}, body]
+        with tracing.span("elasticsearch.msearch", index=ELASTICSEARCH_INDEX_NAME, searches=len(bodies)) as span:
+            response = await self.es.msearch(searches=searches)
+            if span.recording:
+                span.set(took_seconds=response["took"] / 1000)
+            return response["responses"]
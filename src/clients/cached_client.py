@@ -0,0 +1,234 @@
+import copy
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from clients.climbing_data_client import AsyncClimbingDataClient, ClimbingDataClient
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 600
+# 3 decimal places is about 100m, far smaller than any search radius
+COORDINATE_DECIMALS = 3
+VERSION_CHECK_SECONDS = 30
+_TEXT_ARGUMENTS = ("route_name", "sector_name", "description")
+
+
+class _SearchResultCache:
+    """
+    The cache behind CachedClimbingDataClient and AsyncCachedClimbingDataClient: entries, keys and
+    the index version they were stored under. The wrappers fetch the version and run the searches.
+    """
+
+    def __init__(
+        self,
+        client,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        version_check_seconds: float = VERSION_CHECK_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_check_seconds = version_check_seconds
+        self.clock = clock
+        # taken from the class so an instrumented or patched method still gives the real parameters
+        self._signature = inspect.signature(type(client).search_climbs)
+        self._entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._version_recorded = False
+        self._version_checked_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+    def cache_key(self, *args, **kwargs) -> tuple:
+        arguments = self._signature.bind(self.client, *args, **kwargs)
+        arguments.apply_defaults()
+        normalized = []
+        for name, value in sorted(arguments.arguments.items()):
+            if name == "self":
+                continue
+            if value is None:
+                pass
+            elif name in _TEXT_ARGUMENTS:
+                value = " ".join(value.lower().split())
+            elif name == "location":
+                value = (round(float(value["lat"]), COORDINATE_DECIMALS), round(float(value["lon"]), COORDINATE_DECIMALS))
+            elif name == "grades":
+                value = tuple(sorted({grade.strip() for grade in value}))
+            elif name == "style":
+                value = str(value).lower()
+            elif isinstance(value, list):
+                value = tuple(value)
+            normalized.append((name, value))
+        return tuple(normalized)
+
+    def _version_check_due(self, now: float) -> bool:
+        with self._lock:
+            if self._version_checked_at is not None and now - self._version_checked_at < self.version_check_seconds:
+                return False
+            # claimed before fetching, so one caller checks per interval while the others keep serving
+            self._version_checked_at = now
+            return True
+
+    def _record_version(self, version: Optional[str]) -> bool:
+        """
+        Drops the entries when version isn't the one they were stored under. Returns whether it
+        replaces an earlier recorded version, i.e. the data was reloaded since the client started.
+        """
+        with self._lock:
+            if version != self._version and self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+            reloaded = self._version_recorded and version != self._version
+            self._version = version
+            self._version_recorded = True
+            return reloaded
+
+    def _lookup(self, key: tuple, now: float) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def _put(self, key: tuple, result: dict):
+        with self._lock:
+            self._entries[key] = (self.clock(), copy.deepcopy(result))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+class CachedClimbingDataClient(_SearchResultCache, ClimbingDataClient):
+    """
+    Caches another ClimbingDataClient's search results in memory, keyed on normalized arguments:
+    names and descriptions are lowercased with whitespace collapsed, grades sorted and
+    deduplicated, and coordinates rounded to COORDINATE_DECIMALS places.
+
+    At most max_entries results are kept, evicting the least recently used, and each expires
+    ttl_seconds after it was stored. Every version_check_seconds the wrapped client's
+    index_version() is compared to the last one seen, and the whole cache is dropped when it
+    changes, e.g. after a reload swaps the index alias or an incremental load bumps the index's
+    generation; a failed check keeps the cache. The wrapped client's index_changed() is called
+    then too, so it can reload its route name index. Safe to share between threads.
+    """
+
+    def search_climbs(self, *args, **kwargs):
+        key = self.cache_key(*args, **kwargs)
+        cached = self._get(key)
+        if cached is not None:
+            return cached
+        result = self.client.search_climbs(*args, **kwargs)
+        self._put(key, result)
+        return result
+
+    def search_sectors(self, *args, **kwargs) -> dict:
+        # one query covers a whole group of climbers, so repeats are rare enough not to cache
+        return self.client.search_sectors(*args, **kwargs)
+
+    def lookup_route(self, *args, **kwargs) -> dict:
+        # answered from memory by clients with a route name index, so nothing to gain from caching,
+        # but checked against the index version so that index is reloaded with the data
+        self._check_version(self.clock())
+        return self.client.lookup_route(*args, **kwargs)
+
+    def warm_up(self):
+        self.client.warm_up()
+
+    def index_version(self) -> Optional[str]:
+        return self.client.index_version()
+
+    def _check_version(self, now: float):
+        if not self._version_check_due(now):
+            return
+        try:
+            version = self.client.index_version()
+        except Exception:
+            # Elasticsearch being unreachable says nothing about the index changing
+            return
+        if self._record_version(version):
+            self.client.index_changed(version)
+
+    def _get(self, key: tuple) -> Optional[dict]:
+        now = self.clock()
+        self._check_version(now)
+        return self._lookup(key, now)
+
+
+class AsyncCachedClimbingDataClient(_SearchResultCache, AsyncClimbingDataClient):
+    """
+    CachedClimbingDataClient for an AsyncClimbingDataClient, with the same keys, limits and
+    version checks. Entries are shared by every coroutine on the loop the client is used on.
+    """
+
+    async def search_climbs(self, *args, **kwargs):
+        key = self.cache_key(*args, **kwargs)
+        cached = await self._get(key)
+        if cached is not None:
+            return cached
+        result = await self.client.search_climbs(*args, **kwargs)
+        self._put(key, result)
+        return result
+
+    async def search_sectors(self, *args, **kwargs) -> dict:
+        return await self.client.search_sectors(*args, **kwargs)
+
+    async def lookup_route(self, *args, **kwargs) -> dict:
+        await self._check_version(self.clock())
+        return await self.client.lookup_route(*args, **kwargs)
+
+    async def warm_up(self):
+        await self.client.warm_up()
+
+    async def close(self):
+        await self.client.close()
+
+    async def index_version(self) -> Optional[str]:
+        return await self.client.index_version()
+
+    async def _check_version(self, now: float):
+        if not self._version_check_due(now):
+            return
+        try:
+            version = await self.client.index_version()
+        except Exception:
+            return
+        if self._record_version(version):
+            await self.client.index_changed(version)
+
+    async def _get(self, key: tuple) -> Optional[dict]:
+        now = self.clock()
+        await self._check_version(now)
+        return self._lookup(key, now)
@@ -1,7 +1,160 @@
 from abc import ABC, abstractmethod
+from constants import ClimbStyle
+from typing import Optional, TypedDict
+
+DEFAULT_SIZE = 10
+DEFAULT_LOOKUP_SIZE = 5
+COMPACT_DESCRIPTION_CHARS = 200
+
+
+class Location(TypedDict):
+    lat: int
+    lon: int
+
+
+def truncate_description(description: Optional[str], max_chars: int = COMPACT_DESCRIPTION_CHARS) -> Optional[str]:
+    """Cuts a description to at most max_chars, at a word boundary where possible."""
+    if description is None or len(description) <= max_chars:
+        return description
+    cut = description[:max_chars - 1]
+    if " " in cut:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip(" ,.;:") + "…"
 
 
 class ClimbingDataClient(ABC):
     @abstractmethod
-    def search_climbs(self, route_name):
+    def search_climbs(
+        self,
+        route_name: Optional[str] = None,
+        sector_name: Optional[str] = None,
+        description: Optional[str] = None,
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        style: Optional[ClimbStyle] = None,
+        rating_min: Optional[float] = None,
+        grades: Optional[list[str]] = None,
+        grade_min: Optional[str] = None,
+        grade_max: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+        search_after: Optional[list] = None,
+        compact: bool = False,
+    ):
+        """
+        Returns {"total", "routes", "search_after"}, with at most `size` routes ordered by score.
+        "search_after" is a cursor ([score, route_id] of the last route) to pass back for the next
+        page, or None once a page comes back short. `compact` shortens descriptions to
+        COMPACT_DESCRIPTION_CHARS. grade_min and grade_max bound an inclusive grade range in one
+        grading system, e.g. V4 to V6 or 5.10a to 5.11d.
+        """
         pass
+
+    @abstractmethod
+    def search_sectors(
+        self,
+        climbers: list[dict],
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        sector_name: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+    ) -> dict:
+        """
+        Ranks sectors by how well they cover a group of climbers, each given as
+        {"grade_min", "grade_max", "style"} (style optional). Sectors with routes for more of the
+        climbers come first, scored as in core.sectors.coverage_score. Returns {"total", "sectors"},
+        where each sector has its grade histogram per style and how many routes suit each climber.
+        """
+        pass
+
+    def lookup_route(
+        self,
+        route_name: str,
+        location: Optional[Location] = None,
+        size: int = DEFAULT_LOOKUP_SIZE,
+    ) -> dict:
+        """
+        Resolves a route name, e.g. one a user says they climbed, to the routes it could mean.
+        Returns {"total", "routes"} with each route's id, sector and location, routes sharing the
+        name closest to `location` first. Clients with a core.route_names.RouteNameIndex answer in
+        memory; by default this is a search_climbs name search, ordered by its score only.
+        """
+        result = self.search_climbs(route_name=route_name, size=size, compact=True)
+        return {"total": result["total"], "routes": result["routes"]}
+
+    def warm_up(self):
+        """Prepares connections and caches ahead of the first search. Does nothing by default."""
+
+    def index_version(self) -> Optional[str]:
+        """
+        Identifies the data currently being searched, changing whenever it is reloaded, so cached
+        results can be dropped. None means the data never changes.
+        """
+        return None
+
+    def index_changed(self, version: Optional[str]):
+        """
+        Called by clients.cached_client when index_version() changes, so anything built from the
+        old data can be reloaded. Does nothing by default.
+        """
+
+
+class AsyncClimbingDataClient(ABC):
+    """
+    The asyncio counterpart of ClimbingDataClient: the same searches and results, as coroutines.
+    Implementations are bound to the event loop they are first used on.
+    """
+
+    @abstractmethod
+    async def search_climbs(
+        self,
+        route_name: Optional[str] = None,
+        sector_name: Optional[str] = None,
+        description: Optional[str] = None,
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        style: Optional[ClimbStyle] = None,
+        rating_min: Optional[float] = None,
+        grades: Optional[list[str]] = None,
+        grade_min: Optional[str] = None,
+        grade_max: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+        search_after: Optional[list] = None,
+        compact: bool = False,
+    ):
+        """See ClimbingDataClient.search_climbs."""
+        pass
+
+    @abstractmethod
+    async def search_sectors(
+        self,
+        climbers: list[dict],
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        sector_name: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+    ) -> dict:
+        """See ClimbingDataClient.search_sectors."""
+        pass
+
+    async def lookup_route(
+        self,
+        route_name: str,
+        location: Optional[Location] = None,
+        size: int = DEFAULT_LOOKUP_SIZE,
+    ) -> dict:
+        """See ClimbingDataClient.lookup_route."""
+        result = await self.search_climbs(route_name=route_name, size=size, compact=True)
+        return {"total": result["total"], "routes": result["routes"]}
+
+    async def warm_up(self):
+        """Prepares connections and caches ahead of the first search. Does nothing by default."""
+
+    async def close(self):
+        """Closes pooled connections. Does nothing by default."""
+
+    async def index_version(self) -> Optional[str]:
+        """See ClimbingDataClient.index_version."""
+        return None
+
+    async def index_changed(self, version: Optional[str]):
+        """See ClimbingDataClient.index_changed."""
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import threading
+from typing import Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from clients.climbing_data_client import AsyncClimbingDataClient, ClimbingDataClient
+from core import tracing
+
+OPENAI_MAX_CONNECTIONS = 50
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+# idle connections are kept this long, so a conversation's next message skips the TLS handshake
+OPENAI_KEEPALIVE_SECONDS = 120
+OPENAI_TIMEOUT_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def make_openai_client(
+    api_key: str, base_url: Optional[str] = None, max_connections: int = OPENAI_MAX_CONNECTIONS,
+) -> OpenAI:
+    """
+    An OpenAI client with a connection pool sized to be shared by every session in the process.
+    A streamed answer holds its connection until it ends, so max_connections caps concurrent turns.
+    """
+    return OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        http_client=DefaultHttpxClient(limits=_openai_limits(max_connections)),
+    )
+
+
+def make_async_openai_client(
+    api_key: str, base_url: Optional[str] = None, max_connections: int = OPENAI_MAX_CONNECTIONS,
+) -> AsyncOpenAI:
+    """
+    make_openai_client for AsyncOpenAI. Its connections belong to the event loop that first uses
+    them, so share it only between coroutines on one loop, e.g. core.async_bridge.EventLoopThread's.
+    """
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        timeout=OPENAI_TIMEOUT_SECONDS,
+        http_client=DefaultAsyncHttpxClient(limits=_openai_limits(max_connections)),
+    )
+
+
+def _openai_limits(max_connections: int) -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(OPENAI_MAX_KEEPALIVE_CONNECTIONS, max_connections),
+        keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+    )
+
+
+def warm_up(openai_client: OpenAI, climbing_data_client: ClimbingDataClient, model: str):
+    """
+    Pays the one-off costs of the first message ahead of time: loading the tokenizer, and opening
+    pooled connections to OpenAI and the search backend. A failing step is logged and skipped.
+    """
+    from core.embedding import get_encoding
+
+    steps = {
+        "tokenizer": get_encoding,
+        "search_backend": climbing_data_client.warm_up,
+        "openai": lambda: openai_client.models.retrieve(model),
+    }
+    for name, step in steps.items():
+        try:
+            with tracing.span("warm_up", step=name):
+                step()
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
+
+
+def start_warm_up(openai_client: OpenAI, climbing_data_client: ClimbingDataClient, model: str) -> threading.Thread:
+    """Runs warm_up on a daemon thread, so it doesn't hold up the first page render."""
+    thread = threading.Thread(
+        target=warm_up, args=(openai_client, climbing_data_client, model), name="warm-up", daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+async def warm_up_async(openai_client: AsyncOpenAI, climbing_data_client: AsyncClimbingDataClient, model: str):
+    """warm_up for the async clients, run on the loop that will serve the chat. The tokenizer loads off the loop."""
+    from core.embedding import get_encoding
+
+    steps = {
+        "tokenizer": lambda: asyncio.to_thread(get_encoding),
+        "search_backend": climbing_data_client.warm_up,
+        "openai": lambda: openai_client.models.retrieve(model),
+    }
+    for name, step in steps.items():
+        try:
+            with tracing.span("warm_up", step=name):
+                await step()
+        except Exception as e:
+            logger.warning("Warm-up step %s failed: %s", name, e)
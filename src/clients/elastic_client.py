@@ -1,19 +1,129 @@
-from clients.climbing_data_client import ClimbingDataClient
-from constants import ELASTICSEARCH_INDEX_NAME, ClimbStyle
-from elasticsearch import Elasticsearch
-from typing import Optional, TypedDict
+from clients.climbing_data_client import (
+    COMPACT_DESCRIPTION_CHARS,
+    DEFAULT_LOOKUP_SIZE,
+    DEFAULT_SIZE,
+    ClimbingDataClient,
+    Location,
+    truncate_description,
+)
+from constants import ELASTICSEARCH_INDEX_NAME, INDEX_GENERATION_META_KEY, SECTORS_INDEX_NAME, ClimbStyle
+from core import tracing
+from core.grades import grade_range
+from core.route_names import RouteNameIndex, load_route_name_index
+from core.sectors import COVERAGE_TIER, climber_filter, climber_route_counts, grade_histogram
+from elasticsearch import Elasticsearch, NotFoundError
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+import logging
+import os
 
+DEFAULT_NUM_CANDIDATES = 100
+# how many hits each of the BM25 and kNN searches contributes to reciprocal rank fusion
+RRF_WINDOW_SIZE = 50
+RRF_RANK_CONSTANT = 60
+# enough keep-alive connections for a few sessions' searches at once without opening new ones
+ELASTICSEARCH_CONNECTIONS_PER_NODE = 25
+ELASTICSEARCH_REQUEST_TIMEOUT_SECONDS = 10
 
-class Location(TypedDict):
-    lat: int
-    lon: int
+logger = logging.getLogger(__name__)
+# fields returned per hit; description_vector alone would be most of the response otherwise
+ROUTE_FIELDS = [
+    "route_name", "route_id", "sector_id", "sector_name", "grade", "style", "description", "rating", "location",
+]
+SECTOR_FIELDS = ["sector_id", "sector_name", "location", "route_count", "rating", "style_counts", "grade_buckets"]
+# route_id breaks score ties so search_after cursors are stable
+SORT = [{"_score": "desc"}, {"route_id": "asc"}]
+# in compact mode, Elasticsearch cuts the description down instead of sending all of it
+COMPACT_HIGHLIGHT = {
+    "fields": {"description": {
+        "fragment_size": COMPACT_DESCRIPTION_CHARS,
+        "number_of_fragments": 1,
+        "no_match_size": COMPACT_DESCRIPTION_CHARS,
+        "boundary_scanner": "word",
+    }},
+    "pre_tags": [""],
+    "post_tags": [""],
+}
 
 
-class ElasticClient(ClimbingDataClient):
-    def __init__(self, elastic_url, elastic_api_key):
-        self.es = Elasticsearch(elastic_url, api_key=elastic_api_key)
+def reciprocal_rank_fusion(*ranked_hits: list[dict], rank_constant: int = RRF_RANK_CONSTANT) -> list[dict]:
+    """
+    Merges ranked hit lists by summing 1 / (rank_constant + rank) for each document across the lists.
+    Returns one hit per document, best first (ties by _id), with _score replaced by the fused score.
+    """
+    fused: dict[str, dict] = {}
+    for hits in ranked_hits:
+        for rank, hit in enumerate(hits, start=1):
+            if hit["_id"] not in fused:
+                fused[hit["_id"]] = {**hit, "_score": 0.0}
+            fused[hit["_id"]]["_score"] += 1 / (rank_constant + rank)
+    return sorted(fused.values(), key=lambda hit: (-hit["_score"], hit["_id"]))
 
-    def search_climbs(
+
+def index_version_from_mappings(mappings: dict) -> str:
+    """
+    Identifies what the alias points at from a get_mapping response: each index behind it, with
+    the generation an incremental load last recorded in its _meta, as "index@generation".
+    """
+    return ",".join(
+        f"{index}@{mapping['mappings'].get('_meta', {}).get(INDEX_GENERATION_META_KEY, 0)}"
+        for index, mapping in sorted(mappings.items())
+    )
+
+
+def _file_identity(path: Path) -> Optional[tuple]:
+    # the loader replaces the file with a new one, so its inode changes even within one mtime tick
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _raise_for_errors(responses: list[dict]):
+    for response in responses:
+        if "error" in response:
+            raise Exception(f"Search failed: {response['error']}")
+
+
+class ElasticQueryPlanner:
+    """
+    Builds Elasticsearch request bodies and reads their responses, without sending anything, so
+    the synchronous and asyncio clients search the same way. Subclasses set embed_query and
+    num_candidates.
+    """
+
+    embed_query = None
+    num_candidates = DEFAULT_NUM_CANDIDATES
+    route_name_index_path = None
+    # the route name index file as last loaded, and whether the index has changed version since
+    _route_name_index_file = None
+    _route_name_index_stale = False
+
+    def _load_route_name_index(self) -> Optional[RouteNameIndex]:
+        if self.route_name_index_path is None:
+            return None
+        self._route_name_index_file = _file_identity(self.route_name_index_path)
+        return load_route_name_index(self.route_name_index_path)
+
+    def _claim_route_name_index_reload(self) -> bool:
+        """
+        Whether the index has changed version (see index_changed) and the loader has since written a
+        new route name index file. It writes the file once the routes are live, so the file can land
+        after the change is noticed; until then lookups keep the loaded one. A True is only returned
+        once per change, to the caller that then reloads.
+        """
+        if not self._route_name_index_stale or _file_identity(self.route_name_index_path) == self._route_name_index_file:
+            return False
+        self._route_name_index_stale = False
+        return True
+
+    def _reload_route_name_index(self):
+        route_name_index = self._load_route_name_index()
+        if route_name_index is not None:
+            self.route_name_index = route_name_index
+
+    def _plan_search(
         self,
         route_name: Optional[str] = None,
         sector_name: Optional[str] = None,
@@ -23,9 +133,19 @@ class ElasticClient(ClimbingDataClient):
         style: Optional[ClimbStyle] = None,
         rating_min: Optional[float] = None,
         grades: Optional[list[str]] = None,
-    ):
-        if not self.es.indices.exists(index=ELASTICSEARCH_INDEX_NAME):
-            raise Exception(f"Index {ELASTICSEARCH_INDEX_NAME} does not exist")
+        grade_min: Optional[str] = None,
+        grade_max: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+        search_after: Optional[list] = None,
+        compact: bool = False,
+        query_vector: Optional[Sequence[float]] = None,
+    ) -> tuple[list[dict], Callable[[list[dict]], dict]]:
+        """
+        Builds the search request bodies for one search_climbs call, and a function that turns their
+        responses into the search_climbs result. A query_vector already embedded for description is
+        used instead of calling embed_query.
+        """
+        hybrid = description is not None and (query_vector is not None or self.embed_query is not None)
         query = {"bool": {"must": []}}
         if route_name is not None:
             query["bool"]["must"].append({
@@ -37,8 +157,8 @@ class ElasticClient(ClimbingDataClient):
                     }
                 }
             })
-        if description is not None:
-            # TODO switch to vector search
+        if description is not None and not hybrid:
+            # no way to embed the query, so fall back to keyword search only
             query["bool"]["must"].append({
                 "match": {
                     "description": {
@@ -85,22 +205,102 @@ class ElasticClient(ClimbingDataClient):
                     "grade": grades
                 }
             })
+        if grade_min is not None or grade_max is not None:
+            grade_system, grade_low, grade_high = grade_range(grade_min, grade_max)
+            grade_bounds = {"gte": grade_low, "lte": grade_high}
+            query["bool"]["must"].append({"term": {"grade_system": grade_system}})
+            query["bool"]["must"].append({
+                "range": {
+                    "grade_numeric": {key: value for key, value in grade_bounds.items() if value is not None}
+                }
+            })
         if style is not None:
             query["bool"]["must"].append({
                 "match": {
                     "style": style
                 }
             })
-        print("query", query)
-        response = self.es.search(
-            index=ELASTICSEARCH_INDEX_NAME,
-            query=query,
-        )
+        logger.debug("search query: %s", query)
+        if hybrid:
+            if query_vector is None:
+                query_vector = self.embed_query(description)
+            return self._plan_hybrid_search(query, description, query_vector, size, search_after, compact)
+        body = {"query": query, "size": size, "sort": SORT, **self._source_fields(compact)}
+        if search_after is not None:
+            body["search_after"] = search_after
+
+        def finish(responses):
+            _raise_for_errors(responses)
+            hits = responses[0]["hits"]["hits"]
+            return {
+                "total": responses[0]["hits"]["total"]["value"],
+                "routes": self._routes(hits, compact),
+                "search_after": hits[-1]["sort"] if len(hits) == size else None,
+            }
+        return [body], finish
 
+    @staticmethod
+    def _source_fields(compact: bool) -> dict:
+        if compact:
+            return {"_source": [field for field in ROUTE_FIELDS if field != "description"], "highlight": COMPACT_HIGHLIGHT}
+        return {"_source": ROUTE_FIELDS}
+
+    def _plan_hybrid_search(
+        self,
+        query: dict,
+        description: str,
+        query_vector: Sequence[float],
+        size: int,
+        search_after: Optional[list],
+        compact: bool,
+    ) -> tuple[list[dict], Callable[[list[dict]], dict]]:
+        # the other filters restrict both searches; BM25 ranks on any description word (operator "or")
+        # since the vector search already covers the semantic match
+        bm25_query = {"bool": {
+            "must": [{"match": {"description": {"query": description, "fuzziness": "AUTO"}}}],
+            "filter": query["bool"]["must"],
+        }}
+        window_size = max(RRF_WINDOW_SIZE, size)
+        knn = {
+            "field": "description_vector",
+            "query_vector": list(query_vector),
+            "k": window_size,
+            "num_candidates": max(self.num_candidates, window_size),
+        }
+        if query["bool"]["must"]:
+            knn["filter"] = query["bool"]["must"]
+        source_fields = self._source_fields(compact)
+
+        def finish(responses):
+            _raise_for_errors(responses)
+            fused = reciprocal_rank_fusion(*(response["hits"]["hits"] for response in responses))
+            # every match within the fused windows; a BM25 total would count any document sharing a word
+            total = len(fused)
+            if search_after is not None:
+                # the fused ranking is recomputed identically for each page, so skip past the cursor in it.
+                # Paging stops at the end of the fused windows.
+                after_score, after_id = search_after
+                fused = [hit for hit in fused if (-hit["_score"], hit["_id"]) > (-after_score, str(after_id))]
+            page = fused[:size]
+            return {
+                "total": total,
+                "routes": self._routes(page, compact),
+                "search_after": [page[-1]["_score"], page[-1]["_id"]] if len(page) == size and len(fused) > size else None,
+            }
+        return [
+            {"query": bm25_query, "size": window_size, **source_fields},
+            {"knn": knn, "size": window_size, **source_fields},
+        ], finish
+
+    def _routes(self, hits: list[dict], compact: bool = False) -> list[dict]:
         # Extract and reshape the relevant route information
         routes = []
-        for hit in response["hits"]["hits"]:
+        for hit in hits:
             source = hit["_source"]
+            if compact:
+                description = truncate_description(hit.get("highlight", {}).get("description", [""])[0])
+            else:
+                description = source["description"]
             route = {
                 "route_name": source["route_name"],
                 "route_id": source["route_id"],
@@ -108,11 +308,238 @@ class ElasticClient(ClimbingDataClient):
                 "sector_name": source["sector_name"],
                 "grade": source["grade"],
                 "style": source["style"],
-                "description": source["description"],
+                "description": description,
                 "rating": source["rating"],
                 "location": source["location"],
                 "score": hit["_score"],
             }
             routes.append(route)
+        return routes
+
+    def _plan_sector_search(
+        self,
+        climbers: list[dict],
+        location: Optional[Location],
+        location_radius_miles: Optional[int],
+        sector_name: Optional[str],
+        size: int,
+    ) -> tuple[dict, Callable[[dict], dict]]:
+        """Builds the search arguments for one search_sectors call, and a function that turns the response into its result."""
+        filters = []
+        if location is not None:
+            if location_radius_miles is None:
+                raise ValueError(
+                    "location_radius_miles cannot be None when location is not None"
+                )
+            filters.append({
+                "geo_distance": {
+                    "distance": f"{location_radius_miles}mi",
+                    "location": location,
+                }
+            })
+        if sector_name is not None:
+            filters.append({
+                "match": {
+                    "sector_name": {
+                        "query": sector_name,
+                        "fuzziness": "AUTO",
+                        "operator": "and"
+                    }
+                }
+            })
+        query = {"bool": {
+            "should": [self._climber_coverage_query(climber) for climber in climbers],
+            "minimum_should_match": 1,
+            "filter": filters,
+        }}
+
+        def finish(response):
+            return {
+                "total": response["hits"]["total"]["value"],
+                "sectors": [self._sector(hit, climbers) for hit in response["hits"]["hits"]],
+            }
+        return {
+            "query": query, "size": size, "sort": [{"_score": "desc"}, {"sector_id": "asc"}], "source": SECTOR_FIELDS,
+        }, finish
+
+    @staticmethod
+    def _climber_coverage_query(climber: dict) -> dict:
+        # the nested query sums the counts of the grade buckets that suit the climber, then the
+        # sector scores COVERAGE_TIER + log1p(that total), as in core.sectors.coverage_score
+        style, grade_system, grade_low, grade_high = climber_filter(climber)
+        grade_bounds = {"gte": grade_low, "lte": grade_high}
+        bucket_filter = [
+            {"term": {"grade_buckets.grade_system": grade_system}},
+            {"range": {
+                "grade_buckets.grade_numeric": {key: value for key, value in grade_bounds.items() if value is not None}
+            }},
+        ]
+        if style is not None:
+            bucket_filter.append({"term": {"grade_buckets.style": style}})
+        return {
+            "function_score": {
+                "query": {
+                    "nested": {
+                        "path": "grade_buckets",
+                        "score_mode": "sum",
+                        "query": {
+                            "function_score": {
+                                "query": {"bool": {"filter": bucket_filter}},
+                                "field_value_factor": {"field": "grade_buckets.count"},
+                                "boost_mode": "replace",
+                            }
+                        },
+                    }
+                },
+                "script_score": {
+                    "script": {"source": "params.tier + Math.log1p(_score)", "params": {"tier": COVERAGE_TIER}},
+                },
+                "boost_mode": "replace",
+            }
+        }
+
+    @staticmethod
+    def _sector(hit: dict, climbers: list[dict]) -> dict:
+        source = hit["_source"]
+        return {
+            "sector_id": source["sector_id"],
+            "sector_name": source["sector_name"],
+            "location": source["location"],
+            "route_count": source["route_count"],
+            "rating": source["rating"],
+            "style_counts": source["style_counts"],
+            "grade_histogram": grade_histogram(source["grade_buckets"]),
+            "climber_route_counts": climber_route_counts(source["grade_buckets"], climbers),
+            "score": hit["_score"],
+        }
+
+
+class ElasticClient(ElasticQueryPlanner, ClimbingDataClient):
+    """
+    When embed_query is given, description searches are hybrid: an approximate kNN search over
+    description_vector and a BM25 match on description, both restricted by the other filters, fused
+    with reciprocal rank fusion. num_candidates is how many nearest neighbours each shard considers;
+    raising it improves recall at the cost of latency.
+
+    With a route_name_index (built by the loader), lookup_route resolves names in memory instead of
+    searching the index. Given route_name_index_path instead, the index is loaded from that file,
+    and loaded again once the data is reloaded (see index_changed()) and the loader has rewritten it.
+
+    The Elasticsearch client keeps up to connections_per_node connections alive per node, so one
+    ElasticClient is meant to be shared by every thread and session in the process.
+    """
+
+    def __init__(
+        self,
+        elastic_url,
+        elastic_api_key,
+        embed_query: Optional[Callable[[str], Sequence[float]]] = None,
+        num_candidates: int = DEFAULT_NUM_CANDIDATES,
+        connections_per_node: int = ELASTICSEARCH_CONNECTIONS_PER_NODE,
+        request_timeout: float = ELASTICSEARCH_REQUEST_TIMEOUT_SECONDS,
+        route_name_index: Optional[RouteNameIndex] = None,
+        route_name_index_path: Optional[Path] = None,
+    ):
+        self.es = Elasticsearch(
+            elastic_url,
+            api_key=elastic_api_key,
+            connections_per_node=connections_per_node,
+            request_timeout=request_timeout,
+            retry_on_timeout=True,
+        )
+        self.embed_query = embed_query
+        self.num_candidates = num_candidates
+        self.route_name_index_path = route_name_index_path
+        # an empty RouteNameIndex is falsy, so compare with None
+        self.route_name_index = route_name_index if route_name_index is not None else self._load_route_name_index()
+        self._index_exists = False
+
+    def search_climbs(
+        self,
+        route_name: Optional[str] = None,
+        sector_name: Optional[str] = None,
+        description: Optional[str] = None,
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        style: Optional[ClimbStyle] = None,
+        rating_min: Optional[float] = None,
+        grades: Optional[list[str]] = None,
+        grade_min: Optional[str] = None,
+        grade_max: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+        search_after: Optional[list] = None,
+        compact: bool = False,
+    ):
+        self._check_index_exists()
+        bodies, finish = self._plan_search(
+            route_name, sector_name, description, location, location_radius_miles, style, rating_min, grades,
+            grade_min, grade_max, size, search_after, compact,
+        )
+        if len(bodies) == 1:
+            # the client's `source` argument is `_source` in the raw request body
+            search_kwargs = {"source" if key == "_source" else key: value for key, value in bodies[0].items()}
+            return finish([self._search(ELASTICSEARCH_INDEX_NAME, **search_kwargs)])
+        return finish(self._msearch(bodies))
+
+    def search_sectors(
+        self,
+        climbers: list[dict],
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        sector_name: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+    ) -> dict:
+        search_kwargs, finish = self._plan_sector_search(climbers, location, location_radius_miles, sector_name, size)
+        return finish(self._search(SECTORS_INDEX_NAME, **search_kwargs))
+
+    def lookup_route(
+        self,
+        route_name: str,
+        location: Optional[Location] = None,
+        size: int = DEFAULT_LOOKUP_SIZE,
+    ) -> dict:
+        if self._claim_route_name_index_reload():
+            self._reload_route_name_index()
+        if self.route_name_index is None:
+            return super().lookup_route(route_name, location, size)
+        return self.route_name_index.lookup(route_name, location, size)
+
+    def index_version(self) -> Optional[str]:
+        # a full reload swaps the alias to a new versioned index, an incremental one bumps the index's generation
+        try:
+            return index_version_from_mappings(self.es.indices.get_mapping(index=ELASTICSEARCH_INDEX_NAME))
+        except NotFoundError:
+            return None
+
+    def index_changed(self, version: Optional[str]):
+        self._route_name_index_stale = self.route_name_index_path is not None
+
+    def warm_up(self):
+        """Opens a pooled connection (TLS handshake included) and checks the index, ahead of the first search."""
+        self._check_index_exists()
+
+    def _check_index_exists(self):
+        # ELASTICSEARCH_INDEX_NAME is an alias that stays in place across reloads, so once is enough
+        if self._index_exists:
+            return
+        if not self.es.indices.exists(index=ELASTICSEARCH_INDEX_NAME):
+            raise Exception(f"Index {ELASTICSEARCH_INDEX_NAME} does not exist")
+        self._index_exists = True
+
+    def _search(self, index: str, **kwargs):
+        # took is Elasticsearch's own time on the search; the rest of the round trip is network and (de)serialization
+        with tracing.span("elasticsearch.search", index=index) as span:
+            response = self.es.search(index=index, **kwargs)
+            if span.recording:
+                span.set(took_seconds=response["took"] / 1000, hits=len(response["hits"]["hits"]))
+            return response
 
-        return {"total": response["hits"]["total"]["value"], "routes": routes}
+    def _msearch(self, bodies: list[dict]) -> list[dict]:
+        searches = []
+        for body in bodies:
+            searches += [{"index": ELASTICSEARCH_INDEX_NAME}, body]
+        with tracing.span("elasticsearch.msearch", index=ELASTICSEARCH_INDEX_NAME, searches=len(bodies)) as span:
+            response = self.es.msearch(searches=searches)
+            if span.recording:
+                span.set(took_seconds=response["took"] / 1000)
+            return response["responses"]
@@ -0,0 +1,288 @@
+import math
+from collections import defaultdict
+from typing import Callable, Iterable, Optional, Sequence
+
+import numpy as np
+
+from clients.climbing_data_client import DEFAULT_LOOKUP_SIZE, DEFAULT_SIZE, ClimbingDataClient, Location, truncate_description
+from constants import ClimbStyle
+from core.geo import MILES_PER_DEGREE_LAT, haversine_miles
+from core.grades import grade_range, parse_grade
+from core.ngram_index import NGramIndex, normalize
+from core.route_names import RouteNameIndex
+from core.sectors import build_sector_documents, climber_route_counts, coverage_score, grade_histogram
+
+
+class LocalClimbingDataClient(ClimbingDataClient):
+    """
+    In-process search over the transformed route documents, with no Elasticsearch needed.
+
+    Documents are held as array-backed columns: names behind trigram indexes for fuzzy matching,
+    coordinates bucketed into a lat/lon grid for radius queries, grades and styles as categorical
+    codes, and description vectors as one normalized float32 matrix for brute-force cosine search.
+    `embed_query` turns a description query into a vector; without it, description queries fall
+    back to requiring every query word in the description.
+    """
+
+    def __init__(
+        self,
+        documents: Iterable[dict],
+        embed_query: Optional[Callable[[str], Sequence[float]]] = None,
+        grid_cell_degrees: float = 0.5,
+    ):
+        documents = list(documents)
+        self.embed_query = embed_query
+        self.grid_cell_degrees = grid_cell_degrees
+        self.num_routes = len(documents)
+
+        self.route_names = np.array([doc["route_name"] for doc in documents], dtype=object)
+        self.route_ids = np.array([doc["route_id"] for doc in documents], dtype=object)
+        # route_id is a keyword in Elasticsearch, so ties sort by its string form there too
+        self.route_id_strings = np.array([str(route_id) for route_id in self.route_ids])
+        self.sector_ids = np.array([doc["sector_id"] for doc in documents], dtype=object)
+        self.descriptions = np.array([doc["description"] for doc in documents], dtype=object)
+        self.ratings = np.array(
+            [np.nan if doc.get("rating") is None else doc["rating"] for doc in documents], dtype=np.float32
+        )
+        self.lat = np.array([doc["location"]["lat"] if doc.get("location") else np.nan for doc in documents])
+        self.lon = np.array([doc["location"]["lon"] if doc.get("location") else np.nan for doc in documents])
+
+        self.grade_values, self.grade_codes = np.unique(
+            np.array([str(doc["grade"]) for doc in documents], dtype=object), return_inverse=True
+        )
+        parsed_grades = [parse_grade(grade) for grade in self.grade_values]
+        self.grade_value_systems = np.array([grade.system if grade else "" for grade in parsed_grades], dtype=object)
+        self.grade_value_numeric = np.array([grade.numeric if grade else np.nan for grade in parsed_grades])
+        self.style_values, self.style_codes = np.unique(
+            np.array([str(doc["style"]) for doc in documents], dtype=object), return_inverse=True
+        )
+        # sector names repeat for every route in the sector, so index each distinct name once
+        self.sector_name_values, self.sector_name_codes = np.unique(
+            np.array([doc["sector_name"] or "" for doc in documents], dtype=object), return_inverse=True
+        )
+
+        self.route_name_index = NGramIndex(self.route_names.tolist())
+        self.sector_name_index = NGramIndex(self.sector_name_values.tolist())
+        self._build_grid()
+        self._build_vectors(documents)
+        # built on the first sector search or name lookup, since most uses only search routes
+        self._sectors: Optional[list[dict]] = None
+        self._route_name_index: Optional[RouteNameIndex] = None
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.grid_cell_degrees)), int(math.floor(lon / self.grid_cell_degrees))
+
+    def _build_grid(self):
+        cells = defaultdict(list)
+        for row in np.flatnonzero(~np.isnan(self.lat)):
+            cells[self._cell(self.lat[row], self.lon[row])].append(row)
+        self.grid = {cell: np.asarray(rows, dtype=np.int64) for cell, rows in cells.items()}
+
+    def _build_vectors(self, documents):
+        vectors = [doc.get("description_vector") for doc in documents]
+        dims = next((len(vector) for vector in vectors if vector is not None), 0)
+        self.has_vector = np.array([vector is not None for vector in vectors], dtype=bool)
+        self.vectors = np.zeros((len(vectors), dims), dtype=np.float32)
+        for row in np.flatnonzero(self.has_vector):
+            self.vectors[row] = vectors[row]
+        norms = np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        self.vectors /= np.where(norms > 0, norms, 1)
+
+    def _rows_within(self, location: Location, radius_miles: float) -> tuple[np.ndarray, np.ndarray]:
+        center_lat, center_lon = location["lat"], location["lon"]
+        lat_degrees = radius_miles / MILES_PER_DEGREE_LAT
+        lon_degrees = radius_miles / (MILES_PER_DEGREE_LAT * max(math.cos(math.radians(center_lat)), 1e-6))
+        min_cell = self._cell(center_lat - lat_degrees, center_lon - lon_degrees)
+        max_cell = self._cell(center_lat + lat_degrees, center_lon + lon_degrees)
+        num_cells = (max_cell[0] - min_cell[0] + 1) * (max_cell[1] - min_cell[1] + 1)
+        if num_cells > len(self.grid):
+            # a huge radius touches more cells than exist; just scan every located route
+            candidates = np.flatnonzero(~np.isnan(self.lat))
+        else:
+            candidate_cells = [
+                self.grid[(lat_cell, lon_cell)]
+                for lat_cell in range(min_cell[0], max_cell[0] + 1)
+                for lon_cell in range(min_cell[1], max_cell[1] + 1)
+                if (lat_cell, lon_cell) in self.grid
+            ]
+            candidates = np.concatenate(candidate_cells) if candidate_cells else np.empty(0, dtype=np.int64)
+        distances = haversine_miles(self.lat[candidates], self.lon[candidates], center_lat, center_lon)
+        within = distances <= radius_miles
+        return candidates[within], distances[within]
+
+    def search_climbs(
+        self,
+        route_name: Optional[str] = None,
+        sector_name: Optional[str] = None,
+        description: Optional[str] = None,
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        style: Optional[ClimbStyle] = None,
+        rating_min: Optional[float] = None,
+        grades: Optional[list[str]] = None,
+        grade_min: Optional[str] = None,
+        grade_max: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+        search_after: Optional[list] = None,
+        compact: bool = False,
+    ):
+        mask = np.ones(self.num_routes, dtype=bool)
+        scores = np.ones(self.num_routes, dtype=np.float32)
+
+        if route_name is not None:
+            rows, name_scores = self.route_name_index.search(route_name)
+            matched = np.zeros(self.num_routes, dtype=bool)
+            matched[rows] = True
+            mask &= matched
+            scores[rows] += name_scores
+        if sector_name is not None:
+            sector_codes, sector_scores = self.sector_name_index.search(sector_name)
+            code_scores = np.full(len(self.sector_name_values), np.nan, dtype=np.float32)
+            code_scores[sector_codes] = sector_scores
+            route_sector_scores = code_scores[self.sector_name_codes]
+            mask &= ~np.isnan(route_sector_scores)
+            scores += np.nan_to_num(route_sector_scores)
+        if location is not None:
+            if location_radius_miles is None:
+                raise ValueError(
+                    "location_radius_miles cannot be None when location is not None"
+                )
+            rows, _ = self._rows_within(location, location_radius_miles)
+            nearby = np.zeros(self.num_routes, dtype=bool)
+            nearby[rows] = True
+            mask &= nearby
+        if rating_min is not None:
+            mask &= self.ratings >= rating_min
+        if grades is not None:
+            mask &= np.isin(self.grade_codes, np.flatnonzero(np.isin(self.grade_values, list(grades))))
+        if grade_min is not None or grade_max is not None:
+            grade_system, grade_low, grade_high = grade_range(grade_min, grade_max)
+            in_range = self.grade_value_systems == grade_system
+            with np.errstate(invalid="ignore"):
+                if grade_low is not None:
+                    in_range &= self.grade_value_numeric >= grade_low
+                if grade_high is not None:
+                    in_range &= self.grade_value_numeric <= grade_high
+            mask &= in_range[self.grade_codes]
+        if style is not None:
+            mask &= np.isin(self.style_codes, np.flatnonzero(self.style_values == str(style)))
+
+        if description is not None:
+            self._apply_description(description, mask, scores)
+
+        rows = np.flatnonzero(mask)
+        total = len(rows)
+        if search_after is not None:
+            after_score, after_id = np.float32(search_after[0]), str(search_after[1])
+            after = (scores[rows] < after_score) | ((scores[rows] == after_score) & (self.route_id_strings[rows] > after_id))
+            rows = rows[after]
+        top = rows[np.lexsort((self.route_id_strings[rows], -scores[rows]))[:size]]
+        routes = [self._route(row, scores[row], compact) for row in top]
+        return {
+            "total": total,
+            "routes": routes,
+            "search_after": [routes[-1]["score"], routes[-1]["route_id"]] if len(routes) == size else None,
+        }
+
+    def search_sectors(
+        self,
+        climbers: list[dict],
+        location: Optional[Location] = None,
+        location_radius_miles: Optional[int] = 50,
+        sector_name: Optional[str] = None,
+        size: int = DEFAULT_SIZE,
+    ) -> dict:
+        sectors = self._sector_documents()
+        if location is not None:
+            if location_radius_miles is None:
+                raise ValueError(
+                    "location_radius_miles cannot be None when location is not None"
+                )
+            sectors = [
+                sector for sector in sectors
+                if sector["location"] is not None and haversine_miles(
+                    sector["location"]["lat"], sector["location"]["lon"], location["lat"], location["lon"]
+                ) <= location_radius_miles
+            ]
+        if sector_name is not None:
+            sector_codes, _ = self.sector_name_index.search(sector_name)
+            names = set(self.sector_name_values[sector_codes])
+            sectors = [sector for sector in sectors if (sector["sector_name"] or "") in names]
+        scored = [(coverage_score(sector["grade_buckets"], climbers), sector) for sector in sectors]
+        scored = [(score, sector) for score, sector in scored if score > 0]
+        scored.sort(key=lambda item: (-item[0], str(item[1]["sector_id"])))
+        return {
+            "total": len(scored),
+            "sectors": [
+                {
+                    **{key: value for key, value in sector.items() if key != "grade_buckets"},
+                    "grade_histogram": grade_histogram(sector["grade_buckets"]),
+                    "climber_route_counts": climber_route_counts(sector["grade_buckets"], climbers),
+                    "score": score,
+                }
+                for score, sector in scored[:size]
+            ],
+        }
+
+    def lookup_route(
+        self,
+        route_name: str,
+        location: Optional[Location] = None,
+        size: int = DEFAULT_LOOKUP_SIZE,
+    ) -> dict:
+        if self._route_name_index is None:
+            self._route_name_index = RouteNameIndex.from_documents(
+                {
+                    "route_name": self.route_names[row],
+                    "route_id": self.route_ids[row],
+                    "sector_id": self.sector_ids[row],
+                    "sector_name": self.sector_name_values[self.sector_name_codes[row]] or None,
+                    "location": None if np.isnan(self.lat[row]) else {"lat": self.lat[row], "lon": self.lon[row]},
+                }
+                for row in range(self.num_routes)
+            )
+        return self._route_name_index.lookup(route_name, location, size)
+
+    def _sector_documents(self) -> list[dict]:
+        if self._sectors is None:
+            self._sectors = build_sector_documents(
+                {
+                    "sector_id": self.sector_ids[row],
+                    "sector_name": self.sector_name_values[self.sector_name_codes[row]] or None,
+                    "style": self.style_values[self.style_codes[row]],
+                    "grade": self.grade_values[self.grade_codes[row]],
+                    "rating": None if np.isnan(self.ratings[row]) else float(self.ratings[row]),
+                    "location": None if np.isnan(self.lat[row]) else {"lat": self.lat[row], "lon": self.lon[row]},
+                }
+                for row in range(self.num_routes)
+            )
+        return self._sectors
+
+    def _apply_description(self, description: str, mask: np.ndarray, scores: np.ndarray):
+        if self.embed_query is not None and self.vectors.shape[1] > 0:
+            query_vector = np.asarray(self.embed_query(description), dtype=np.float32)
+            query_vector /= max(np.linalg.norm(query_vector), 1e-12)
+            mask &= self.has_vector
+            rows = np.flatnonzero(mask)
+            scores[rows] += self.vectors[rows] @ query_vector
+        else:
+            terms = normalize(description).split()
+            for row in np.flatnonzero(mask):
+                text = normalize(self.descriptions[row])
+                if not all(term in text for term in terms):
+                    mask[row] = False
+
+    def _route(self, row: int, score: float, compact: bool = False) -> dict:
+        has_location = not np.isnan(self.lat[row])
+        return {
+            "route_name": self.route_names[row],
+            "route_id": self.route_ids[row],
+            "sector_id": self.sector_ids[row],
+            "sector_name": self.sector_name_values[self.sector_name_codes[row]],
+            "grade": self.grade_values[self.grade_codes[row]],
+            "style": self.style_values[self.style_codes[row]],
+            "description": truncate_description(self.descriptions[row]) if compact else self.descriptions[row],
+            "rating": None if np.isnan(self.ratings[row]) else float(self.ratings[row]),
+            "location": {"lat": float(self.lat[row]), "lon": float(self.lon[row])} if has_location else None,
+            "score": float(score),
+        }
@@ -1,6 +1,9 @@
 from enum import StrEnum
 
 ELASTICSEARCH_INDEX_NAME = 'openbeta'
+SECTORS_INDEX_NAME = 'sectors'
+# bumped in the index mapping's _meta by each incremental load, which upserts without moving the alias
+INDEX_GENERATION_META_KEY = 'generation'
 
 
 class ClimbStyle(StrEnum):
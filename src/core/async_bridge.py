@@ -0,0 +1,67 @@
+import asyncio
+import queue
+import threading
+from typing import AsyncIterator, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# what the pump coroutine sends back to the iterating thread
+_ITEM, _CALL, _ERROR, _DONE = range(4)
+
+
+class EventLoopThread:
+    """
+    One asyncio event loop running on a daemon thread, shared by every session in the process, so
+    async clients and their connection pools stay bound to a single loop. Streamlit's own handling
+    of async generators runs each one on a loop of its own, which would leave the shared clients
+    bound to a loop that is gone.
+    """
+
+    def __init__(self, name: str = "event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """Runs coroutine on the loop and waits for its result in the calling thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def iterate(self, make_iterator: Callable[..., AsyncIterator[T]], **callbacks: Callable) -> Iterator[T]:
+        """
+        Calls make_iterator(**callbacks) on the loop and yields what the async iterator produces,
+        e.g. for st.write_stream. The callbacks are called in the iterating thread, not on the loop,
+        so they can update Streamlit elements. Closing the generator early cancels the iteration.
+        """
+        events = queue.SimpleQueue()
+
+        def relay(callback):
+            return lambda *args: events.put((_CALL, (callback, args)))
+
+        async def pump():
+            try:
+                async for item in make_iterator(**{name: relay(callback) for name, callback in callbacks.items()}):
+                    events.put((_ITEM, item))
+            except Exception as e:
+                events.put((_ERROR, e))
+            else:
+                events.put((_DONE, None))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                kind, value = events.get()
+                if kind == _ITEM:
+                    yield value
+                elif kind == _CALL:
+                    callback, args = value
+                    callback(*args)
+                elif kind == _ERROR:
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Optional
+
+from openai import AsyncOpenAI
+
+from clients.climbing_data_client import AsyncClimbingDataClient
+from core import tracing
+from core.completion import (
+    MAX_TOOL_ROUNDS,
+    TOOL_LOOP_TIMEOUT_SECONDS,
+    ContextBudget,
+    SemanticResponseCache,
+    StreamedToolCalls,
+    ToolLoop,
+    lookup_cached_answer,
+    replay_answer,
+    tool_result_json,
+)
+
+
+async def call_function_async(function_name, climbing_data_client: AsyncClimbingDataClient, **kwargs):
+    if function_name == "search_climbs":
+        return await climbing_data_client.search_climbs(**kwargs)
+    elif function_name == "search_sectors":
+        return await climbing_data_client.search_sectors(**kwargs)
+    elif function_name == "lookup_route":
+        return await climbing_data_client.lookup_route(**kwargs)
+    else:
+        raise Exception("Unknown function name: " + function_name)
+
+
+class AsyncStreamedToolCalls(StreamedToolCalls):
+    """StreamedToolCalls that starts each call as an asyncio task on the running loop instead of on the tool executor."""
+
+    def _start(self, name: str, arguments: str):
+        return asyncio.ensure_future(self._call_async(name, arguments))
+
+    async def _call_async(self, name: str, arguments: str):
+        with tracing.span("tool_call", tool=name) as span:
+            try:
+                args = json.loads(arguments)
+            except json.JSONDecodeError as e:
+                raise Exception(f"Invalid arguments: {e}")
+            result = await call_function_async(name, self.climbing_data_client, **args)
+            if isinstance(result, dict):
+                span.set(total=result.get("total"))
+            return result
+
+    async def gather_tool_messages(self, deadline: Optional[float] = None, format_result: Callable = tool_result_json) -> list[dict]:
+        """
+        Waits for every call, up to the deadline (a time.monotonic() value), and returns the tool
+        result messages. Calls still running at the deadline are cancelled and reported as timed out.
+        """
+        tasks = [call["future"] for call in self.calls.values()]
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        return self._result_messages([_task_result(call["future"], pending) for call in self.calls.values()], format_result)
+
+
+def _task_result(task: asyncio.Future, pending: set):
+    if task in pending:
+        return {"error": "Timed out"}
+    try:
+        return task.result()
+    except Exception as e:
+        return {"error": str(e)}
+
+
+async def get_completions_stream_async(
+    openai_client: AsyncOpenAI,
+    climbing_data_client: AsyncClimbingDataClient,
+    model: str,
+    messages,
+    max_rounds: int = MAX_TOOL_ROUNDS,
+    timeout_seconds: float = TOOL_LOOP_TIMEOUT_SECONDS,
+    on_status: Optional[Callable[[str], None]] = None,
+    context_budget: Optional[ContextBudget] = None,
+    response_cache: Optional[SemanticResponseCache] = None,
+) -> AsyncIterator[str]:
+    """
+    get_completions_stream on AsyncOpenAI and an AsyncClimbingDataClient, with the same rounds,
+    timeouts, context budget and response cache. A turn holds no thread while it waits on the model
+    or a search, so one event loop serves every session's turns at once; core.async_bridge streams
+    them into Streamlit.
+    """
+    with tracing.span("chat_turn", model=model) as span:
+        async for content_delta in _answer_stream(
+            openai_client, climbing_data_client, model, messages, max_rounds, timeout_seconds, on_status,
+            context_budget, response_cache,
+        ):
+            span.mark("ttft_seconds")
+            yield content_delta
+
+
+async def _answer_stream(
+    openai_client: AsyncOpenAI,
+    climbing_data_client: AsyncClimbingDataClient,
+    model: str,
+    messages,
+    max_rounds: int,
+    timeout_seconds: float,
+    on_status: Optional[Callable[[str], None]],
+    context_budget: Optional[ContextBudget],
+    response_cache: Optional[SemanticResponseCache],
+) -> AsyncIterator[str]:
+    # the cache embeds its keys with the synchronous client, so look up off the event loop
+    cached_answer, key = await asyncio.to_thread(lookup_cached_answer, response_cache, messages, model)
+    if cached_answer is not None:
+        for content_delta in replay_answer(cached_answer):
+            yield content_delta
+        return
+    tool_loop = ToolLoop(model, messages, max_rounds, timeout_seconds, context_budget)
+    answer = ""
+    async for content_delta in _generate_answer(openai_client, climbing_data_client, tool_loop, on_status):
+        answer += content_delta
+        yield content_delta
+    if key is not None and answer and tool_loop.outcome.complete:
+        response_cache.store(key, model, answer)
+
+
+async def _generate_answer(
+    openai_client: AsyncOpenAI,
+    climbing_data_client: AsyncClimbingDataClient,
+    tool_loop: ToolLoop,
+    on_status: Optional[Callable[[str], None]],
+) -> AsyncIterator[str]:
+    for round_number in tool_loop.rounds():
+        request = tool_loop.request(round_number)
+        tool_calls = AsyncStreamedToolCalls(climbing_data_client, on_status)
+        content = ""
+        with tool_loop.span(request, round_number) as span:
+            async for chunk in await openai_client.chat.completions.create(**request):
+                content_delta = tool_loop.read_chunk(chunk, span, tool_calls)
+                if content_delta:
+                    content += content_delta
+                    yield content_delta
+            span.set(tool_calls=[call["name"] for call in tool_calls.calls.values()])
+        if not tool_calls:
+            return
+        tool_calls.finish()
+        tool_messages = await tool_calls.gather_tool_messages(tool_loop.deadline, tool_loop.context_budget.format_tool_result)
+        tool_loop.add_round(tool_calls, content, tool_messages)
+
+    request = tool_loop.request()
+    with tool_loop.span(request) as span:
+        async for chunk in await openai_client.chat.completions.create(**request):
+            content_delta = tool_loop.read_chunk(chunk, span)
+            if content_delta:
+                yield content_delta
@@ -1,15 +1,121 @@
-from completion import get_completions_stream
-from openai import OpenAI
+import asyncio
+import functools
+from pathlib import Path
+from typing import Optional
+from openai import AsyncOpenAI, OpenAI
 import streamlit as st
+from clients.async_elastic_client import AsyncElasticClient
+from clients.cached_client import AsyncCachedClimbingDataClient, CachedClimbingDataClient
+from clients.climbing_data_client import AsyncClimbingDataClient, ClimbingDataClient
+from clients.connections import make_async_openai_client, make_openai_client, start_warm_up, warm_up_async
 from clients.elastic_client import ElasticClient
+from core import tracing
+from core.async_bridge import EventLoopThread
+from core.async_completion import get_completions_stream_async
+from core.completion import SemanticResponseCache, get_completions_stream
+from core.embedding import AsyncQueryEmbedder, QueryEmbedder
+from core.route_names import route_name_index_path
+
+# Streamlit reruns this script on every interaction; everything behind st.cache_resource below is
+# built once per process and shared by every session, connection pools included.
+DEFAULT_MODEL = "gpt-4o"
 
 st.title("AI Climbing Guide")
 
-openai_client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-climbing_data_client = ElasticClient(elastic_url=st.secrets["ELASTICSEARCH_NODE_URL"], elastic_api_key=st.secrets["ELASTICSEARCH_API_KEY"])
+
+@st.cache_resource
+def configure_tracing() -> tracing.Tracer:
+    # cached so the metrics server is started once per process, not on every rerun
+    metrics_port = st.secrets.get("METRICS_PORT")
+    return tracing.configure(
+        log_spans=bool(st.secrets.get("TRACING", False)),
+        metrics_port=int(metrics_port) if metrics_port else None,
+    )
+
+
+configure_tracing()
+
+
+@st.cache_resource
+def get_openai_client() -> OpenAI:
+    return make_openai_client(st.secrets["OPENAI_API_KEY"])
+
+
+def get_embedding_dimensions() -> Optional[int]:
+    # must match the dimensions the index was loaded with
+    dimensions = st.secrets.get("EMBEDDING_DIMENSIONS")
+    return int(dimensions) if dimensions else None
+
+
+@st.cache_resource
+def get_query_embedder() -> QueryEmbedder:
+    return QueryEmbedder(get_openai_client(), dimensions=get_embedding_dimensions())
+
+
+def get_route_name_index_path() -> Path:
+    # written by the loader; the clients load it, and load it again after each reload of the data,
+    # and without it lookup_route falls back to a name search in Elasticsearch
+    return Path(st.secrets.get("ROUTE_NAME_INDEX", route_name_index_path()))
+
+
+@st.cache_resource
+def get_climbing_data_client() -> ClimbingDataClient:
+    # shared by every session, so repeated searches and query embeddings are cached across users
+    return CachedClimbingDataClient(ElasticClient(
+        elastic_url=st.secrets["ELASTICSEARCH_NODE_URL"],
+        elastic_api_key=st.secrets["ELASTICSEARCH_API_KEY"],
+        embed_query=get_query_embedder(),
+        route_name_index_path=get_route_name_index_path(),
+    ))
+
+
+@st.cache_resource
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    if not st.secrets.get("SEMANTIC_RESPONSE_CACHE", False):
+        return None
+    return SemanticResponseCache(get_query_embedder())
+
+
+@st.cache_resource
+def get_event_loop_thread() -> EventLoopThread:
+    # with ASYNC_CHAT, every session's turns run as coroutines on this one loop
+    return EventLoopThread(name="chat-event-loop")
+
+
+@st.cache_resource
+def get_async_openai_client() -> AsyncOpenAI:
+    return make_async_openai_client(st.secrets["OPENAI_API_KEY"])
+
+
+@st.cache_resource
+def get_async_climbing_data_client() -> AsyncClimbingDataClient:
+    # only ever used on the event loop thread, which every session's turns share
+    return AsyncCachedClimbingDataClient(AsyncElasticClient(
+        elastic_url=st.secrets["ELASTICSEARCH_NODE_URL"],
+        elastic_api_key=st.secrets["ELASTICSEARCH_API_KEY"],
+        embed_query=AsyncQueryEmbedder(get_async_openai_client(), dimensions=get_embedding_dimensions()),
+        route_name_index_path=get_route_name_index_path(),
+    ))
+
+
+@st.cache_resource
+def warm_up():
+    # once per process, in the background, so the first message doesn't pay for the tokenizer and handshakes
+    if use_async_chat:
+        return asyncio.run_coroutine_threadsafe(
+            warm_up_async(get_async_openai_client(), get_async_climbing_data_client(), DEFAULT_MODEL),
+            get_event_loop_thread().loop,
+        )
+    return start_warm_up(get_openai_client(), get_climbing_data_client(), DEFAULT_MODEL)
+
+
+use_async_chat = bool(st.secrets.get("ASYNC_CHAT", False))
+openai_client = get_openai_client()
+climbing_data_client = get_climbing_data_client()
+warm_up()
 
 if "openai_model" not in st.session_state:
-    st.session_state["openai_model"] = "gpt-4o"
+    st.session_state["openai_model"] = DEFAULT_MODEL
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -24,6 +130,28 @@ if prompt := st.chat_input("What is up?"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        stream = get_completions_stream(openai_client, climbing_data_client, st.session_state["openai_model"], st.session_state.messages)
+        status = st.empty()
+        if use_async_chat:
+            stream = get_event_loop_thread().iterate(
+                functools.partial(
+                    get_completions_stream_async,
+                    get_async_openai_client(),
+                    get_async_climbing_data_client(),
+                    st.session_state["openai_model"],
+                    st.session_state.messages,
+                    response_cache=get_response_cache(),
+                ),
+                on_status=status.caption,
+            )
+        else:
+            stream = get_completions_stream(
+                openai_client,
+                climbing_data_client,
+                st.session_state["openai_model"],
+                st.session_state.messages,
+                on_status=status.caption,
+                response_cache=get_response_cache(),
+            )
         response = st.write_stream(stream)
+        status.empty()
     st.session_state.messages.append({"role": "assistant", "content": response})
@@ -0,0 +1,90 @@
+import json
+import os
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class LazyColumns:
+    """Read-only, DataFrame-like view of a Parquet file that reads each column the first time it is accessed."""
+
+    def __init__(self, parquet_file: pq.ParquetFile, columns: list[str]):
+        self._parquet_file = parquet_file
+        self.columns = columns
+        self._loaded: dict[str, pd.Series] = {}
+
+    def __len__(self) -> int:
+        return self._parquet_file.metadata.num_rows
+
+    def __getitem__(self, column: str) -> pd.Series:
+        if column not in self.columns:
+            raise KeyError(column)
+        if column not in self._loaded:
+            table = self._parquet_file.read(columns=[column])
+            self._loaded[column] = _from_arrow(table)[column]
+        return self._loaded[column]
+
+
+def _to_arrow_compatible(series: pd.Series) -> pd.Series:
+    # Arrow list columns need every non-null value to be a sequence
+    is_sequence = series.map(lambda value: isinstance(value, (list, tuple, np.ndarray)))
+    if is_sequence.any():
+        return series.where(is_sequence, None)
+    return series
+
+
+def _from_arrow(table: pa.Table) -> pd.DataFrame:
+    # self_destruct frees each Arrow column as soon as it has been converted
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    for column in df.columns:
+        if pd.api.types.is_string_dtype(df[column]) and df[column].dtype != object and df[column].hasnans:
+            # keep missing strings as None, like the source pickle, rather than NaN
+            df[column] = df[column].astype(object).where(df[column].notna(), None)
+    return df
+
+
+class ColumnarCache:
+    """
+    Parquet copy of a subset of a source dataset's columns, stored next to the source file.
+
+    A sidecar JSON file records the size and mtime of the source file it was built from, so the
+    cache is rebuilt whenever the source file changes. Reads only touch the requested columns and
+    go through a memory map.
+    """
+
+    def __init__(self, source_path: Path, cache_path: Optional[Path] = None):
+        self.source_path = Path(source_path)
+        self.cache_path = Path(cache_path) if cache_path else self.source_path.with_suffix(".parquet")
+        self._meta_path = self.cache_path.with_suffix(self.cache_path.suffix + ".json")
+
+    def _source_fingerprint(self) -> dict:
+        stat = self.source_path.stat()
+        return {"source": self.source_path.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def is_valid(self, columns: list[str]) -> bool:
+        if not self.cache_path.exists() or not self._meta_path.exists():
+            return False
+        meta = json.loads(self._meta_path.read_text())
+        return meta["fingerprint"] == self._source_fingerprint() and set(columns) <= set(meta["columns"])
+
+    def write(self, df: pd.DataFrame, columns: list[str], converters: Optional[dict] = None):
+        """Writes the given columns of df, applying any per-column converters first."""
+        converted = pd.DataFrame({
+            column: _to_arrow_compatible((converters or {}).get(column, lambda s: s)(df[column]))
+            for column in columns
+        })
+        table = pa.Table.from_pandas(converted, preserve_index=False)
+        tmp_path = self.cache_path.with_suffix(self.cache_path.suffix + ".tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, self.cache_path)
+        self._meta_path.write_text(json.dumps({"fingerprint": self._source_fingerprint(), "columns": columns}))
+
+    def read(self, columns: list[str]) -> pd.DataFrame:
+        return _from_arrow(pq.read_table(self.cache_path, columns=columns, memory_map=True))
+
+    def read_lazy(self, columns: list[str]) -> LazyColumns:
+        return LazyColumns(pq.ParquetFile(self.cache_path, memory_map=True), columns)
@@ -1,8 +1,51 @@
 import json
 import copy
+import logging
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterator, Optional, Sequence
 
-from clients.climbing_data_client import ClimbingDataClient
+import numpy as np
+
+from clients.climbing_data_client import ClimbingDataClient, truncate_description
 from constants import ClimbStyle
+from core import tracing
+from core.embedding import get_encoding
+
+MAX_TOOL_ROUNDS = 4
+TOOL_LOOP_TIMEOUT_SECONDS = 60
+TOOL_CALL_MAX_WORKERS = 8
+CONTEXT_TOKEN_BUDGET = 16000
+TOOL_RESULT_TOKEN_BUDGET = 2000
+# hits scoring below this fraction of the best hit's score are left out of the prompt
+MIN_RELATIVE_SCORE = 0.3
+# older messages beyond the most recent few are cut to OLD_MESSAGE_TOKENS
+RECENT_MESSAGES_KEPT = 6
+OLD_MESSAGE_TOKENS = 150
+# rough per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_TTL_SECONDS = 6 * 60 * 60
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
+# how many messages before the latest user message, and how much of each, the cache key includes
+SEMANTIC_CACHE_CONTEXT_MESSAGES = 2
+SEMANTIC_CACHE_CONTEXT_CHARS = 300
+
+logger = logging.getLogger(__name__)
+TOOL_RESULT_COLUMNS = ["route_name", "grade", "style", "rating", "sector_name", "route_id", "location", "description"]
+SECTOR_RESULT_COLUMNS = [
+    "sector_name", "sector_id", "location", "route_count", "rating", "climber_route_counts", "grade_histogram", "score",
+]
+LOOKUP_RESULT_COLUMNS = ["route_name", "sector_name", "route_id", "location", "distance_miles", "score"]
+# the list in each tool's result that becomes table rows, and the columns they show
+TOOL_RESULT_TABLES = {
+    "search_climbs": ("routes", TOOL_RESULT_COLUMNS),
+    "search_sectors": ("sectors", SECTOR_RESULT_COLUMNS),
+    "lookup_route": ("routes", LOOKUP_RESULT_COLUMNS),
+}
 
 SYSTEM_PROMPT = """
 You are an AI climbing guide. Your task is to help people find information about climbing routes and areas, and plan which routes and areas to visit with their party. Don't offer general safety and climbing tips unless the user directly asks for it.
@@ -16,6 +59,8 @@ You have access to a climbing route database with the following fields:
 - grade: The difficulty grade (e.g., V0, 5.10a)
 
 When users ask about specific climbs, areas, or want recommendations, use the search_climbs function to find relevant information before responding. 
+When the user names a route they have climbed or want to climb (e.g. "I loved The Pearl"), resolve it with lookup_route, passing a location when you know roughly where it is, before searching for similar routes.
+When a party of climbers with different grade ranges asks where to go, use search_sectors with one entry per climber to find sectors with routes for all of them.
 Keep it succinct and don't say anything about climbs you don't find in the database. (You may still provide general information about large areas you know about from training, however.)
 """
 
@@ -39,7 +84,7 @@ TOOLS = [
                     },
                     "description": {
                         "type": "string",
-                        "description": "Description of the climbing route",
+                        "description": "Description of the climbing route, or of the kind of climbing wanted (matched by meaning, not just keywords)",
                     },
                     "location": {
                         "type": "object",
@@ -74,14 +119,136 @@ TOOLS = [
                         "items": {
                             "type": "string",
                         },
-                        "description": "A list of climbing grades to search for",
+                        "description": "A list of exact climbing grades to search for. Prefer grade_min and grade_max for a range of grades",
+                    },
+                    "grade_min": {
+                        "type": "string",
+                        "description": "The easiest grade to include, e.g. V4 or 5.10a. Includes variants such as V4-5 and 5.10-",
+                    },
+                    "grade_max": {
+                        "type": "string",
+                        "description": "The hardest grade to include, in the same grading system as grade_min",
+                    },
+                    "size": {
+                        "type": "integer",
+                        "description": "How many routes to return (default 10)",
+                    },
+                    "search_after": {
+                        "type": "array",
+                        "items": {},
+                        "description": "The search_after value from a previous result, to get the next page of routes for the same search",
+                    },
+                    "compact": {
+                        "type": "boolean",
+                        "description": "Shorten route descriptions, e.g. when surveying many routes across a large area",
                     },
                 },
                 "required": [],
                 "additionalProperties": False,
             },
         },
-    }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_sectors",
+            "description": "Find sectors (climbing areas) with routes suiting every climber in a party, ranked by how well they cover each climber's grade range. Returns each sector's grade histogram per style and its route count per climber",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "climbers": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "grade_min": {
+                                    "type": "string",
+                                    "description": "The easiest grade this climber wants, e.g. V2 or 5.9",
+                                },
+                                "grade_max": {
+                                    "type": "string",
+                                    "description": "The hardest grade this climber wants, in the same grading system as grade_min",
+                                },
+                                "style": {
+                                    "type": "string",
+                                    "enum": [style for style in ClimbStyle],
+                                    "description": "The climbing style this climber wants",
+                                },
+                            },
+                            "additionalProperties": False,
+                        },
+                        "description": "One entry per climber in the party",
+                    },
+                    "location": {
+                        "type": "object",
+                        "properties": {
+                            "lat": {
+                                "type": "number",
+                                "description": "Latitude of the center of a search region",
+                            },
+                            "lon": {
+                                "type": "number",
+                                "description": "Longitude of the center of a search region",
+                            },
+                        },
+                        "additionalProperties": False,
+                        "required": ["lat", "lon"],
+                    },
+                    "location_radius_miles": {
+                        "type": "number",
+                        "description": "The radius of the search region in miles",
+                    },
+                    "sector_name": {
+                        "type": "string",
+                        "description": "Name of a sector to restrict the search to",
+                    },
+                    "size": {
+                        "type": "integer",
+                        "description": "How many sectors to return (default 10)",
+                    },
+                },
+                "required": ["climbers"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "lookup_route",
+            "description": "Resolve a route name to the routes it could mean, with each route's id, sector and location. Much faster than search_climbs for a known name; routes sharing the name are ordered closest to location first",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "route_name": {
+                        "type": "string",
+                        "description": "The route name as the user wrote it; misspellings and partial names are tolerated",
+                    },
+                    "location": {
+                        "type": "object",
+                        "properties": {
+                            "lat": {
+                                "type": "number",
+                                "description": "Latitude of where the route probably is",
+                            },
+                            "lon": {
+                                "type": "number",
+                                "description": "Longitude of where the route probably is",
+                            },
+                        },
+                        "additionalProperties": False,
+                        "required": ["lat", "lon"],
+                    },
+                    "size": {
+                        "type": "integer",
+                        "description": "How many routes to return (default 5)",
+                    },
+                },
+                "required": ["route_name"],
+                "additionalProperties": False,
+            },
+        },
+    },
 ]
 
 
@@ -90,44 +257,568 @@ def search_climbs(climbing_data_client, **kwargs):
     return climbing_data_client.search_climbs(**kwargs)
 
 
+def search_sectors(climbing_data_client, **kwargs):
+    return climbing_data_client.search_sectors(**kwargs)
+
+
+def lookup_route(climbing_data_client, **kwargs):
+    return climbing_data_client.lookup_route(**kwargs)
+
+
 def call_function(function_name, climbing_data_client, **kwargs):
     if function_name == "search_climbs":
         return search_climbs(climbing_data_client, **kwargs)
+    elif function_name == "search_sectors":
+        return search_sectors(climbing_data_client, **kwargs)
+    elif function_name == "lookup_route":
+        return lookup_route(climbing_data_client, **kwargs)
     else:
         raise Exception("Unknown function name: " + function_name)
 
 
-def get_completions_stream(
-    openai_client, climbing_data_client: ClimbingDataClient, model: str, messages
-):
+# shared by every conversation in the process; tool calls mostly wait on the network. Calls a turn
+# gives up on at its deadline are cancelled if still queued, so they don't hold up other sessions';
+# one already running finishes within the search client's own request timeout.
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_CALL_MAX_WORKERS, thread_name_prefix="tool-call")
+
+
+def _result_or_error(future: Future, deadline: Optional[float]):
+    try:
+        return future.result(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+    except TimeoutError:
+        future.cancel()
+        return {"error": "Timed out"}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def tool_result_json(result, tool_name: str) -> str:
+    """The plain JSON tool result, for callers without a ContextBudget."""
+    return json.dumps(result)
+
+
+def _encoded_length(text: str) -> int:
+    return len(get_encoding().encode(text))
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    # history is resent every turn, so each message is only encoded once
+    return _encoded_length(text)
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, dict) and "lat" in value:
+        return f"{value['lat']:.4f},{value['lon']:.4f}"
+    if isinstance(value, dict):
+        # counts by key, e.g. a grade histogram as "boulder: V5 3, V6 1; sport: 5.10a 2"
+        nested = any(isinstance(inner, dict) for inner in value.values())
+        return ("; " if nested else ", ").join(
+            f"{key}: {_cell(inner)}" if isinstance(inner, dict) else f"{key} {_cell(inner)}" for key, inner in value.items()
+        )
+    if isinstance(value, list):
+        return ", ".join(_cell(item) for item in value)
+    return " ".join(str(value).split()).replace("|", "/")
+
+
+class ContextBudget:
+    """
+    Keeps the prompt within token_budget tokens (counted with the cached tiktoken encoder).
+
+    Route and sector search results go into the prompt as a compact table instead of JSON:
+    low-scoring hits are dropped, descriptions shortened, and rows cut from the bottom until the
+    table fits in tool_result_token_budget. Past turns are kept in full for the most recent
+    messages, cut short before that, and dropped oldest-first if the prompt is still over budget.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        tool_result_token_budget: int = TOOL_RESULT_TOKEN_BUDGET,
+        min_relative_score: float = MIN_RELATIVE_SCORE,
+    ):
+        self.token_budget = token_budget
+        self.tool_result_token_budget = tool_result_token_budget
+        self.min_relative_score = min_relative_score
+
+    def format_tool_result(self, result, tool_name: str = "search_climbs") -> str:
+        """Formats a tool's result as a table with the columns in TOOL_RESULT_TABLES; other results and errors as JSON."""
+        items_key, columns = TOOL_RESULT_TABLES.get(tool_name, (None, None))
+        if not isinstance(result, dict) or items_key not in result:
+            return json.dumps(result)
+        items = result[items_key]
+        if items and all(isinstance(item.get("score"), (int, float)) for item in items):
+            best_score = max(item["score"] for item in items)
+            items = [item for item in items if item["score"] >= self.min_relative_score * best_score]
+        rows = [
+            " | ".join(_cell(truncate_description(item.get(column)) if column == "description" else item.get(column))
+                       for column in columns)
+            for item in items
+        ]
+        header = " | ".join(columns)
+        footer = f"\nsearch_after: {json.dumps(result['search_after'])}" if result.get("search_after") else ""
+        # each line is encoded once, uncached, and a cut row's tokens (and its newline) are subtracted
+        row_tokens = [_encoded_length(row) + 1 for row in rows]
+        tokens = _encoded_length(header) + _encoded_length(footer) + sum(row_tokens)
+        while True:
+            summary = f"total: {result['total']}, showing {len(rows)}"
+            if len(rows) <= 1 or tokens + _encoded_length(summary) + 1 <= self.tool_result_token_budget:
+                return "\n".join([summary, header, *rows]) + footer
+            rows.pop()
+            tokens -= row_tokens.pop()
+
+    def count_message_tokens(self, message: dict) -> int:
+        # tool results are only sent during one turn, so they would just crowd history out of the cache
+        count_content = _encoded_length if message["role"] == "tool" else count_tokens
+        tokens = MESSAGE_OVERHEAD_TOKENS + count_content(message.get("content") or "")
+        for tool_call in message.get("tool_calls") or []:
+            tokens += count_tokens(tool_call["function"]["name"]) + count_tokens(tool_call["function"]["arguments"])
+        return tokens
+
+    def count_prompt_tokens(self, messages: list[dict]) -> int:
+        return sum(self.count_message_tokens(message) for message in messages)
+
+    def fit(self, messages: list[dict]) -> list[dict]:
+        """
+        Returns messages trimmed to the budget. The system prompt and the current turn (the latest
+        user message and everything after it) are always kept whole.
+        """
+        system = messages[:1] if messages and messages[0]["role"] == "system" else []
+        rest = messages[len(system):]
+        last_user = max((i for i, message in enumerate(rest) if message["role"] == "user"), default=0)
+        history, current_turn = rest[:last_user], rest[last_user:]
+
+        history = [
+            self._shorten(message) if i < len(history) - RECENT_MESSAGES_KEPT else message
+            for i, message in enumerate(history)
+        ]
+        fixed_tokens = self.count_prompt_tokens(system + current_turn)
+        history_tokens = [self.count_message_tokens(message) for message in history]
+        while history and fixed_tokens + sum(history_tokens) > self.token_budget:
+            history.pop(0)
+            history_tokens.pop(0)
+        return system + history + current_turn
+
+    def _shorten(self, message: dict) -> dict:
+        content = message.get("content")
+        if not isinstance(content, str) or count_tokens(content) <= OLD_MESSAGE_TOKENS:
+            return message
+        tokens = get_encoding().encode(content)[:OLD_MESSAGE_TOKENS]
+        return {**message, "content": get_encoding().decode(tokens) + "…"}
+
+
+class StreamedToolCalls:
+    """
+    Assembles tool calls from streamed chat completion deltas, and starts each call on the tool
+    executor as soon as its arguments are complete JSON, while the model is still generating the
+    rest. on_status is called with a short progress message whenever a search starts.
+    """
+
+    def __init__(self, climbing_data_client: ClimbingDataClient, on_status: Optional[Callable[[str], None]] = None):
+        self.climbing_data_client = climbing_data_client
+        self.on_status = on_status
+        self.calls: dict[int, dict] = {}
+        # set by tool_messages when any call errored or timed out
+        self.failed = False
+
+    def __bool__(self):
+        return bool(self.calls)
+
+    def add_deltas(self, tool_call_deltas):
+        for delta in tool_call_deltas:
+            if delta.index not in self.calls:
+                self.calls[delta.index] = {"id": None, "name": "", "arguments": "", "future": None}
+                self._status()
+            call = self.calls[delta.index]
+            if delta.id:
+                call["id"] = delta.id
+            if delta.function is not None:
+                call["name"] += delta.function.name or ""
+                call["arguments"] += delta.function.arguments or ""
+            self._dispatch_if_complete(call)
+
+    def finish(self):
+        """Starts any call whose arguments never parsed, so it reports the error."""
+        for call in self.calls.values():
+            if call["future"] is None:
+                call["future"] = self._start(call["name"], call["arguments"])
+
+    def _dispatch_if_complete(self, call: dict):
+        if call["future"] is not None or not call["name"] or not call["arguments"].rstrip().endswith("}"):
+            return
+        try:
+            json.loads(call["arguments"])
+        except json.JSONDecodeError:
+            return
+        call["future"] = self._start(call["name"], call["arguments"])
+        self._status()
+
+    def _start(self, name: str, arguments: str):
+        return _tool_executor.submit(self._call, name, arguments)
+
+    def _call(self, name: str, arguments: str):
+        with tracing.span("tool_call", tool=name) as span:
+            try:
+                args = json.loads(arguments)
+            except json.JSONDecodeError as e:
+                raise Exception(f"Invalid arguments: {e}")
+            result = call_function(name, self.climbing_data_client, **args)
+            if isinstance(result, dict):
+                span.set(total=result.get("total"))
+            return result
+
+    def _status(self):
+        if self.on_status is not None:
+            started = sum(call["future"] is not None for call in self.calls.values())
+            self.on_status(f"Searching… ({started} of {len(self.calls)} searches started)")
+
+    def assistant_message(self, content: str) -> dict:
+        return {
+            "role": "assistant",
+            "content": content or None,
+            "tool_calls": [
+                {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
+                for call in self.calls.values()
+            ],
+        }
+
+    def tool_messages(self, deadline: Optional[float] = None, format_result: Callable = tool_result_json) -> list[dict]:
+        """
+        Waits for every call, up to the deadline (a time.monotonic() value), and returns the tool
+        result messages, each result formatted by format_result(result, tool_name).
+        """
+        return self._result_messages([_result_or_error(call["future"], deadline) for call in self.calls.values()], format_result)
+
+    def _result_messages(self, results: list, format_result: Callable) -> list[dict]:
+        self.failed = any(isinstance(result, dict) and "error" in result for result in results)
+        return [
+            {"role": "tool", "tool_call_id": call["id"], "content": format_result(result, call["name"])}
+            for call, result in zip(self.calls.values(), results)
+        ]
+
+
+class AnswerOutcome:
+    """
+    How a generated answer was reached: whether any tool call failed or timed out, and whether the
+    tool loop ran out of time. Only a complete answer is worth replaying from the response cache.
+    """
+
+    def __init__(self):
+        self.tool_call_failed = False
+        self.timed_out = False
+
+    @property
+    def complete(self) -> bool:
+        return not self.tool_call_failed and not self.timed_out
+
+
+class SemanticResponseCache:
+    """
+    Reuses answers to questions that mean nearly the same thing as one answered before.
+
+    The key is an embedding of the latest user message together with a digest of the messages just
+    before it, so a follow-up like "what about V4s?" only matches in a similar conversation. A
+    lookup hits when the cosine similarity to a stored key is at least `threshold`, for an entry
+    from the same model and younger than ttl_seconds. Keys live in one normalized float32 matrix;
+    when it is full, the least recently used entry is replaced. Safe to share between threads.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[str], Sequence[float]],
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+        max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._answers: list[Optional[str]] = [None] * max_entries
+        self._models: list[Optional[str]] = [None] * max_entries
+        self._stored_at = np.full(max_entries, -np.inf)
+        self._last_used = np.full(max_entries, -np.inf)
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_text(messages) -> str:
+        user_indexes = [i for i, message in enumerate(messages) if message["role"] == "user"]
+        if not user_indexes:
+            return ""
+        latest = user_indexes[-1]
+        context = [
+            f"{message['role']}: {(message.get('content') or '')[:SEMANTIC_CACHE_CONTEXT_CHARS]}"
+            for message in messages[max(latest - SEMANTIC_CACHE_CONTEXT_MESSAGES, 0):latest]
+            if message["role"] in ("user", "assistant")
+        ]
+        return "\n".join(context + [f"question: {messages[latest]['content']}"])
+
+    def _key_vector(self, messages) -> np.ndarray:
+        vector = np.asarray(self.embed(self.key_text(messages)), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, messages, model: str) -> tuple[Optional[str], np.ndarray]:
+        """Returns (cached answer or None, key vector); pass the key vector to store() on a miss."""
+        with tracing.span("semantic_cache.lookup") as span:
+            answer, key, similarity = self._lookup(messages, model)
+            span.set(hit=answer is not None, similarity=similarity)
+            return answer, key
+
+    def _lookup(self, messages, model: str) -> tuple[Optional[str], np.ndarray, Optional[float]]:
+        key = self._key_vector(messages)
+        now = self.clock()
+        similarity = None
+        with self._lock:
+            if self._vectors is not None:
+                similarities = self._vectors @ key
+                expired = (now - self._stored_at > self.ttl_seconds) & np.isfinite(self._stored_at)
+                if expired.any():
+                    self.expirations += int(expired.sum())
+                    self._stored_at[expired] = -np.inf
+                    self._last_used[expired] = -np.inf
+                    self._vectors[expired] = 0
+                candidates = np.isfinite(self._stored_at) & np.array([stored == model for stored in self._models])
+                similarities[~candidates] = -np.inf
+                best = int(np.argmax(similarities))
+                if np.isfinite(similarities[best]):
+                    similarity = round(float(similarities[best]), 4)
+                if similarities[best] >= self.threshold:
+                    self.hits += 1
+                    self._last_used[best] = now
+                    return self._answers[best], key, similarity
+            self.misses += 1
+            return None, key, similarity
+
+    def store(self, key: np.ndarray, model: str, answer: str):
+        now = self.clock()
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(key)), dtype=np.float32)
+            slot = int(np.argmin(self._last_used))
+            if np.isfinite(self._stored_at[slot]):
+                self.evictions += 1
+            self._vectors[slot] = key
+            self._answers[slot] = answer
+            self._models[slot] = model
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": int(np.isfinite(self._stored_at).sum()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+def replay_answer(answer: str) -> Iterator[str]:
+    """Yields a stored answer a word at a time, the way a live answer streams in."""
+    yield from re.findall(r"\s*\S+", answer)
+
+
+def _chunk_delta(chunk, span) -> Optional[tuple[Optional[str], list]]:
+    usage = getattr(chunk, "usage", None)
+    if usage is not None:
+        span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+    if not chunk.choices:
+        return None
+    delta = chunk.choices[0].delta
+    if delta.content or delta.tool_calls:
+        span.mark("ttft_seconds")
+    return delta.content, delta.tool_calls or []
+
+
+def with_system_prompt(messages) -> list[dict]:
+    """Returns a copy of messages, starting with SYSTEM_PROMPT unless they already start with a system message."""
     updated_messages = copy.deepcopy(messages)
     if len(updated_messages) == 0 or updated_messages[0]["role"] != "system":
         updated_messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
-    rag_completion = openai_client.chat.completions.create(
-        model=model,
-        messages=updated_messages,
-        tools=TOOLS,
-    )
-    tool_calls = rag_completion.choices[0].message.tool_calls
-    print("tool calls", tool_calls)
-    updated_messages.append(rag_completion.choices[0].message)
-
-    if tool_calls:
-        for tool_call in tool_calls:
-            name = tool_call.function.name
-            args = json.loads(tool_call.function.arguments)
-
-            result = call_function(name, climbing_data_client, **args)
-            updated_messages.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "content": json.dumps(result),
-                }
-            )
-        print(f"after rag messages: {updated_messages}")
-    else:
-        print(f"no tools called")
-    return openai_client.chat.completions.create(
-        model=model, messages=updated_messages, stream=True
-    )
+    return updated_messages
+
+
+def lookup_cached_answer(
+    response_cache: Optional[SemanticResponseCache], messages, model: str,
+) -> tuple[Optional[str], Optional[np.ndarray]]:
+    """
+    Returns (cached answer or None, key vector or None) from response_cache. A key is only
+    returned when a new answer can be stored under it: there is a cache, the conversation has a
+    question, and the lookup, which embeds the key through the OpenAI API, didn't fail.
+    """
+    if response_cache is None or not response_cache.key_text(messages):
+        return None, None
+    try:
+        return response_cache.lookup(messages, model)
+    except Exception:
+        logger.warning("semantic cache lookup failed, answering without it", exc_info=True)
+        return None, None
+
+
+class ToolLoop:
+    """
+    One chat turn's tool rounds, shared by get_completions_stream and the asyncio path in
+    core.async_completion: the conversation so far, fitted to context_budget for every request,
+    the deadline, and the AnswerOutcome. Each path sends the requests and runs the tool calls its
+    own way, through rounds(), request(), span(), read_chunk() and add_round().
+    """
+
+    def __init__(
+        self,
+        model: str,
+        messages,
+        max_rounds: int = MAX_TOOL_ROUNDS,
+        timeout_seconds: float = TOOL_LOOP_TIMEOUT_SECONDS,
+        context_budget: Optional[ContextBudget] = None,
+    ):
+        self.model = model
+        self.max_rounds = max_rounds
+        self.context_budget = context_budget or ContextBudget()
+        self.messages = with_system_prompt(messages)
+        self.deadline = time.monotonic() + timeout_seconds
+        self.outcome = AnswerOutcome()
+
+    def rounds(self) -> Iterator[int]:
+        """Yields each tool round's number, up to max_rounds, while the deadline hasn't passed."""
+        for round_number in range(1, self.max_rounds + 1):
+            if self.deadline - time.monotonic() <= 0:
+                logger.warning("tool loop timed out after %d rounds", round_number - 1)
+                self.outcome.timed_out = True
+                return
+            yield round_number
+
+    def request(self, round_number: Optional[int] = None) -> dict:
+        """
+        chat.completions.create arguments for a tool round, or for the final answer (without tools)
+        when round_number is None.
+        """
+        request = {
+            "model": self.model,
+            "messages": self.context_budget.fit(self.messages),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        if round_number is not None:
+            request.update(tools=TOOLS, timeout=self.deadline - time.monotonic())
+        return request
+
+    def span(self, request: dict, round_number: Optional[int] = None):
+        return tracing.span("llm_round", model=self.model, round=round_number or "final", messages=len(request["messages"]))
+
+    def read_chunk(self, chunk, span, tool_calls: Optional[StreamedToolCalls] = None) -> Optional[str]:
+        """Records a streamed chunk's token usage on span, hands its tool call deltas to tool_calls and returns its content."""
+        delta = _chunk_delta(chunk, span)
+        if delta is None:
+            return None
+        content, tool_call_deltas = delta
+        if tool_calls is not None:
+            tool_calls.add_deltas(tool_call_deltas)
+        return content
+
+    def add_round(self, tool_calls: StreamedToolCalls, content: str, tool_messages: list[dict]):
+        """Adds a finished round's assistant message and tool results to the conversation."""
+        self.messages.append(tool_calls.assistant_message(content))
+        self.messages.extend(tool_messages)
+        self.outcome.tool_call_failed |= tool_calls.failed
+
+
+def get_completions_stream(
+    openai_client,
+    climbing_data_client: ClimbingDataClient,
+    model: str,
+    messages,
+    max_rounds: int = MAX_TOOL_ROUNDS,
+    timeout_seconds: float = TOOL_LOOP_TIMEOUT_SECONDS,
+    on_status: Optional[Callable[[str], None]] = None,
+    context_budget: Optional[ContextBudget] = None,
+    response_cache: Optional[SemanticResponseCache] = None,
+) -> Iterator[str]:
+    """
+    Yields the model's answer as it streams. The model can call tools for up to max_rounds rounds;
+    each round is streamed too, and every tool call starts as soon as its arguments have arrived,
+    with on_status told about each search. Once timeout_seconds have passed, no further rounds start
+    and unfinished tool calls are reported to the model as timed out. The prompt for every request
+    is fitted to context_budget.
+
+    With a response_cache, a close enough earlier answer is replayed instead, and new answers are
+    added to the cache when every tool call succeeded within the time limit. If the cache lookup
+    fails, the answer is generated without it.
+    """
+    with tracing.span("chat_turn", model=model) as span:
+        for content_delta in _answer_stream(
+            openai_client, climbing_data_client, model, messages, max_rounds, timeout_seconds, on_status,
+            context_budget, response_cache,
+        ):
+            span.mark("ttft_seconds")
+            yield content_delta
+
+
+def _answer_stream(
+    openai_client,
+    climbing_data_client: ClimbingDataClient,
+    model: str,
+    messages,
+    max_rounds: int,
+    timeout_seconds: float,
+    on_status: Optional[Callable[[str], None]],
+    context_budget: Optional[ContextBudget],
+    response_cache: Optional[SemanticResponseCache],
+) -> Iterator[str]:
+    cached_answer, key = lookup_cached_answer(response_cache, messages, model)
+    if cached_answer is not None:
+        yield from replay_answer(cached_answer)
+        return
+    tool_loop = ToolLoop(model, messages, max_rounds, timeout_seconds, context_budget)
+    answer = ""
+    for content_delta in _generate_answer(openai_client, climbing_data_client, tool_loop, on_status):
+        answer += content_delta
+        yield content_delta
+    # an answer built on failed searches or cut short by the deadline is not replayed to later askers
+    if key is not None and answer and tool_loop.outcome.complete:
+        response_cache.store(key, model, answer)
+
+
+def _generate_answer(
+    openai_client,
+    climbing_data_client: ClimbingDataClient,
+    tool_loop: ToolLoop,
+    on_status: Optional[Callable[[str], None]],
+) -> Iterator[str]:
+    for round_number in tool_loop.rounds():
+        request = tool_loop.request(round_number)
+        tool_calls = StreamedToolCalls(climbing_data_client, on_status)
+        content = ""
+        with tool_loop.span(request, round_number) as span:
+            for chunk in openai_client.chat.completions.create(**request):
+                content_delta = tool_loop.read_chunk(chunk, span, tool_calls)
+                if content_delta:
+                    content += content_delta
+                    yield content_delta
+            span.set(tool_calls=[call["name"] for call in tool_calls.calls.values()])
+        if not tool_calls:
+            # the model answered without searching, and that answer has already been streamed
+            return
+        tool_calls.finish()
+        tool_messages = tool_calls.tool_messages(tool_loop.deadline, tool_loop.context_budget.format_tool_result)
+        tool_loop.add_round(tool_calls, content, tool_messages)
+
+    request = tool_loop.request()
+    with tool_loop.span(request) as span:
+        for chunk in openai_client.chat.completions.create(**request):
+            content_delta = tool_loop.read_chunk(chunk, span)
+            if content_delta:
+                yield content_delta
@@ -1,111 +1,260 @@
-import time
+import asyncio
+import logging
 import tiktoken
-from openai import OpenAI
-import json
-from datetime import datetime
+from collections import OrderedDict
+from openai import AsyncOpenAI, OpenAI
+from functools import cache, lru_cache
 from pathlib import Path
+from typing import Iterable, Iterator, Optional
 import os
+from core import tracing
+from core.embedding_cache import EmbeddingCache
+from core.embedding_scheduler import EmbeddingBatch, EmbeddingScheduler
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+# the model's full output size; it can return shorter vectors, see embedding_dimensions()
+EMBEDDING_DIMENSIONS = 1536
 MAX_TOKENS_PER_BATCH = 8191
+EMBEDDING_MAX_IN_FLIGHT = 4
+EMBEDDING_REQUESTS_PER_MINUTE = 3000
+EMBEDDING_TOKENS_PER_MINUTE = 1_000_000
+TOKENIZE_CHUNK_SIZE = 1000
 
+logger = logging.getLogger(__name__)
 
-def get_embeddings_for_batch(text: list[str], openai_client: OpenAI) -> list[list[float]]:
-    # NOTE: fails on empty strings
-    encoding = tiktoken.get_encoding("cl100k_base")
-    try:
-        start_time = time.time()
+
+@cache
+def get_encoding() -> tiktoken.Encoding:
+    # loaded lazily and once per process; building the encoder is expensive
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def encode_batch(texts: list[str]) -> list[list[int]]:
+    return get_encoding().encode_batch(texts, num_threads=os.cpu_count() or 1)
+
+
+def embedding_dimensions() -> Optional[int]:
+    """
+    The description vector size from the EMBEDDING_DIMENSIONS environment variable, or None for
+    the model's full EMBEDDING_DIMENSIONS. Shorter vectors keep the most significant components,
+    so they trade a little recall for a smaller index; queries must be embedded at the same size.
+    """
+    dimensions = os.getenv("EMBEDDING_DIMENSIONS")
+    if not dimensions or int(dimensions) == EMBEDDING_DIMENSIONS:
+        return None
+    return int(dimensions)
+
+
+def _dimensions_kwargs(dimensions: Optional[int]) -> dict:
+    return {} if dimensions is None else {"dimensions": dimensions}
+
+
+def get_embeddings_for_batch(
+    text: list[str] | list[list[int]], openai_client: OpenAI, dimensions: Optional[int] = None,
+) -> list[list[float]]:
+    # NOTE: fails on empty strings. Errors are raised so the scheduler can retry the batch.
+    # Inputs may already be token arrays, in which case they are sent as-is.
+    with tracing.span("openai.embeddings", inputs=len(text)) as span:
         response = openai_client.embeddings.create(
-            model="text-embedding-3-small",
-            input=[encoding.encode(line) for line in text]
+            model=EMBEDDING_MODEL,
+            input=[get_encoding().encode(line) if isinstance(line, str) else line for line in text],
+            **_dimensions_kwargs(dimensions),
         )
-        duration = time.time() - start_time
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] Embedding API call took {duration:.2f}s")
-        return [elt.embedding for elt in response.data]
-    except Exception as e:
-        print(f"Error getting embedding for text: {text}")
-        print(e)
-        return []
-
-_last_progress_time = None
-def _print_progress(start_time, processed_count, total_routes):
-    global _last_progress_time
-    current_time = time.time()
-
-    # Print progress every 10 seconds or every 100 routes
-    if _last_progress_time is None or current_time - _last_progress_time > 10:
-        elapsed_time = current_time - start_time
-        routes_per_second = processed_count / elapsed_time
-        estimated_remaining = (total_routes - processed_count) / routes_per_second if routes_per_second > 0 else 0
-        
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                f"Processed {processed_count}/{total_routes} routes "
-                f"({processed_count/total_routes*100:.1f}%) - "
-                f"Rate: {routes_per_second:.1f} routes/s - "
-                f"Est. remaining: {estimated_remaining/60:.1f} minutes")
-        _last_progress_time = current_time
+        if span.recording and getattr(response, "usage", None) is not None:
+            span.set(prompt_tokens=response.usage.prompt_tokens)
+    return [elt.embedding for elt in response.data]
+
+class QueryEmbedder:
+    """
+    Embeds search queries with the same model as the indexed descriptions, keeping the most recent
+    max_cached query embeddings in memory. Queries are compared case- and whitespace-insensitively,
+    so a repeated phrasing doesn't cost another embedding round trip. dimensions must match the
+    indexed vectors; None is the model's full size.
+    """
+
+    def __init__(self, openai_client: OpenAI, max_cached: int = 1024, dimensions: Optional[int] = None):
+        self.openai_client = openai_client
+        self.dimensions = dimensions
+        self._embed = lru_cache(maxsize=max_cached)(self._embed_uncached)
+
+    def __call__(self, query: str) -> list[float]:
+        return self._embed(" ".join(query.lower().split()))
+
+    def _embed_uncached(self, query: str) -> list[float]:
+        with tracing.span("openai.embeddings", inputs=1):
+            response = self.openai_client.embeddings.create(
+                model=EMBEDDING_MODEL, input=[query], **_dimensions_kwargs(self.dimensions),
+            )
+        return response.data[0].embedding
+
+    def cache_info(self):
+        return self._embed.cache_info()
+
+
+class AsyncQueryEmbedder:
+    """
+    QueryEmbedder for an AsyncOpenAI client. Concurrent requests for the same query, e.g. from
+    several sessions asking the same question, wait on one embedding request; failed ones aren't cached.
+    """
+
+    def __init__(self, openai_client: AsyncOpenAI, max_cached: int = 1024, dimensions: Optional[int] = None):
+        self.openai_client = openai_client
+        self.max_cached = max_cached
+        self.dimensions = dimensions
+        self._embeddings: OrderedDict[str, asyncio.Future] = OrderedDict()
+
+    async def __call__(self, query: str) -> list[float]:
+        key = " ".join(query.lower().split())
+        embedding = self._embeddings.get(key)
+        if embedding is None:
+            embedding = self._embeddings[key] = asyncio.ensure_future(self._embed_uncached(key))
+            if len(self._embeddings) > self.max_cached:
+                self._embeddings.popitem(last=False)
+        else:
+            self._embeddings.move_to_end(key)
+        try:
+            # shielded, so a caller that gives up doesn't cancel the request for the others
+            return await asyncio.shield(embedding)
+        except Exception:
+            if self._embeddings.get(key) is embedding:
+                del self._embeddings[key]
+            raise
+
+    async def _embed_uncached(self, query: str) -> list[float]:
+        with tracing.span("openai.embeddings", inputs=1):
+            response = await self.openai_client.embeddings.create(
+                model=EMBEDDING_MODEL, input=[query], **_dimensions_kwargs(self.dimensions),
+            )
+        return response.data[0].embedding
+
 
 def num_tokens_from_string(string: str) -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
-
-
-def add_embeddings(documents: dict, openai_client: OpenAI):
-    print('Loading embedding cache')
-    embedding_cache = load_embedding_cache()
-    print(f'Loaded embedding cache, found {len(embedding_cache)} cached embeddings')
-    batch_token_size = 0
-    start_time = time.time()
-    batch = []
-    def process_batch():
-        print(f"Getting embeddings for batch of length {len(batch)}")
-        embeddings = get_embeddings_for_batch([doc["description"] for doc in batch], openai_client)
-        for doc, embedding in zip(batch, embeddings):
-            doc['description_vector'] = embedding
-            embedding_cache[doc["description"]] = embedding
-        save_embedding_cache(embedding_cache)
-    for idx, next_doc in enumerate(documents.values()):
-        _print_progress(start_time, idx, len(documents))
-        description = next_doc["description"]
-        next_doc_tokens = num_tokens_from_string(description)
+    return len(get_encoding().encode(string))
+
+
+def _iter_tokenized(documents: Iterable[dict], embedding_cache: EmbeddingCache) -> Iterator[tuple[dict, Optional[list[int]]]]:
+    """
+    Yields (document, tokens) for every document, tokenizing each description that still needs an
+    embedding exactly once with encode_batch. Cache hits are filled in without tokenizing and come
+    back with tokens=None, as do empty descriptions. Descriptions over the input limit are cut at
+    the token limit.
+    """
+    def tokenize_chunk(chunk):
+        for doc, tokens in zip(chunk, encode_batch([doc["description"] for doc in chunk])):
+            if len(tokens) >= MAX_TOKENS_PER_BATCH:
+                # case where one doc alone has too many tokens -> need to truncate description
+                tokens = tokens[:MAX_TOKENS_PER_BATCH - 1]
+                doc['description'] = get_encoding().decode(tokens)
+                if doc['description'] in embedding_cache:
+                    doc['description_vector'] = embedding_cache[doc['description']]
+                    tokens = None
+            yield doc, tokens
+
+    chunk = []
+    for doc in documents:
+        description = doc["description"]
         if description == "":
             # openai api requires non-emptystring description to get an embedding
+            yield doc, None
             continue
-        while next_doc_tokens >= MAX_TOKENS_PER_BATCH:
-            # case where one doc alone has too many tokens -> need to truncate description
-            description = description[0:len(description) // 2]
-            next_doc_tokens = num_tokens_from_string(description)
-        next_doc['description'] = description  # need to update in case we truncated
-
-        if batch_token_size + next_doc_tokens >= MAX_TOKENS_PER_BATCH:
-            process_batch()
-            batch = []
-            batch_token_size = 0
-        
         if description in embedding_cache:
-            next_doc['description_vector'] = embedding_cache[description]
-        else:
-            batch_token_size += next_doc_tokens
+            doc['description_vector'] = embedding_cache[description]
+            yield doc, None
+            continue
+        chunk.append(doc)
+        if len(chunk) >= TOKENIZE_CHUNK_SIZE:
+            yield from tokenize_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from tokenize_chunk(chunk)
+
+
+def _get_embedding_scheduler(openai_client: OpenAI, dimensions: Optional[int] = None) -> EmbeddingScheduler:
+    # the scheduler owns retries, so turn off the client's own retry loop
+    openai_client = openai_client.with_options(max_retries=0)
+    return EmbeddingScheduler(
+        lambda text: get_embeddings_for_batch(text, openai_client, dimensions),
+        max_in_flight=int(os.getenv("EMBEDDING_MAX_IN_FLIGHT", EMBEDDING_MAX_IN_FLIGHT)),
+        requests_per_minute=float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", EMBEDDING_REQUESTS_PER_MINUTE)),
+        tokens_per_minute=float(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", EMBEDDING_TOKENS_PER_MINUTE)),
+    )
+
+
+def embed_documents_stream(
+    documents: Iterable[dict], openai_client: OpenAI, dimensions: Optional[int] = None,
+) -> Iterator[dict]:
+    """
+    Fills in description_vector for each document and yields it once it has one (or once it is
+    clear it won't get one). Documents are consumed lazily and may come back out of order. Vectors
+    have `dimensions` components, or the model's full size for None.
+    """
+    embedding_cache = load_embedding_cache(dimensions)
+    logger.info("Loaded embedding cache, found %d cached embeddings", len(embedding_cache))
+
+    def iter_batches():
+        batch = []
+        batch_tokens = []
+        batch_token_size = 0
+        ready = []
+        for next_doc, next_doc_tokens in _iter_tokenized(documents, embedding_cache):
+            if next_doc_tokens is None:
+                # nothing to embed; hand it back through the scheduler as an empty batch to keep it streaming
+                ready.append(next_doc)
+                if len(ready) >= TOKENIZE_CHUNK_SIZE:
+                    yield EmbeddingBatch([], 0, ready)
+                    ready = []
+                continue
+            if batch_token_size + len(next_doc_tokens) >= MAX_TOKENS_PER_BATCH:
+                yield EmbeddingBatch(batch_tokens, batch_token_size, batch)
+                batch = []
+                batch_tokens = []
+                batch_token_size = 0
             batch.append(next_doc)
-    
-    process_batch() if len(batch) > 0 else None  # process the last batch if nonempty
+            batch_tokens.append(next_doc_tokens)
+            batch_token_size += len(next_doc_tokens)
 
+        if len(batch) > 0:
+            yield EmbeddingBatch(batch_tokens, batch_token_size, batch)
+        if len(ready) > 0:
+            yield EmbeddingBatch([], 0, ready)
 
-def _get_embedding_cache_file_path():
+    scheduler = _get_embedding_scheduler(openai_client, dimensions)
+    for batch, embeddings in scheduler.run(iter_batches()):
+        if batch.inputs:
+            for doc, embedding in zip(batch.items, embeddings):
+                doc['description_vector'] = embedding
+            embedding_cache.add_many([doc['description'] for doc in batch.items], embeddings)
+        yield from batch.items
+
+
+def add_embeddings(documents: dict, openai_client: OpenAI, dimensions: Optional[int] = None):
+    for _ in embed_documents_stream(documents.values(), openai_client, dimensions):
+        pass
+
+
+def _get_data_dir() -> Path:
     data_dir = Path(os.getenv("DATA_DIR", "../../data"))
     data_dir.mkdir(exist_ok=True)
-    return data_dir / "embedding_cache.json"
+    return data_dir
 
 
-def load_embedding_cache() -> dict[str, list[float]]:
-    embedding_cache_file_path = _get_embedding_cache_file_path()
-    if embedding_cache_file_path.exists():
-        return json.load(open(embedding_cache_file_path))
-    else:
-        return {}
+def _get_embedding_cache_file_path():
+    # legacy JSON cache, only read to migrate it into the binary cache
+    return _get_data_dir() / "embedding_cache.json"
 
 
-def save_embedding_cache(embedding_cache: dict[str, list[float]]):
-    embedding_cache_file_path = _get_embedding_cache_file_path()
-    json.dump(embedding_cache, open(embedding_cache_file_path, "w"))
+def load_embedding_cache(dimensions: Optional[int] = None) -> EmbeddingCache:
+    """
+    The embedding cache for vectors of `dimensions` components (None for the model's full size),
+    each size in a directory of its own. A new cache stores vectors as EMBEDDING_CACHE_DTYPE
+    (float32, float16 or int8); an existing one keeps the dtype it was created with.
+    """
+    dtype = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+    if dimensions is not None:
+        return EmbeddingCache(_get_data_dir() / f"embedding_cache_{dimensions}d", dtype=dtype)
+    embedding_cache = EmbeddingCache(_get_data_dir() / "embedding_cache", dtype=dtype)
+    migrated = embedding_cache.migrate_from_json(_get_embedding_cache_file_path())
+    if migrated:
+        logger.info("Migrated %d embeddings from %s", migrated, _get_embedding_cache_file_path())
+    return embedding_cache
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+KEY_SIZE = 16
+VECTOR_DTYPE = np.float32
+# how vectors can be stored on disk; float16 halves the cache and int8 quarters it
+STORAGE_DTYPES = ("float32", "float16", "int8")
+SCALE_DTYPE = np.float32
+
+
+def description_key(description: str) -> bytes:
+    return hashlib.blake2b(description.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+def quantize_int8(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric per-row int8 quantization: returns the int8 rows and each row's scale, so row ≈ int8 row * scale."""
+    matrix = np.asarray(matrix, dtype=VECTOR_DTYPE)
+    scales = np.abs(matrix).max(axis=1) / 127
+    scales[scales == 0] = 1
+    return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(SCALE_DTYPE)
+
+
+def dequantize_int8(rows: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return rows.astype(VECTOR_DTYPE) * np.asarray(scales, dtype=VECTOR_DTYPE)[..., None]
+
+
+class EmbeddingCache:
+    """
+    Append-only embedding store backed by files in `cache_dir`:
+    - vectors.bin: a matrix with one row per cached description, read through mmap
+    - keys.bin: one fixed-size hash of the description per row, in the same order
+    - scales.bin: for int8 storage, each row's float32 scale
+
+    Rows are stored as `dtype` (one of STORAGE_DTYPES) and always read back as float32. A cache
+    keeps the dtype it was created with, recorded in meta.json.
+
+    Appends only write the new rows, so saving is incremental and loading just rebuilds
+    the key -> row dict from keys.bin.
+    """
+
+    def __init__(self, cache_dir: Path, dtype: str = "float32"):
+        if dtype not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported embedding cache dtype {dtype}, expected one of {STORAGE_DTYPES}")
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.cache_dir / "vectors.bin"
+        self._keys_path = self.cache_dir / "keys.bin"
+        self._scales_path = self.cache_dir / "scales.bin"
+        self._meta_path = self.cache_dir / "meta.json"
+
+        self.dim: Optional[int] = None
+        self.dtype = dtype
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text())
+            self.dim = meta["dim"]
+            self.dtype = meta.get("dtype", "float32")
+
+        self._index: dict[bytes, int] = {}
+        self._matrix: Optional[np.memmap] = None
+        self._scales: Optional[np.memmap] = None
+        self._num_rows = 0
+        self._load_index()
+
+    def _row_bytes(self) -> int:
+        return self.dim * np.dtype(self.dtype).itemsize
+
+    def _load_index(self):
+        if self.dim is None or not self._keys_path.exists():
+            return
+        num_keys = self._keys_path.stat().st_size // KEY_SIZE
+        num_vectors = self._vectors_path.stat().st_size // self._row_bytes() if self._vectors_path.exists() else 0
+        # A crash mid-append can leave one file ahead of the others; drop the partial row
+        self._num_rows = min(num_keys, num_vectors)
+        if self.dtype == "int8":
+            scale_bytes = np.dtype(SCALE_DTYPE).itemsize
+            num_scales = self._scales_path.stat().st_size // scale_bytes if self._scales_path.exists() else 0
+            self._num_rows = min(self._num_rows, num_scales)
+            self._truncate(self._scales_path, self._num_rows * scale_bytes)
+        self._truncate(self._keys_path, self._num_rows * KEY_SIZE)
+        self._truncate(self._vectors_path, self._num_rows * self._row_bytes())
+
+        keys = np.fromfile(self._keys_path, dtype=f"S{KEY_SIZE}", count=self._num_rows)
+        # numpy strips trailing NUL bytes from S dtypes, so pad back to the full key size
+        self._index = {key.ljust(KEY_SIZE, b"\0"): row for row, key in enumerate(keys.tolist())}
+
+    @staticmethod
+    def _truncate(path: Path, size: int):
+        if path.exists() and path.stat().st_size > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+
+    def _mapped_matrix(self) -> np.memmap:
+        if self._matrix is None or self._matrix.shape[0] < self._num_rows:
+            self._matrix = np.memmap(
+                self._vectors_path, dtype=self.dtype, mode="r", shape=(self._num_rows, self.dim)
+            )
+            if self.dtype == "int8":
+                self._scales = np.memmap(self._scales_path, dtype=SCALE_DTYPE, mode="r", shape=(self._num_rows,))
+        return self._matrix
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, description: str) -> bool:
+        return description_key(description) in self._index
+
+    def __getitem__(self, description: str) -> np.ndarray:
+        row = self._index[description_key(description)]
+        vector = self._mapped_matrix()[row]
+        if self.dtype == "int8":
+            return dequantize_int8(vector, self._scales[row])
+        if self.dtype != "float32":
+            return vector.astype(VECTOR_DTYPE)
+        return vector
+
+    def vectors(self) -> np.ndarray:
+        """Every cached vector as a float32 matrix, in row order."""
+        if not self._num_rows:
+            return np.empty((0, self.dim or 0), dtype=VECTOR_DTYPE)
+        matrix = self._mapped_matrix()[: self._num_rows]
+        if self.dtype == "int8":
+            return dequantize_int8(matrix, self._scales[: self._num_rows])
+        return np.asarray(matrix, dtype=VECTOR_DTYPE)
+
+    def get(self, description: str) -> Optional[np.ndarray]:
+        if description not in self:
+            return None
+        return self[description]
+
+    def add_many(self, descriptions: Iterable[str], embeddings: Iterable[Iterable[float]]):
+        keys = []
+        rows = []
+        # many routes share a boilerplate description, so a batch can repeat one; only its first copy is written
+        added = set()
+        for description, embedding in zip(descriptions, embeddings):
+            key = description_key(description)
+            if key in self._index or key in added:
+                continue
+            added.add(key)
+            keys.append(key)
+            rows.append(embedding)
+        if not rows:
+            return
+
+        matrix = np.asarray(rows, dtype=VECTOR_DTYPE)
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+            self._meta_path.write_text(json.dumps({"dim": self.dim, "dtype": self.dtype}))
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"Expected embeddings of dimension {self.dim}, got {matrix.shape[1]}")
+
+        scales = None
+        if self.dtype == "int8":
+            matrix, scales = quantize_int8(matrix)
+        else:
+            matrix = matrix.astype(self.dtype, copy=False)
+        # Vectors (and scales) are written before keys so a key on disk always has its row
+        with open(self._vectors_path, "ab") as f:
+            f.write(matrix.tobytes())
+        if scales is not None:
+            with open(self._scales_path, "ab") as f:
+                f.write(scales.tobytes())
+        with open(self._keys_path, "ab") as f:
+            f.write(b"".join(keys))
+
+        for key in keys:
+            self._index[key] = self._num_rows
+            self._num_rows += 1
+
+    def add(self, description: str, embedding: Iterable[float]):
+        self.add_many([description], [embedding])
+
+    def migrate_from_json(self, json_path: Path) -> int:
+        """Imports a legacy {description: embedding} JSON cache, then renames it so it is only read once."""
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return 0
+        with open(json_path) as f:
+            legacy_cache = json.load(f)
+        before = len(self)
+        self.add_many(legacy_cache.keys(), legacy_cache.values())
+        os.replace(json_path, json_path.with_suffix(json_path.suffix + ".migrated"))
+        return len(self) - before
@@ -0,0 +1,177 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import openai
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatch:
+    def __init__(self, inputs: list, num_tokens: int, items: Optional[list] = None):
+        self.inputs = inputs  # what gets sent to the embeddings API
+        self.num_tokens = num_tokens
+        self.items = items if items is not None else []  # caller data, e.g. the documents being embedded
+
+
+class RateLimiter:
+    """Token bucket that refills `limit_per_minute` units evenly over each minute."""
+
+    def __init__(self, limit_per_minute: float):
+        self.capacity = float(limit_per_minute)
+        self.available = self.capacity
+        self.refill_per_second = self.capacity / 60
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self._last_refill) * self.refill_per_second)
+                self._last_refill = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                wait_seconds = (amount - self.available) / self.refill_per_second
+            time.sleep(wait_seconds)
+
+
+class SchedulerStats:
+    def __init__(self):
+        self.start_time = time.time()
+        self.batches = 0
+        self.inputs = 0
+        self.tokens = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def summary(self) -> str:
+        elapsed = max(time.time() - self.start_time, 1e-9)
+        return (f"{self.batches} batches, {self.inputs} inputs, {self.tokens} tokens in {elapsed:.1f}s - "
+                f"{self.inputs / elapsed:.1f} inputs/s, {self.tokens / elapsed:.0f} tokens/s - "
+                f"{self.retries} retries ({self.rate_limited} rate limited)")
+
+
+class EmbeddingScheduler:
+    """
+    Keeps up to `max_in_flight` embedding requests running on a thread pool while staying under
+    the requests-per-minute and tokens-per-minute limits. Failed batches are retried with
+    exponential backoff; a 429 pauses every worker, not just the one that got it.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[list], list],
+        max_in_flight: int = 4,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1_000_000,
+        max_retries: int = 6,
+        base_backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        report_interval_seconds: float = 10.0,
+    ):
+        self.embed_fn = embed_fn
+        self.max_in_flight = max_in_flight
+        self.request_limiter = RateLimiter(requests_per_minute)
+        self.token_limiter = RateLimiter(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.report_interval_seconds = report_interval_seconds
+        self.stats = SchedulerStats()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._last_report_time = time.time()
+
+    def _backoff_seconds(self, attempt: int, error: Exception) -> float:
+        retry_after = None
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.max_backoff_seconds)
+            except ValueError:
+                pass
+        backoff = min(self.base_backoff_seconds * 2 ** attempt, self.max_backoff_seconds)
+        return backoff * (0.5 + random.random() / 2)
+
+    def _wait_if_paused(self):
+        while True:
+            with self._lock:
+                remaining = self._paused_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def _embed_with_retries(self, batch: EmbeddingBatch) -> list:
+        if not batch.inputs:
+            return []
+        attempt = 0
+        while True:
+            self._wait_if_paused()
+            self.request_limiter.acquire(1)
+            self.token_limiter.acquire(batch.num_tokens)
+            try:
+                return self.embed_fn(batch.inputs)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                backoff = self._backoff_seconds(attempt, e)
+                with self._lock:
+                    self.stats.retries += 1
+                    if isinstance(e, openai.RateLimitError):
+                        self.stats.rate_limited += 1
+                        self._paused_until = max(self._paused_until, time.monotonic() + backoff)
+                logger.warning("Embedding batch failed (%s), retrying in %.1fs", type(e).__name__, backoff)
+                if not isinstance(e, openai.RateLimitError):
+                    time.sleep(backoff)
+                attempt += 1
+
+    def _report(self, force: bool = False):
+        now = time.time()
+        if force or now - self._last_report_time > self.report_interval_seconds:
+            logger.info("Embeddings: %s", self.stats.summary())
+            self._last_report_time = now
+
+    def run(self, batches: Iterable[EmbeddingBatch]) -> Iterator[tuple[EmbeddingBatch, list]]:
+        """Yields (batch, embeddings) in completion order; raises if a batch still fails after all retries."""
+        self.stats = SchedulerStats()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            pending: dict[Any, EmbeddingBatch] = {}
+            batch_iter = iter(batches)
+            exhausted = False
+            while pending or not exhausted:
+                # keep the pool full but never queue up more than a couple of batches per worker
+                while not exhausted and len(pending) < self.max_in_flight * 2:
+                    try:
+                        batch = next(batch_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(self._embed_with_retries, batch)] = batch
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = pending.pop(future)
+                    embeddings = future.result()
+                    if batch.inputs:
+                        self.stats.batches += 1
+                        self.stats.inputs += len(batch.inputs)
+                        self.stats.tokens += batch.num_tokens
+                    yield batch, embeddings
+                self._report()
+        self._report(force=True)
@@ -0,0 +1,13 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+
+def haversine_miles(lat, lon, center_lat, center_lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    center_lat, center_lon = math.radians(center_lat), math.radians(center_lon)
+    a = np.sin((lat - center_lat) / 2) ** 2 + np.cos(lat) * math.cos(center_lat) * np.sin((lon - center_lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(a))
@@ -0,0 +1,108 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+YDS = "yds"
+V_SCALE = "v"
+
+# +/- moves an open grade this far within its number, e.g. 5.9+ is 9.3 and V4- is 3.7
+MODIFIER_OFFSET = 0.3
+# 5.10 and up split into letter grades a-d, a quarter of a number apart
+YDS_LETTER_OFFSETS = {"a": 0.0, "b": 0.25, "c": 0.5, "d": 0.75}
+
+_YDS_PATTERN = re.compile(r"^5\.(\d{1,2})(?:([a-d])(?:/([a-d]))?)?([+-])?(?:[-/](\d{1,2})([a-d])?)?$")
+_V_PATTERN = re.compile(r"^V(\d{1,2}|-?EASY|B)([+-])?(?:[-/](\d{1,2})([+-])?)?$")
+
+
+class Grade(NamedTuple):
+    """
+    A grade on a numeric scale that sorts the way climbers would: 5.9 < 5.10a < 5.10- < 5.10 < 5.10d
+    < 5.11a, V-easy < V0 < V4- < V4 < V4-5 < V5. `low` and `high` are the numbers a grade spans
+    (5.10 spans 5.10a to 5.10d, V4 spans V4- to V4+), and `numeric` is its midpoint.
+    Numbers are only comparable within one system.
+    """
+    system: str
+    low: float
+    high: float
+
+    @property
+    def numeric(self) -> float:
+        return round((self.low + self.high) / 2, 3)
+
+
+def _yds_bounds(number: int, letter: Optional[str], modifier: Optional[str]) -> tuple[float, float]:
+    if letter is not None:
+        value = number + YDS_LETTER_OFFSETS[letter]
+        return value, value
+    if number >= 10:
+        low, high = float(number), number + YDS_LETTER_OFFSETS["d"]
+        if modifier == "-":
+            return low, number + YDS_LETTER_OFFSETS["b"]
+        if modifier == "+":
+            return number + YDS_LETTER_OFFSETS["c"], high
+        return low, high
+    if modifier is not None:
+        value = number + (MODIFIER_OFFSET if modifier == "+" else -MODIFIER_OFFSET)
+        return value, value
+    return number - MODIFIER_OFFSET, number + MODIFIER_OFFSET
+
+
+def _v_bounds(number: int, modifier: Optional[str]) -> tuple[float, float]:
+    if modifier is not None:
+        value = number + (MODIFIER_OFFSET if modifier == "+" else -MODIFIER_OFFSET)
+        return value, value
+    return number - MODIFIER_OFFSET, number + MODIFIER_OFFSET
+
+
+@lru_cache(maxsize=4096)
+def parse_grade(grade: Optional[str]) -> Optional[Grade]:
+    """
+    Parses YDS (5.7, 5.10a, 5.10b/c, 5.11-, 5.10-11) and V-scale (V4, V4+, V4-5, V-easy) grades.
+    Anything after the first space, like a PG13 or R rating, is ignored. Returns None for grades
+    in other systems or that can't be read.
+    """
+    if not isinstance(grade, str) or not grade:
+        return None
+    text = grade.strip().split(" ")[0]
+    if match := _YDS_PATTERN.match(text.lower()):
+        number, letter, second_letter, modifier, upper_number, upper_letter = match.groups()
+        low, high = _yds_bounds(int(number), letter, modifier)
+        if second_letter is not None:
+            high = _yds_bounds(int(number), second_letter, None)[1]
+        if upper_number is not None:
+            high = _yds_bounds(int(upper_number), upper_letter, None)[1]
+        return Grade(YDS, low, high)
+    if match := _V_PATTERN.match(text.upper()):
+        number, modifier, upper_number, upper_modifier = match.groups()
+        if number in ("EASY", "-EASY", "B"):
+            # V-easy and VB sit one grade below V0
+            low, high = _v_bounds(-1, modifier)
+        else:
+            low, high = _v_bounds(int(number), modifier)
+        if upper_number is not None:
+            high = _v_bounds(int(upper_number), upper_modifier)[1]
+        return Grade(V_SCALE, low, high)
+    return None
+
+
+def grade_range(grade_min: Optional[str] = None, grade_max: Optional[str] = None) -> tuple[str, Optional[float], Optional[float]]:
+    """
+    Returns (system, low, high) covering every grade from grade_min to grade_max, inclusive. Either
+    end may be None for an open range. Raises ValueError for unreadable grades or mixed systems.
+    """
+    bounds = {}
+    for name, grade in (("grade_min", grade_min), ("grade_max", grade_max)):
+        if grade is None:
+            continue
+        parsed = parse_grade(grade)
+        if parsed is None:
+            raise ValueError(f"Unrecognized {name} {grade!r}; use a YDS grade like 5.10a or a V grade like V4")
+        bounds[name] = parsed
+    if not bounds:
+        raise ValueError("grade_range needs grade_min or grade_max")
+    systems = {grade.system for grade in bounds.values()}
+    if len(systems) > 1:
+        raise ValueError(f"grade_min {grade_min!r} and grade_max {grade_max!r} are in different grading systems")
+    low = bounds["grade_min"].low if "grade_min" in bounds else None
+    high = bounds["grade_max"].high if "grade_max" in bounds else None
+    return systems.pop(), low, high
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+# Fields that are derived from the others and so don't take part in the content hash
+UNHASHED_FIELDS = ("description_vector", "content_hash")
+
+
+def content_hash(doc: dict) -> str:
+    content = {key: value for key, value in doc.items() if key not in UNHASHED_FIELDS}
+    return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def mappings_hash(mappings: dict) -> str:
+    return hashlib.sha1(json.dumps(mappings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LoadManifest:
+    """
+    Records which routes (and which version of each, by content hash) a load put in which index.
+
+    The manifest is a JSON snapshot plus an append-only journal next to it. record() and forget()
+    append to the journal as a load progresses, so an interrupted load can resume from the last
+    acknowledged route; save() folds the journal into a new snapshot.
+    """
+
+    def __init__(self, path: Path, index_name: str, mappings_hash: str, routes: Optional[dict[str, str]] = None):
+        self.path = Path(path)
+        self.index_name = index_name
+        self.mappings_hash = mappings_hash
+        self.routes = routes if routes is not None else {}
+        self._seen: set[str] = set()
+        self._journal = None
+
+    @property
+    def journal_path(self) -> Path:
+        return self.path.with_suffix(self.path.suffix + ".journal")
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["LoadManifest"]:
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            data = json.load(f)
+        manifest = cls(path, data["index_name"], data["mappings_hash"], data["routes"])
+        manifest._replay_journal()
+        return manifest
+
+    def _replay_journal(self):
+        if not self.journal_path.exists():
+            return
+        with open(self.journal_path) as f:
+            for line in f:
+                # a crash can leave a half-written last line, which is skipped
+                if not line.endswith("\n"):
+                    break
+                fields = line.rstrip("\n").split("\t")
+                if fields[0] == "+" and len(fields) == 3:
+                    self.routes[fields[1]] = fields[2]
+                elif fields[0] == "-" and len(fields) == 2:
+                    self.routes.pop(fields[1], None)
+
+    def _append_to_journal(self, lines: list[str]):
+        if not lines:
+            return
+        if self._journal is None:
+            self._journal = open(self.journal_path, "a")
+        self._journal.write("".join(lines))
+        self._journal.flush()
+
+    def close(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def save(self):
+        self.close()
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"index_name": self.index_name, "mappings_hash": self.mappings_hash, "routes": self.routes}, f)
+        os.replace(tmp_path, self.path)
+        self.journal_path.unlink(missing_ok=True)
+
+    def delete(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self.journal_path.unlink(missing_ok=True)
+
+    def changed_documents(self, documents: Iterable[dict]) -> Iterator[dict]:
+        """Lazily yields new or changed documents, remembering every route_id seen for removed_route_ids()."""
+        self._seen = set()
+        for doc in documents:
+            route_id = str(doc["route_id"])
+            self._seen.add(route_id)
+            if self.routes.get(route_id) != doc["content_hash"]:
+                yield doc
+
+    def removed_route_ids(self) -> list[str]:
+        """Route_ids in the manifest that the last changed_documents() pass did not see."""
+        return [route_id for route_id in self.routes if route_id not in self._seen]
+
+    def diff(self, documents: Iterable[dict]) -> tuple[list[dict], list[str]]:
+        """Returns (new or changed documents, route_ids that are no longer in the source)."""
+        changed = list(self.changed_documents(documents))
+        return changed, self.removed_route_ids()
+
+    def record(self, documents: Iterable[dict]):
+        lines = []
+        for doc in documents:
+            route_id = str(doc["route_id"])
+            self.routes[route_id] = doc["content_hash"]
+            lines.append(f"+\t{route_id}\t{doc['content_hash']}\n")
+        self._append_to_journal(lines)
+
+    def forget(self, route_ids: Iterable[str]):
+        lines = []
+        for route_id in route_ids:
+            route_id = str(route_id)
+            self.routes.pop(route_id, None)
+            lines.append(f"-\t{route_id}\n")
+        self._append_to_journal(lines)
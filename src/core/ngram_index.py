@@ -0,0 +1,84 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercases, strips accents and collapses punctuation/whitespace to single spaces."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", text.lower()).strip()
+
+
+def ngrams(text: str, n: int = 3) -> set[str]:
+    padded = f" {normalize(text)} "
+    if len(padded.strip()) == 0:
+        return set()
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+
+class NGramIndex:
+    """
+    Inverted index from character n-grams to row ids, for typo-tolerant name matching.
+
+    search() scores rows by how much of the query's n-grams they contain, so "pearl" finds
+    "The Pearl" and "teh pearl" still ranks it first.
+    """
+
+    def __init__(self, texts: list[str], n: int = 3):
+        self.n = n
+        self.num_ngrams = np.zeros(len(texts), dtype=np.int32)
+        postings: dict[str, list[int]] = defaultdict(list)
+        for row, text in enumerate(texts):
+            grams = ngrams(text, n)
+            self.num_ngrams[row] = len(grams)
+            for gram in grams:
+                postings[gram].append(row)
+        self.postings = {gram: np.asarray(rows, dtype=np.int32) for gram, rows in postings.items()}
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """The index as flat arrays, e.g. for np.savez; from_arrays restores it without re-tokenizing the texts."""
+        grams = list(self.postings)
+        return {
+            "n": np.asarray(self.n),
+            "num_ngrams": self.num_ngrams,
+            "grams": np.asarray(grams, dtype=f"U{self.n}"),
+            "offsets": np.cumsum([0] + [len(self.postings[gram]) for gram in grams]),
+            "rows": np.concatenate([self.postings[gram] for gram in grams]) if grams else np.empty(0, dtype=np.int32),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "NGramIndex":
+        index = cls.__new__(cls)
+        index.n = int(arrays["n"])
+        index.num_ngrams = np.asarray(arrays["num_ngrams"], dtype=np.int32)
+        rows, offsets = np.asarray(arrays["rows"], dtype=np.int32), arrays["offsets"]
+        index.postings = {
+            gram: rows[start:end] for gram, start, end in zip(arrays["grams"].tolist(), offsets[:-1], offsets[1:])
+        }
+        return index
+
+    def search(self, query: str, min_containment: float = 0.6) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (rows, scores) of rows containing at least min_containment of the query's n-grams.
+        Scores are the Dice coefficient of the two n-gram sets, so closer lengths rank higher.
+        """
+        query_grams = ngrams(query, self.n)
+        matched = [self.postings[gram] for gram in query_grams if gram in self.postings]
+        if not query_grams or not matched:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        postings = np.concatenate(matched)
+        if len(postings) * 8 > len(self.num_ngrams):
+            # common n-grams like "the" match much of the index; counting every row beats sorting them
+            shared = np.bincount(postings, minlength=len(self.num_ngrams))
+            rows = np.flatnonzero(shared).astype(np.int32)
+            shared = shared[rows]
+        else:
+            rows, shared = np.unique(postings, return_counts=True)
+        keep = shared >= min_containment * len(query_grams)
+        rows, shared = rows[keep], shared[keep]
+        scores = 2 * shared / (len(query_grams) + self.num_ngrams[rows])
+        return rows, scores.astype(np.float32)
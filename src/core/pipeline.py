@@ -0,0 +1,126 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator
+
+from core import tracing
+
+_DONE = object()
+_POLL_SECONDS = 0.1
+
+logger = logging.getLogger(__name__)
+
+
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.start_time = None
+
+    def rate(self) -> float:
+        if self.start_time is None:
+            return 0.0
+        return self.items / max(time.time() - self.start_time, 1e-9)
+
+
+class Pipeline:
+    """
+    Runs a chain of generator stages in their own threads, connected by bounded queues.
+
+    Each stage is a function that takes an iterator of items and yields items for the next stage.
+    A full queue blocks the stage feeding it, so a slow stage (e.g. embedding) throttles the ones
+    before it and memory stays flat no matter how big the source is. An exception in any stage
+    stops the whole pipeline and is re-raised from run().
+    """
+
+    def __init__(self, source: Iterable, queue_size: int = 1000, report_interval_seconds: float = 10.0):
+        self.source = source
+        self.queue_size = queue_size
+        self.report_interval_seconds = report_interval_seconds
+        self.stages: list[tuple[str, Callable[[Iterator], Iterator]]] = []
+        self.stats: list[StageStats] = []
+        self._queues: list[queue.Queue] = []
+        self._stop = threading.Event()
+        self._error = None
+
+    def add_stage(self, name: str, fn: Callable[[Iterator], Iterator]) -> "Pipeline":
+        self.stages.append((name, fn))
+        return self
+
+    def _put(self, q: queue.Queue, item: Any):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _iter_queue(self, q: queue.Queue) -> Iterator:
+        while not self._stop.is_set():
+            try:
+                item = q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+    def _run_stage(self, index: int):
+        name, fn = self.stages[index]
+        stats = self.stats[index]
+        inputs = iter(self.source) if index == 0 else self._iter_queue(self._queues[index - 1])
+        output = self._queues[index]
+        try:
+            with tracing.span(f"etl.{name}") as span:
+                stats.start_time = time.time()
+                for item in fn(inputs):
+                    stats.items += 1
+                    self._put(output, item)
+                    if self._stop.is_set():
+                        break
+                else:
+                    self._put(output, _DONE)
+                span.set(items=stats.items)
+        except BaseException as e:
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+
+    def report(self):
+        stages = " | ".join(
+            f"{stats.name}: {stats.items} ({stats.rate():.1f}/s, queued {q.qsize()})"
+            for stats, q in zip(self.stats, self._queues)
+        )
+        logger.info(stages)
+
+    def run(self) -> list[StageStats]:
+        self.stats = [StageStats(name) for name, _ in self.stages]
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [
+            threading.Thread(target=self._run_stage, args=(i,), name=f"pipeline-{name}", daemon=True)
+            for i, (name, _) in enumerate(self.stages)
+        ]
+        for thread in threads:
+            thread.start()
+
+        last_report_time = time.time()
+        final_queue = self._queues[-1]
+        while not self._stop.is_set():
+            try:
+                item = final_queue.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                item = None
+            if item is _DONE:
+                break
+            if time.time() - last_report_time > self.report_interval_seconds:
+                self.report()
+                last_report_time = time.time()
+
+        self._stop.set()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+        self.report()
+        return self.stats
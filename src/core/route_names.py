@@ -0,0 +1,190 @@
+import logging
+import os
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from core.geo import haversine_miles
+from core.ngram_index import NGramIndex, normalize
+
+# a query this short only matches names exactly, not as a prefix
+MIN_PREFIX_CHARS = 3
+# the most distinct names a lookup expands into routes, best scores first
+MAX_NAME_MATCHES = 100
+MIN_CONTAINMENT = 0.6
+# names scoring the same to this many decimals are equally good matches, ordered by distance
+SCORE_DECIMALS = 2
+
+logger = logging.getLogger(__name__)
+
+
+def route_name_index_path() -> Path:
+    return Path(os.getenv("DATA_DIR", "data")) / "route_name_index.npz"
+
+
+def load_route_name_index(path: Path) -> Optional["RouteNameIndex"]:
+    """RouteNameIndex.load(path), or None, with a warning, when the loader hasn't written one there."""
+    if not Path(path).exists():
+        logger.warning("No route name index at %s, lookup_route will search Elasticsearch", path)
+        return None
+    return RouteNameIndex.load(path)
+
+
+class RouteNameIndex:
+    """
+    Resolves route names, as a user would type them, to route_ids with their sector and location,
+    without a round trip to Elasticsearch.
+
+    Names are normalized (core.ngram_index.normalize) and kept sorted and distinct, each pointing at
+    the routes that share it. lookup() binary-searches the sorted names for an exact match, then for
+    names the query starts (for queries of MIN_PREFIX_CHARS or more), and only when neither finds a
+    name does it search an NGramIndex of the distinct names for misspellings. Many routes share a
+    name, so matches are ordered by name score, then by distance from `location`.
+
+    The loader builds the index from the transformed documents and saves it with save(); the
+    Elasticsearch clients load it with load_route_name_index() and again whenever the index they
+    search changes version.
+    """
+
+    def __init__(
+        self,
+        route_names: np.ndarray,
+        route_ids: np.ndarray,
+        sector_ids: np.ndarray,
+        sector_names: np.ndarray,
+        lat: np.ndarray,
+        lon: np.ndarray,
+        names: np.ndarray,
+        name_routes: np.ndarray,
+        name_offsets: np.ndarray,
+        name_index: NGramIndex,
+    ):
+        self.route_names = route_names
+        self.route_ids = route_ids
+        self.sector_ids = sector_ids
+        self.sector_names = sector_names
+        self.lat = lat
+        self.lon = lon
+        # distinct normalized names, sorted; name i's routes are name_routes[name_offsets[i]:name_offsets[i + 1]]
+        self.names = names
+        self.name_routes = name_routes
+        self.name_offsets = name_offsets
+        self.name_lengths = np.char.str_len(names)
+        self.name_index = name_index
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[dict]) -> "RouteNameIndex":
+        rows = [
+            (
+                doc["route_name"] or "", doc["route_id"], doc["sector_id"] or "", doc["sector_name"] or "",
+                doc["location"]["lat"] if doc.get("location") else np.nan,
+                doc["location"]["lon"] if doc.get("location") else np.nan,
+            )
+            for doc in documents
+        ]
+        route_names, route_ids, sector_ids, sector_names, lat, lon = zip(*rows) if rows else ([],) * 6
+        route_ids = np.asarray(route_ids)
+        if route_ids.dtype == object:
+            route_ids = route_ids.astype(str)
+        names, name_codes = np.unique(np.array([normalize(name) for name in route_names], dtype=str), return_inverse=True)
+        name_routes = np.argsort(name_codes, kind="stable")
+        return cls(
+            route_names=np.array(route_names, dtype=str),
+            route_ids=route_ids,
+            sector_ids=np.array(sector_ids, dtype=str),
+            sector_names=np.array(sector_names, dtype=str),
+            lat=np.array(lat, dtype=np.float64),
+            lon=np.array(lon, dtype=np.float64),
+            names=names,
+            name_routes=name_routes,
+            name_offsets=np.searchsorted(name_codes[name_routes], np.arange(len(names) + 1)),
+            name_index=NGramIndex(names.tolist()),
+        )
+
+    def save(self, path: Path):
+        # arrays only, so loading needs no pickle; written aside and renamed so readers never see half a file
+        path = Path(path)
+        partial_path = path.with_name(path.name + ".partial")
+        with open(partial_path, "wb") as f:
+            np.savez(
+                f,
+                route_names=self.route_names, route_ids=self.route_ids, sector_ids=self.sector_ids,
+                sector_names=self.sector_names, lat=self.lat, lon=self.lon, names=self.names,
+                name_routes=self.name_routes, name_offsets=self.name_offsets,
+                **{f"ngram_{key}": value for key, value in self.name_index.to_arrays().items()},
+            )
+        os.replace(partial_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "RouteNameIndex":
+        with np.load(path, allow_pickle=False) as arrays:
+            arrays = dict(arrays)
+        ngram_keys = [key for key in arrays if key.startswith("ngram_")]
+        name_index = NGramIndex.from_arrays({key[len("ngram_"):]: arrays.pop(key) for key in ngram_keys})
+        return cls(**arrays, name_index=name_index)
+
+    def __len__(self) -> int:
+        return len(self.route_ids)
+
+    def lookup(self, route_name: str, location: Optional[dict] = None, size: Optional[int] = None) -> dict:
+        """
+        Returns {"total", "routes"}: how many routes matched, and the best `size` of them (all of
+        them by default; the clients pass their lookup_route size) as
+        {route_name, route_id, sector_id, sector_name, location, score}, plus distance_miles when a
+        location is given. A score of 1 is an exact match of the normalized name.
+        Without a location, equally good matches keep the order the documents were indexed in.
+        """
+        query = normalize(route_name)
+        if not query:
+            return {"total": 0, "routes": []}
+        codes, scores = self._match_names(query)
+        if len(codes) > MAX_NAME_MATCHES:
+            best = np.argsort(-scores, kind="stable")[:MAX_NAME_MATCHES]
+            codes, scores = codes[best], scores[best]
+
+        starts, ends = self.name_offsets[codes], self.name_offsets[codes + 1]
+        rows = np.concatenate([self.name_routes[start:end] for start, end in zip(starts, ends)] or [np.empty(0, dtype=np.int64)])
+        route_scores = np.repeat(scores, ends - starts)
+        distances = None
+        if location is not None:
+            distances = haversine_miles(self.lat[rows], self.lon[rows], location["lat"], location["lon"])
+        # routes without a location sort last among equally good names
+        order = np.lexsort((
+            np.nan_to_num(distances, nan=np.inf) if distances is not None else rows,
+            -np.round(route_scores, SCORE_DECIMALS),
+        ))[:size]
+        return {
+            "total": len(rows),
+            "routes": [
+                self._route(rows[i], route_scores[i], None if distances is None else distances[i]) for i in order
+            ],
+        }
+
+    def _match_names(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        """(name codes, scores) of the name equal to query, else of names it prefixes, else of names sharing its trigrams."""
+        start = int(np.searchsorted(self.names, query))
+        if start < len(self.names) and self.names[start] == query:
+            return np.array([start]), np.ones(1)
+        if len(query) >= MIN_PREFIX_CHARS:
+            # every name starting with the query sorts between it and the query followed by the highest character
+            end = int(np.searchsorted(self.names, query + "\uffff"))
+            if end > start:
+                codes = np.arange(start, end)
+                # scored by how much of the name the query covers
+                return codes, len(query) / self.name_lengths[codes]
+        return self.name_index.search(query, MIN_CONTAINMENT)
+
+    def _route(self, row: int, score: float, distance: Optional[float]) -> dict:
+        has_location = not np.isnan(self.lat[row])
+        route = {
+            "route_name": str(self.route_names[row]),
+            "route_id": self.route_ids[row].item(),
+            "sector_id": str(self.sector_ids[row]) or None,
+            "sector_name": str(self.sector_names[row]) or None,
+            "location": {"lat": float(self.lat[row]), "lon": float(self.lon[row])} if has_location else None,
+            "score": round(float(score), 3),
+        }
+        if distance is not None:
+            route["distance_miles"] = None if np.isnan(distance) else round(float(distance), 1)
+        return route
@@ -0,0 +1,111 @@
+import math
+from typing import Iterable, Optional
+
+import numpy as np
+
+from core.grades import grade_range, parse_grade
+
+# more than log1p of any sector's route count, so a climber covered outweighs any number of extra routes
+COVERAGE_TIER = 100
+
+
+def build_sector_documents(documents: Iterable[dict]) -> list[dict]:
+    """
+    Summarizes route documents into one document per sector_id, skipping routes without one: the centroid of its routes'
+    locations, its route count, routes per style, mean route rating, and grade_buckets, a list of
+    {style, grade, grade_system, grade_numeric, count} entries, one per style and grade.
+    """
+    # only the loader and LocalClimbingDataClient build sectors; the app's search clients skip the pandas import
+    import pandas as pd
+
+    rows = [
+        (
+            doc["sector_id"], doc["sector_name"], doc["style"], doc["grade"], doc["rating"],
+            doc["location"]["lat"] if doc.get("location") else np.nan,
+            doc["location"]["lon"] if doc.get("location") else np.nan,
+        )
+        for doc in documents
+    ]
+    routes = pd.DataFrame(rows, columns=["sector_id", "sector_name", "style", "grade", "rating", "lat", "lon"])
+    routes["rating"] = pd.to_numeric(routes["rating"], errors="coerce")
+    # a missing sector_id would become a sector with a NaN _id, which isn't valid JSON
+    routes = routes[routes["sector_id"].notna() & (routes["sector_id"] != "")]
+
+    sectors = routes.groupby("sector_id", sort=True).agg(
+        sector_name=("sector_name", "first"),
+        route_count=("sector_id", "size"),
+        rating=("rating", "mean"),
+        lat=("lat", "mean"),
+        lon=("lon", "mean"),
+    )
+    style_counts_by_sector: dict[str, dict] = {}
+    for (sector_id, style), count in routes.groupby(["sector_id", "style"], dropna=False).size().items():
+        style_counts_by_sector.setdefault(sector_id, {})[style] = int(count)
+    buckets_by_sector: dict[str, list] = {}
+    for (sector_id, style, grade), count in routes.groupby(["sector_id", "style", "grade"], dropna=False).size().items():
+        parsed = parse_grade(grade)
+        buckets_by_sector.setdefault(sector_id, []).append({
+            "style": style if isinstance(style, str) else None,
+            "grade": grade if isinstance(grade, str) else None,
+            "grade_system": parsed.system if parsed else None,
+            "grade_numeric": parsed.numeric if parsed else None,
+            "count": int(count),
+        })
+
+    sector_documents = []
+    for sector_id, sector in sectors.iterrows():
+        has_location = not (math.isnan(sector["lat"]) or math.isnan(sector["lon"]))
+        sector_documents.append({
+            "sector_id": sector_id,
+            "sector_name": None if pd.isna(sector["sector_name"]) else sector["sector_name"],
+            "location": {"lat": float(sector["lat"]), "lon": float(sector["lon"])} if has_location else None,
+            "route_count": int(sector["route_count"]),
+            "rating": None if math.isnan(sector["rating"]) else round(float(sector["rating"]), 2),
+            "style_counts": style_counts_by_sector[sector_id],
+            "grade_buckets": buckets_by_sector[sector_id],
+        })
+    return sector_documents
+
+
+def climber_filter(climber: dict) -> tuple[Optional[str], str, Optional[float], Optional[float]]:
+    """Returns (style, grade_system, low, high) for a climber given as {grade_min, grade_max, style}."""
+    grade_system, low, high = grade_range(climber.get("grade_min"), climber.get("grade_max"))
+    return climber.get("style"), grade_system, low, high
+
+
+def _bucket_matches(bucket: dict, style, grade_system, low, high) -> bool:
+    return (
+        (style is None or bucket["style"] == style)
+        and bucket["grade_system"] == grade_system
+        and bucket["grade_numeric"] is not None
+        and (low is None or bucket["grade_numeric"] >= low)
+        and (high is None or bucket["grade_numeric"] <= high)
+    )
+
+
+def climber_route_counts(grade_buckets: list[dict], climbers: list[dict]) -> list[int]:
+    """How many of a sector's routes suit each climber."""
+    filters = [climber_filter(climber) for climber in climbers]
+    return [
+        sum(bucket["count"] for bucket in grade_buckets if _bucket_matches(bucket, *climber))
+        for climber in filters
+    ]
+
+
+def coverage_score(grade_buckets: list[dict], climbers: list[dict]) -> float:
+    """
+    COVERAGE_TIER for each climber the sector has routes for, plus log1p of how many routes suit
+    each climber. Covering more of the party always ranks a sector higher; among sectors covering
+    as many climbers, each extra route for a climber adds less than the last, so five routes for
+    each of two climbers outrank twenty for one. ElasticClient.search_sectors scores the same way.
+    """
+    return sum(COVERAGE_TIER + math.log1p(count) for count in climber_route_counts(grade_buckets, climbers) if count)
+
+
+def grade_histogram(grade_buckets: list[dict]) -> dict[str, dict[str, int]]:
+    """Route counts per style and grade, hardest grades last."""
+    ordered = sorted(grade_buckets, key=lambda bucket: (bucket["grade_numeric"] is None, bucket["grade_numeric"] or 0))
+    histogram: dict[str, dict[str, int]] = {}
+    for bucket in ordered:
+        histogram.setdefault(bucket["style"], {})[bucket["grade"]] = bucket["count"]
+    return histogram
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+
+logger = logging.getLogger("climbing_guide.trace")
+
+# upper bounds of the latency histogram buckets, from a cached search to a slow LLM answer
+DURATION_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "climbing_guide"
+_METRIC_NAME_UNSAFE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Metrics:
+    """
+    Thread-safe latency histograms and counters, rendered in the Prometheus text format.
+
+    Every finished span is observed in the `<span name>_seconds` histogram. Span attributes ending
+    in `_seconds` (e.g. time to first token) get a histogram of their own, and attributes ending in
+    `_tokens` or `_count` are added to a `_total` counter.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DURATION_BUCKETS_SECONDS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms: dict[str, list] = {}
+        self._counters: dict[str, float] = defaultdict(float)
+
+    @staticmethod
+    def metric_name(*parts: str) -> str:
+        return _METRIC_NAME_UNSAFE.sub("_", "_".join((METRIC_PREFIX, *parts)))
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            # per-bucket counts, then the sum and count of all observations
+            histogram = self._histograms.setdefault(name, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def record_span(self, span: "Span"):
+        self.observe(self.metric_name(span.name, "seconds"), span.duration)
+        if "error" in span.attributes:
+            self.increment(self.metric_name(span.name, "errors_total"))
+        for key, value in span.attributes.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key.endswith("_seconds"):
+                self.observe(self.metric_name(span.name, key), value)
+            elif key.endswith("_tokens") or key.endswith("_count"):
+                self.increment(self.metric_name(span.name, key, "total"), value)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (bucket_counts, total, count) in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{le="+Inf"}} {count}')
+                lines.append(f"{name}_sum {total}")
+                lines.append(f"{name}_count {count}")
+            for name, value in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """
+    One timed operation. Use as a context manager; attributes set while it runs are logged with
+    its duration when it ends, along with the exception type if it raised.
+    """
+
+    recording = True
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None and issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):
+            # a streamed response whose reader stopped early
+            self.attributes["cancelled"] = True
+        elif exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer.record(self)
+        return False
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def mark(self, attribute: str):
+        """Records the seconds since the span started as `attribute`, the first time it is called."""
+        if attribute not in self.attributes:
+            self.attributes[attribute] = time.perf_counter() - self.start
+
+
+class _NoopSpan:
+    """Stands in for a Span while tracing is disabled, so instrumented code costs a method call."""
+
+    recording = False
+    attributes: dict = {}
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def mark(self, attribute: str):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    Creates spans and reports each finished one as a JSON log line on the `climbing_guide.trace`
+    logger when log_spans is set, and to the histograms and counters of metrics when given. With
+    neither, the tracer hands out NOOP_SPAN and records nothing.
+    """
+
+    def __init__(self, log_spans: bool = False, metrics: Optional[Metrics] = None):
+        self.log_spans = log_spans
+        self.metrics = metrics
+
+    @property
+    def enabled(self) -> bool:
+        return self.log_spans or self.metrics is not None
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def record(self, span: Span):
+        if self.log_spans and logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(
+                {"span": span.name, "duration_ms": round(span.duration * 1000, 3), **span.attributes}, default=str,
+            ))
+        if self.metrics is not None:
+            self.metrics.record_span(span)
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """Starts a span on the process-wide tracer; see configure()."""
+    return tracer.span(name, **attributes)
+
+
+def configure(log_spans: bool, metrics_port: Optional[int] = None) -> Tracer:
+    """
+    Sets up the process-wide tracer. Logged spans go to stderr unless the trace logger already has
+    handlers. With a metrics_port, a Prometheus endpoint is served at /metrics.
+    """
+    tracer.log_spans = log_spans
+    if log_spans and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    if metrics_port is not None:
+        tracer.metrics = tracer.metrics or Metrics()
+        start_metrics_server(tracer.metrics, metrics_port)
+    return tracer
+
+
+def configure_from_env() -> Tracer:
+    """Configures tracing from the TRACING (any non-empty value but 0) and METRICS_PORT environment variables."""
+    metrics_port = os.environ.get("METRICS_PORT")
+    return configure(
+        log_spans=os.environ.get("TRACING", "0") not in ("", "0"),
+        metrics_port=int(metrics_port) if metrics_port else None,
+    )
+
+
+def start_metrics_server(metrics: Metrics, port: int, host: str = "0.0.0.0"):
+    """Serves metrics.render() at /metrics from a daemon thread, returning the ThreadingHTTPServer."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # scrapes every few seconds would drown out the span logs
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,71 @@
+import numpy as np
+
+from core.embedding_cache import dequantize_int8, quantize_int8
+
+# bytes per dimension as each representation is held in the kNN index; bbq adds a few floats per vector
+BYTES_PER_DIMENSION = {"float32": 4, "float16": 2, "int8": 1, "int4": 0.5, "bbq": 1 / 8}
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def shorten_embeddings(matrix: np.ndarray, dimensions: int) -> np.ndarray:
+    """
+    The first `dimensions` components of each vector, renormalized. For text-embedding-3 models
+    this is what the API's dimensions parameter returns, so shorter sizes can be evaluated from
+    full-size vectors without embedding anything again.
+    """
+    return normalize(np.asarray(matrix)[:, :dimensions])
+
+
+def quantize(matrix: np.ndarray, representation: str) -> np.ndarray:
+    """
+    Round-trips vectors through a lower-precision representation and returns what the search
+    would then compare. int8 and int4 use a symmetric scale per vector, close to what
+    Elasticsearch's scalar quantization keeps; bbq is approximated by each component's sign, which
+    is stricter than the corrected binary codes Elasticsearch uses, so its recall is a lower bound.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if representation == "float32":
+        return matrix
+    if representation == "float16":
+        return matrix.astype(np.float16).astype(np.float32)
+    if representation == "int8":
+        return dequantize_int8(*quantize_int8(matrix))
+    if representation == "int4":
+        scales = np.abs(matrix).max(axis=1, keepdims=True) / 7
+        scales[scales == 0] = 1
+        return np.clip(np.round(matrix / scales), -8, 7) * scales
+    if representation == "bbq":
+        return normalize(np.where(matrix >= 0, 1.0, -1.0).astype(np.float32))
+    raise ValueError(f"Unknown representation {representation}, expected one of {tuple(BYTES_PER_DIMENSION)}")
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    """Row indices of each query's k nearest corpus vectors by dot product (cosine for unit vectors), best first."""
+    scores = np.asarray(queries) @ np.asarray(corpus).T
+    k = min(k, scores.shape[1])
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def rescored_top_k(queries: np.ndarray, corpus: np.ndarray, rescore_corpus: np.ndarray, k: int, oversample: float) -> np.ndarray:
+    """
+    top_k over `corpus`, taking k * oversample candidates and reranking them by `rescore_corpus`,
+    the way a quantized kNN search rescores with the original float vectors.
+    """
+    candidates = top_k(queries, corpus, max(k, int(k * oversample)))
+    scores = np.einsum("qd,qcd->qc", np.asarray(queries), np.asarray(rescore_corpus)[candidates])
+    order = np.argsort(-scores, axis=1)[:, :k]
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def recall_at_k(expected: np.ndarray, found: np.ndarray) -> float:
+    """The mean share of each query's expected top-k ids that were found, compared as sets."""
+    k = expected.shape[1]
+    return float(np.mean([len(set(e) & set(f[:k])) / k for e, f in zip(expected.tolist(), found.tolist())]))
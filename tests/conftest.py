@@ -0,0 +1,67 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+
+
+class FakeEncoding:
+    """Stands in for tiktoken's cl100k_base, which can't be downloaded offline: one token per character."""
+
+    def encode(self, text):
+        return [ord(c) for c in text]
+
+    def encode_batch(self, texts, num_threads=1):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+@pytest.fixture
+def fake_tiktoken():
+    # core.completion imports get_encoding by name, so both modules are patched
+    encoding = FakeEncoding()
+    with patch("core.embedding.get_encoding", return_value=encoding), \
+            patch("core.completion.get_encoding", return_value=encoding):
+        yield encoding
+
+
+class ChatChunks:
+    """Builds streamed chat completion chunks shaped like the OpenAI SDK's."""
+
+    @staticmethod
+    def chunk(content=None, tool_calls=None):
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+    @classmethod
+    def tool_calls(cls, index, call_id, arguments, name="search_climbs"):
+        # arguments arrive split across deltas, the way the API streams them
+        encoded = json.dumps(arguments)
+        middle = len(encoded) // 2
+        return [
+            cls.chunk(tool_calls=[SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=""))]),
+            cls.chunk(tool_calls=[SimpleNamespace(index=index, id=None, function=SimpleNamespace(name=None, arguments=encoded[:middle]))]),
+            cls.chunk(tool_calls=[SimpleNamespace(index=index, id=None, function=SimpleNamespace(name=None, arguments=encoded[middle:]))]),
+        ]
+
+    @classmethod
+    def answer(cls, text):
+        return [cls.chunk(content=word) for word in text.split(" ")] + [SimpleNamespace(choices=[])]
+
+
+@pytest.fixture
+def chat_chunks():
+    return ChatChunks
+
+
+@pytest.fixture
+def streaming_openai_client():
+    """Makes a mock OpenAI client whose chat completions return the given chunk lists, one per call."""
+
+    def make(*streams):
+        openai_client = Mock()
+        openai_client.chat.completions.create.side_effect = [iter(stream) for stream in streams]
+        return openai_client
+
+    return make
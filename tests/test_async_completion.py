@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+from core.async_bridge import EventLoopThread
+from core.async_completion import get_completions_stream_async
+from core.embedding import AsyncQueryEmbedder
+
+pytestmark = pytest.mark.usefixtures("fake_tiktoken")
+
+
+async def _async_stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _async_openai_client(*streams):
+    openai_client = Mock()
+    openai_client.chat.completions.create = AsyncMock(side_effect=[_async_stream(stream) for stream in streams])
+    return openai_client
+
+
+async def _collect(stream) -> list[str]:
+    return [content_delta async for content_delta in stream]
+
+
+def test_async_tool_rounds_run_searches_concurrently(chat_chunks):
+    running = []
+    peak = []
+
+    async def search_climbs(**kwargs):
+        running.append(kwargs)
+        peak.append(len(running))
+        await asyncio.sleep(0.05)
+        running.remove(kwargs)
+        return {"query": kwargs}
+
+    climbing_data_client = Mock(search_climbs=search_climbs)
+    openai_client = _async_openai_client(
+        chat_chunks.tool_calls(0, "a", {"route_name": "The Pearl"}) + chat_chunks.tool_calls(1, "b", {"grades": ["V7"]}),
+        chat_chunks.answer("Try The Pearl"),
+    )
+    statuses = []
+
+    answer = asyncio.run(_collect(get_completions_stream_async(
+        openai_client, climbing_data_client, "gpt-4o", [{"role": "user", "content": "hi"}], on_status=statuses.append,
+    )))
+
+    assert answer == ["Try", "The", "Pearl"]
+    assert max(peak) == 2
+    assert statuses[0].startswith("Searching…")
+    last_round = openai_client.chat.completions.create.call_args_list[-1].kwargs
+    tool_messages = [message for message in last_round["messages"] if message["role"] == "tool"]
+    assert [json.loads(message["content"]) for message in tool_messages] == [
+        {"query": {"route_name": "The Pearl"}}, {"query": {"grades": ["V7"]}},
+    ]
+
+
+def test_async_tool_calls_past_the_deadline_are_cancelled(chat_chunks):
+    cancelled = []
+
+    async def search_climbs(**kwargs):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(kwargs)
+            raise
+
+    climbing_data_client = Mock(search_climbs=search_climbs)
+    openai_client = _async_openai_client(
+        chat_chunks.tool_calls(0, "a", {}, name="unknown_tool") + chat_chunks.tool_calls(1, "b", {"route_name": "x"}),
+        chat_chunks.answer("final answer"),
+    )
+
+    answer = asyncio.run(_collect(get_completions_stream_async(
+        openai_client, climbing_data_client, "gpt-4o", [], max_rounds=1, timeout_seconds=0.1,
+    )))
+
+    assert answer == ["final", "answer"]
+    assert cancelled == [{"route_name": "x"}]
+    final_call = openai_client.chat.completions.create.call_args_list[-1].kwargs
+    tool_messages = [message for message in final_call["messages"] if message["role"] == "tool"]
+    assert [json.loads(message["content"]) for message in tool_messages] == [
+        {"error": "Unknown function name: unknown_tool"}, {"error": "Timed out"},
+    ]
+
+
+def test_event_loop_thread_relays_callbacks_and_cancels_early_close():
+    event_loop_thread = EventLoopThread()
+    threads = []
+    finished = []
+
+    async def numbers(on_status):
+        try:
+            on_status("started")
+            for number in range(100):
+                yield number
+                await asyncio.sleep(0.01)
+        finally:
+            finished.append(True)
+
+    def on_status(message):
+        threads.append((message, threading.current_thread().name))
+
+    try:
+        stream = event_loop_thread.iterate(numbers, on_status=on_status)
+        assert [next(stream) for _ in range(3)] == [0, 1, 2]
+        stream.close()
+        event_loop_thread.run(asyncio.sleep(0.05))
+        assert threads == [("started", threading.current_thread().name)]
+        assert finished == [True]
+    finally:
+        event_loop_thread.stop()
+
+
+def test_async_query_embedder_shares_concurrent_requests():
+    async def create(**kwargs):
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])])
+
+    openai_client = Mock()
+    openai_client.embeddings.create = AsyncMock(side_effect=create)
+    embed_query = AsyncQueryEmbedder(openai_client)
+
+    async def embed_all():
+        return await asyncio.gather(embed_query("Warm  crimps"), embed_query("warm crimps"), embed_query("slab"))
+
+    assert asyncio.run(embed_all()) == [[0.1, 0.2]] * 3
+    assert openai_client.embeddings.create.call_count == 2
@@ -0,0 +1,141 @@
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from clients.async_elastic_client import AsyncElasticClient
+from clients.cached_client import AsyncCachedClimbingDataClient, CachedClimbingDataClient
+from clients.elastic_client import ElasticClient
+from clients.local_client import LocalClimbingDataClient
+from core.route_names import RouteNameIndex
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def backend():
+    client = LocalClimbingDataClient([{
+        "route_name": "The Pearl", "route_id": 1, "sector_id": "s1", "grade": "V6", "sector_name": "Pearl Boulders",
+        "location": {"lat": 39.33, "lon": -120.18}, "style": "boulder", "description": "Crimps", "rating": 4.5,
+    }])
+    client.search_climbs = Mock(wraps=client.search_climbs)
+    client.index_version = Mock(return_value="openbeta-1")
+    return client
+
+
+def test_equivalent_arguments_share_an_entry(backend):
+    cached = CachedClimbingDataClient(backend)
+
+    first = cached.search_climbs("The  Pearl", grades=["V6", "V5"], location={"lat": 39.33001, "lon": -120.18}, location_radius_miles=50)
+    second = cached.search_climbs(route_name="the pearl", grades=["V5", "V6"], location={"lat": 39.33, "lon": -120.18})
+    cached.search_climbs(route_name="the pearl", grades=["V5", "V6"], location={"lat": 39.33, "lon": -120.18}, size=5)
+
+    assert first == second
+    assert backend.search_climbs.call_count == 2
+    assert cached.stats() | {"hit_rate": None} == {
+        "entries": 2, "hits": 1, "misses": 2, "hit_rate": None, "evictions": 0, "expirations": 0, "invalidations": 0,
+    }
+    # callers get their own copy
+    second["routes"].clear()
+    assert cached.search_climbs(route_name="The Pearl", grades=["V6", "V5"], location={"lat": 39.33, "lon": -120.18})["routes"]
+
+
+def test_lru_eviction_and_ttl(backend):
+    clock = FakeClock()
+    cached = CachedClimbingDataClient(backend, max_entries=2, ttl_seconds=60, clock=clock)
+
+    cached.search_climbs(route_name="a")
+    cached.search_climbs(route_name="b")
+    cached.search_climbs(route_name="a")
+    cached.search_climbs(route_name="c")  # evicts b, the least recently used
+    cached.search_climbs(route_name="a")
+    cached.search_climbs(route_name="b")
+    assert backend.search_climbs.call_count == 4
+    assert cached.evictions == 2
+
+    clock.now = 61
+    cached.search_climbs(route_name="b")
+    assert backend.search_climbs.call_count == 5
+    assert cached.expirations == 1
+
+
+def test_invalidated_when_index_version_changes(backend):
+    clock = FakeClock()
+    cached = CachedClimbingDataClient(backend, version_check_seconds=30, clock=clock)
+
+    cached.search_climbs(route_name="a")
+    backend.index_version.return_value = "openbeta-2"
+    clock.now = 10
+    cached.search_climbs(route_name="a")
+    assert backend.search_climbs.call_count == 1
+
+    clock.now = 31
+    cached.search_climbs(route_name="a")
+    assert backend.search_climbs.call_count == 2
+    assert cached.invalidations == 1
+    assert backend.index_version.call_count == 2
+
+    # an unreachable Elasticsearch is treated as the version being unchanged
+    backend.index_version.side_effect = ConnectionError("Connection refused")
+    clock.now = 62
+    cached.search_climbs(route_name="a")
+    assert backend.search_climbs.call_count == 2
+    assert cached.invalidations == 1
+
+
+def test_async_client_shares_the_cache_and_version_checks():
+    with patch("clients.async_elastic_client.AsyncElasticsearch"):
+        backend = AsyncElasticClient("http://localhost:9200", "test-key")
+    backend.es = AsyncMock()
+    backend.es.indices.exists.return_value = True
+    backend.es.indices.get_mapping.return_value = {"openbeta-1": {"mappings": {}}}
+    backend.es.search.return_value = {"hits": {"total": {"value": 0}, "hits": []}}
+    clock = FakeClock()
+    cached = AsyncCachedClimbingDataClient(backend, version_check_seconds=30, clock=clock)
+
+    async def search():
+        return await cached.search_climbs(route_name="The  Pearl"), await cached.search_climbs(route_name="the pearl")
+
+    first, second = asyncio.run(search())
+    assert first == second == {"total": 0, "routes": [], "search_after": None}
+    assert backend.es.search.call_count == 1
+
+    backend.es.indices.get_mapping.return_value = {"openbeta-1": {"mappings": {"_meta": {"generation": 1}}}}
+    clock.now = 31
+    asyncio.run(search())
+    assert backend.es.search.call_count == 2
+    assert cached.stats()["invalidations"] == 1
+
+
+def test_route_name_index_reloads_with_the_index(tmp_path):
+    path = tmp_path / "route_name_index.npz"
+    route = {"route_name": "The Pearl", "route_id": 1, "sector_id": "s1", "sector_name": "Pearl Boulders", "location": None}
+    RouteNameIndex.from_documents([route]).save(path)
+    with patch("clients.elastic_client.Elasticsearch"):
+        backend = ElasticClient("http://localhost:9200", "test-key", route_name_index_path=path)
+    backend.es.indices.get_mapping.return_value = {"openbeta-1": {"mappings": {}}}
+    clock = FakeClock()
+    cached = CachedClimbingDataClient(backend, version_check_seconds=30, clock=clock)
+    assert cached.lookup_route("pearl")["routes"][0]["route_id"] == 1
+
+    # a new file alone is only picked up once the index has changed version
+    RouteNameIndex.from_documents([{**route, "route_id": 2}]).save(path)
+    clock.now = 31
+    assert cached.lookup_route("pearl")["routes"][0]["route_id"] == 1
+    backend.es.indices.get_mapping.return_value = {"openbeta-1": {"mappings": {"_meta": {"generation": 1}}}}
+    clock.now = 62
+    assert cached.lookup_route("pearl")["routes"][0]["route_id"] == 2
+
+    # the loader writes the file after the routes are live, so it can also land after the change is seen
+    backend.es.indices.get_mapping.return_value = {"openbeta-1": {"mappings": {"_meta": {"generation": 2}}}}
+    clock.now = 93
+    assert cached.lookup_route("pearl")["routes"][0]["route_id"] == 2
+    RouteNameIndex.from_documents([{**route, "route_id": 3}]).save(path)
+    clock.now = 94
+    assert cached.lookup_route("pearl")["routes"][0]["route_id"] == 3
+    backend.es.search.assert_not_called()
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+from core.columnar_cache import ColumnarCache
+from scripts.load_climbing_data import COLUMNAR_CONVERTERS, SOURCE_COLUMNS, iter_documents
+
+
+@pytest.fixture
+def source_df():
+    # object columns keep None for missing strings, like the unpickled source
+    return pd.DataFrame([
+        {'route_name': 'Stairway to Heaven', 'parent_sector': 'Drive In Wall', 'route_ID': 106956280,
+         'sector_ID': '106947227', 'type_string': 'trad', 'YDS': '5.7', 'Vermin': None, 'fa': 'unknown',
+         'parent_loc': [-91.5625, 42.614], 'description': ['Climb the large flake...', 'Then the crack.'],
+         'corrected_users_ratings': [('e99', 1.0), ('a4a', 3.0)]},
+        {'route_name': 'The Pearl', 'parent_sector': None, 'route_ID': 2, 'sector_ID': '3',
+         'type_string': 'boulder', 'YDS': None, 'Vermin': 'V4', 'fa': 'unknown',
+         'parent_loc': np.nan, 'description': None, 'corrected_users_ratings': []},
+        {'route_name': 'No Grade', 'parent_sector': 'Somewhere', 'route_ID': 3, 'sector_ID': '3',
+         'type_string': 'sport', 'YDS': None, 'Vermin': None, 'fa': 'unknown',
+         'parent_loc': [1.0, np.nan], 'description': [], 'corrected_users_ratings': None},
+    ], dtype=object).astype({'route_ID': 'int64'})
+
+
+def _write_source(path, content=b"v1"):
+    path.write_bytes(content)
+    return path
+
+
+def test_round_trip_matches_source_documents(tmp_path, source_df):
+    cache = ColumnarCache(_write_source(tmp_path / "data.pkl.zip"))
+    cache.write(source_df, SOURCE_COLUMNS, converters=COLUMNAR_CONVERTERS)
+
+    assert cache.is_valid(SOURCE_COLUMNS)
+    df = cache.read(SOURCE_COLUMNS)
+    assert list(df.columns) == SOURCE_COLUMNS
+    assert df["parent_sector"].tolist() == ["Drive In Wall", None, "Somewhere"]
+    assert list(iter_documents(df)) == list(iter_documents(source_df))
+
+
+def test_invalidated_when_source_changes(tmp_path, source_df):
+    source_path = _write_source(tmp_path / "data.pkl.zip")
+    cache = ColumnarCache(source_path)
+    cache.write(source_df, ["route_name", "YDS"])
+
+    assert cache.is_valid(["route_name"])
+    assert not cache.is_valid(["route_name", "Vermin"])
+    _write_source(source_path, b"v2 is longer")
+    assert not cache.is_valid(["route_name"])
+
+
+def test_read_lazy_loads_columns_on_access(tmp_path, source_df):
+    cache = ColumnarCache(_write_source(tmp_path / "data.pkl.zip"))
+    cache.write(source_df, ["route_name", "Vermin"])
+
+    columns = cache.read_lazy(["route_name", "Vermin"])
+    assert len(columns) == 3
+    assert columns._loaded == {}
+    assert columns["Vermin"].tolist() == [None, "V4", None]
+    assert list(columns._loaded) == ["Vermin"]
+    with pytest.raises(KeyError):
+        columns["YDS"]
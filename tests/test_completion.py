@@ -0,0 +1,284 @@
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import Mock, patch
+
+import pytest
+from core.completion import (
+    SYSTEM_PROMPT, ContextBudget, SemanticResponseCache, StreamedToolCalls, count_tokens, get_completions_stream,
+)
+
+
+pytestmark = pytest.mark.usefixtures("fake_tiktoken")
+
+
+def test_tool_rounds_until_model_answers(chat_chunks, streaming_openai_client):
+    climbing_data_client = Mock()
+    climbing_data_client.search_climbs.side_effect = lambda **kwargs: {"query": kwargs}
+    openai_client = streaming_openai_client(
+        chat_chunks.tool_calls(0, "a", {"route_name": "The Pearl"}) + chat_chunks.tool_calls(1, "b", {"grades": ["V7"]}),
+        chat_chunks.tool_calls(0, "c", {"sector_name": "Pearl Boulders"}),
+        chat_chunks.answer("Try The Pearl"),
+    )
+    statuses = []
+
+    answer = list(get_completions_stream(
+        openai_client, climbing_data_client, "gpt-4o", [{"role": "user", "content": "hi"}], on_status=statuses.append,
+    ))
+
+    assert answer == ["Try", "The", "Pearl"]
+    assert openai_client.chat.completions.create.call_count == 3
+    assert [call.kwargs for call in climbing_data_client.search_climbs.call_args_list] == [
+        {"route_name": "The Pearl"}, {"grades": ["V7"]}, {"sector_name": "Pearl Boulders"},
+    ]
+    assert statuses[0].startswith("Searching…")
+    last_round = openai_client.chat.completions.create.call_args_list[-1].kwargs
+    assert last_round["stream"] is True
+    assert last_round["messages"][0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert last_round["messages"][2]["tool_calls"][1]["function"] == {"name": "search_climbs", "arguments": '{"grades": ["V7"]}'}
+    tool_messages = [message for message in last_round["messages"] if message["role"] == "tool"]
+    assert [message["tool_call_id"] for message in tool_messages] == ["a", "b", "c"]
+    assert tool_messages[2]["content"] == json.dumps({"query": {"sector_name": "Pearl Boulders"}})
+
+
+def test_search_starts_before_model_finishes_streaming(chat_chunks):
+    climbing_data_client = Mock()
+    started = []
+    climbing_data_client.search_climbs.side_effect = lambda **kwargs: started.append(kwargs) or {}
+
+    def planning_stream():
+        yield from chat_chunks.tool_calls(0, "a", {"route_name": "The Pearl"})
+        time.sleep(0.2)
+        # the first search has been running while the model was still generating
+        assert started == [{"route_name": "The Pearl"}]
+        yield from chat_chunks.tool_calls(1, "b", {"route_name": "Crimp Scene"})
+
+    openai_client = Mock()
+    openai_client.chat.completions.create.side_effect = [planning_stream(), iter(chat_chunks.answer("ok"))]
+
+    assert list(get_completions_stream(openai_client, climbing_data_client, "gpt-4o", [])) == ["ok"]
+
+
+def test_tool_rounds_stop_at_max_rounds_and_report_errors(chat_chunks, streaming_openai_client):
+    climbing_data_client = Mock()
+    openai_client = streaming_openai_client(
+        chat_chunks.tool_calls(0, "a", {}, name="unknown_tool"),
+        chat_chunks.tool_calls(0, "b", {"route_name": "x"}),
+        chat_chunks.answer("final answer"),
+    )
+    climbing_data_client.search_climbs.side_effect = lambda **kwargs: time.sleep(0.5)
+
+    answer = list(get_completions_stream(openai_client, climbing_data_client, "gpt-4o", [], max_rounds=2, timeout_seconds=0.1))
+
+    assert answer == ["final", "answer"]
+    final_call = openai_client.chat.completions.create.call_args_list[-1].kwargs
+    assert "tools" not in final_call
+    tool_messages = [message for message in final_call["messages"] if message["role"] == "tool"]
+    assert [json.loads(message["content"]) for message in tool_messages] == [
+        {"error": "Unknown function name: unknown_tool"}, {"error": "Timed out"},
+    ]
+
+
+def test_timed_out_tool_calls_still_queued_are_cancelled(chat_chunks):
+    release = threading.Event()
+    climbing_data_client = Mock()
+    climbing_data_client.search_climbs.side_effect = lambda **kwargs: release.wait(5) and {}
+    tool_calls = StreamedToolCalls(climbing_data_client)
+    # one worker, so the second call queues behind the first, as it would behind other sessions' searches
+    with patch("core.completion._tool_executor", ThreadPoolExecutor(max_workers=1)) as executor:
+        for chunk in chat_chunks.tool_calls(0, "a", {"route_name": "a"}) + chat_chunks.tool_calls(1, "b", {"route_name": "b"}):
+            tool_calls.add_deltas(chunk.choices[0].delta.tool_calls)
+        running, queued = (call["future"] for call in tool_calls.calls.values())
+
+        messages = tool_calls.tool_messages(time.monotonic() + 0.1)
+
+        assert [json.loads(message["content"]) for message in messages] == [{"error": "Timed out"}] * 2
+        assert tool_calls.failed
+        assert queued.cancelled() and not running.cancelled()
+        release.set()
+        executor.shutdown(wait=True)
+    assert climbing_data_client.search_climbs.call_count == 1
+
+
+def _route(route_id, score, description="Crimps to a jug."):
+    return {
+        "route_name": f"Route {route_id}", "route_id": route_id, "sector_id": "1", "sector_name": "Pearl | Boulders",
+        "grade": "V6", "style": "boulder", "description": description, "rating": 4.0,
+        "location": {"lat": 39.33, "lon": -120.18}, "score": score,
+    }
+
+
+def test_format_tool_result_as_compact_table():
+    result = {"total": 40, "routes": [_route(1, 10.0), _route(2, 4.0, "Long\n\nstory " * 100), _route(3, 1.0)], "search_after": [4.0, "2"]}
+
+    table = ContextBudget(min_relative_score=0.3).format_tool_result(result)
+
+    lines = table.split("\n")
+    assert lines[0] == "total: 40, showing 2"
+    assert lines[1] == "route_name | grade | style | rating | sector_name | route_id | location | description"
+    assert lines[2] == "Route 1 | V6 | boulder | 4.0 | Pearl / Boulders | 1 | 39.3300,-120.1800 | Crimps to a jug."
+    assert lines[3].startswith("Route 2 |") and lines[3].endswith("…") and len(lines[3]) < 300
+    assert lines[4] == 'search_after: [4.0, "2"]'
+    assert ContextBudget().format_tool_result({"error": "Timed out"}) == '{"error": "Timed out"}'
+
+    short = ContextBudget(tool_result_token_budget=250).format_tool_result(result)
+    assert short.split("\n")[0] == "total: 40, showing 1"
+    fits = ContextBudget(tool_result_token_budget=len(table)).format_tool_result(result)
+    assert fits == table
+    assert ContextBudget(tool_result_token_budget=len(table) - 1).format_tool_result(result).split("\n")[0] == "total: 40, showing 1"
+    # tables are counted without going through the count_tokens cache
+    count_tokens.cache_clear()
+    budget = ContextBudget()
+    budget.count_message_tokens({"role": "tool", "tool_call_id": "a", "content": budget.format_tool_result(result)})
+    assert count_tokens.cache_info().currsize == 0
+
+
+def test_format_sector_result_as_table():
+    sector = {
+        "sector_id": "s1", "sector_name": "Pearl Boulders", "location": {"lat": 39.33, "lon": -120.18}, "route_count": 8,
+        "rating": 3.5, "style_counts": {"boulder": 6, "sport": 2}, "climber_route_counts": [4, 2],
+        "grade_histogram": {"boulder": {"V5": 3, "V6": 3}, "sport": {"5.10a": 2}}, "score": 203.2,
+    }
+    result = {"total": 12, "sectors": [sector, {**sector, "sector_id": "s2", "score": 101.6}]}
+
+    table = ContextBudget().format_tool_result(result, "search_sectors")
+
+    assert table.split("\n") == [
+        "total: 12, showing 2",
+        "sector_name | sector_id | location | route_count | rating | climber_route_counts | grade_histogram | score",
+        "Pearl Boulders | s1 | 39.3300,-120.1800 | 8 | 3.5 | 4, 2 | boulder: V5 3, V6 3; sport: 5.10a 2 | 203.2",
+        "Pearl Boulders | s2 | 39.3300,-120.1800 | 8 | 3.5 | 4, 2 | boulder: V5 3, V6 3; sport: 5.10a 2 | 101.6",
+    ]
+    short = ContextBudget(tool_result_token_budget=len(table) - 1).format_tool_result(result, "search_sectors")
+    assert short.split("\n")[0] == "total: 12, showing 1"
+
+
+def test_format_lookup_result_as_table():
+    route = {
+        "route_name": "The Pearl", "route_id": 1, "sector_id": "s1", "sector_name": "Pearl Boulders",
+        "location": {"lat": 39.33, "lon": -120.18}, "score": 1.0, "distance_miles": 2.5,
+    }
+    result = {"total": 2, "routes": [route, {**route, "route_id": 2, "distance_miles": None}]}
+
+    assert ContextBudget().format_tool_result(result, "lookup_route").split("\n") == [
+        "total: 2, showing 2",
+        "route_name | sector_name | route_id | location | distance_miles | score",
+        "The Pearl | Pearl Boulders | 1 | 39.3300,-120.1800 | 2.5 | 1.0",
+        "The Pearl | Pearl Boulders | 2 | 39.3300,-120.1800 |  | 1.0",
+    ]
+
+
+def test_fit_trims_old_history_but_keeps_current_turn():
+    history = []
+    for i in range(10):
+        history += [{"role": "user", "content": f"question {i} " * 50}, {"role": "assistant", "content": f"answer {i} " * 50}]
+    current_turn = [
+        {"role": "user", "content": "latest question"},
+        {"role": "assistant", "content": None, "tool_calls": [
+            {"id": "a", "type": "function", "function": {"name": "search_climbs", "arguments": "{}"}},
+        ]},
+        {"role": "tool", "tool_call_id": "a", "content": "x" * 500},
+    ]
+    messages = [{"role": "system", "content": "system"}] + history + current_turn
+    budget = ContextBudget(token_budget=3000)
+
+    fitted = budget.fit(messages)
+
+    assert budget.count_prompt_tokens(fitted) <= 3000
+    assert fitted[0] == messages[0]
+    assert fitted[-3:] == current_turn
+    assert fitted[-4] == history[-1]
+    assert len(fitted) < len(messages)
+    # older messages that survive are shortened rather than dropped outright
+    assert all(len(message["content"]) <= 151 for message in fitted[1:-3 - 6])
+    assert ContextBudget().fit(messages) == messages[:1] + [
+        {**message, "content": message["content"][:150] + "…"} for message in history[:-6]
+    ] + history[-6:] + current_turn
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fake_embed(text):
+    # questions about the same area embed to the same direction
+    return [1.0, 0.0, 0.0] if "bishop" in text.lower() else [0.0, 1.0, 0.1 * len(text)]
+
+
+def test_semantic_cache_replays_similar_questions(chat_chunks, streaming_openai_client):
+    cache = SemanticResponseCache(_fake_embed, threshold=0.95)
+    openai_client = streaming_openai_client([chat_chunks.chunk(content="Try "), chat_chunks.chunk(content="the "), chat_chunks.chunk(content="Buttermilks")])
+    climbing_data_client = Mock()
+
+    first = list(get_completions_stream(
+        openai_client, climbing_data_client, "gpt-4o", [{"role": "user", "content": "Best V5s in Bishop?"}], response_cache=cache,
+    ))
+    second = list(get_completions_stream(
+        openai_client, climbing_data_client, "gpt-4o", [{"role": "user", "content": "best v5 problems in bishop"}], response_cache=cache,
+    ))
+
+    assert "".join(first) == "".join(second) == "Try the Buttermilks"
+    assert len(second) > 1
+    assert openai_client.chat.completions.create.call_count == 1
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5, "expirations": 0, "evictions": 0}
+
+
+def test_semantic_cache_skips_degraded_answers_and_failed_lookups(chat_chunks, streaming_openai_client):
+    cache = SemanticResponseCache(_fake_embed, threshold=0.95)
+    question = [{"role": "user", "content": "Best V5s in Bishop?"}]
+    climbing_data_client = Mock()
+    climbing_data_client.search_climbs.side_effect = Exception("Search failed")
+    openai_client = streaming_openai_client(
+        chat_chunks.tool_calls(0, "a", {"grades": ["V5"]}), chat_chunks.answer("Try the Buttermilks"),
+    )
+
+    answer = list(get_completions_stream(openai_client, climbing_data_client, "gpt-4o", question, response_cache=cache))
+
+    assert answer == ["Try", "the", "Buttermilks"]
+    assert cache.stats()["entries"] == 0
+
+    def embed_down(text):
+        raise ConnectionError("embeddings unavailable")
+
+    openai_client = streaming_openai_client(chat_chunks.answer("Try the Buttermilks"))
+    answer = list(get_completions_stream(
+        openai_client, Mock(), "gpt-4o", question, response_cache=SemanticResponseCache(embed_down),
+    ))
+    assert answer == ["Try", "the", "Buttermilks"]
+
+
+def test_semantic_cache_respects_model_ttl_and_capacity():
+    clock = FakeClock()
+    cache = SemanticResponseCache(_fake_embed, ttl_seconds=60, max_entries=2, clock=clock)
+    bishop = [{"role": "user", "content": "Bishop"}]
+
+    _, key = cache.lookup(bishop, "gpt-4o")
+    cache.store(key, "gpt-4o", "answer")
+    assert cache.lookup(bishop, "gpt-4o")[0] == "answer"
+    assert cache.lookup(bishop, "gpt-4o-mini")[0] is None
+
+    clock.now = 61
+    assert cache.lookup(bishop, "gpt-4o")[0] is None
+    assert cache.expirations == 1
+
+    for i, text in enumerate(["a", "bb", "ccc"]):
+        cache.store(cache.lookup([{"role": "user", "content": text}], "gpt-4o")[1], "gpt-4o", text)
+    assert cache.stats()["entries"] == 2
+    assert cache.evictions == 1
+
+
+def test_semantic_cache_key_includes_recent_context():
+    messages = [
+        {"role": "system", "content": "system"},
+        {"role": "user", "content": "Sport climbing in Red Rocks?"},
+        {"role": "assistant", "content": "Try Kraft Boulders."},
+        {"role": "user", "content": "What about trad?"},
+    ]
+    assert SemanticResponseCache.key_text(messages) == (
+        "user: Sport climbing in Red Rocks?\nassistant: Try Kraft Boulders.\nquestion: What about trad?"
+    )
@@ -0,0 +1,31 @@
+from unittest.mock import Mock, patch
+
+from clients.connections import OPENAI_KEEPALIVE_SECONDS, OPENAI_MAX_CONNECTIONS, make_openai_client, warm_up
+from clients.elastic_client import ElasticClient
+
+
+def test_openai_client_pool_limits():
+    client = make_openai_client("test-key", base_url="http://127.0.0.1:1/v1")
+    pool = client._client._transport._pool
+    assert pool._max_connections == OPENAI_MAX_CONNECTIONS
+    assert pool._keepalive_expiry == OPENAI_KEEPALIVE_SECONDS
+
+
+def test_elastic_client_pool_settings():
+    with patch("clients.elastic_client.Elasticsearch") as mock_es:
+        ElasticClient("http://localhost:9200", "test-key", connections_per_node=5)
+    assert mock_es.call_args.kwargs["connections_per_node"] == 5
+    assert mock_es.call_args.kwargs["retry_on_timeout"] is True
+
+
+def test_warm_up_runs_every_step_despite_failures():
+    openai_client = Mock()
+    openai_client.models.retrieve.side_effect = ConnectionError("no route to host")
+    climbing_data_client = Mock()
+
+    with patch("core.embedding.get_encoding") as get_encoding:
+        warm_up(openai_client, climbing_data_client, "gpt-4o")
+
+    get_encoding.assert_called_once()
+    climbing_data_client.warm_up.assert_called_once()
+    openai_client.models.retrieve.assert_called_once_with("gpt-4o")
@@ -1,6 +1,14 @@
+import asyncio
 import pytest
-from unittest.mock import Mock, patch
-from clients.elastic_client import ElasticClient, ELASTICSEARCH_INDEX_NAME
+from unittest.mock import AsyncMock, Mock, patch
+from elasticsearch import NotFoundError
+from clients.async_elastic_client import AsyncElasticClient
+from clients.elastic_client import (
+    ElasticClient, ELASTICSEARCH_INDEX_NAME, COMPACT_HIGHLIGHT, ROUTE_FIELDS, RRF_WINDOW_SIZE, SORT, reciprocal_rank_fusion,
+)
+from core.embedding import EMBEDDING_MODEL, QueryEmbedder
+from core.sectors import COVERAGE_TIER
+from core.route_names import RouteNameIndex
 
 @pytest.fixture
 def mock_es_response():
@@ -85,7 +93,10 @@ def test_search_climbs_success(mock_elastic_client, mock_es_response):
                     }
                 }]
             }
-        }
+        },
+        size=10,
+        sort=SORT,
+        source=ROUTE_FIELDS,
     )
     
     assert result["total"] == 2
@@ -139,7 +150,183 @@ def test_search_climbs_multi_word(mock_elastic_client, mock_es_response):
                     }
                 }]
             }
-        }
+        },
+        size=10,
+        sort=SORT,
+        source=ROUTE_FIELDS,
     )
     
     assert result["total"] == 2
+
+def _hit(doc_id, route_name):
+    return {"_id": doc_id, "_score": 1.0, "_source": {
+        "route_name": route_name, "route_id": int(doc_id), "sector_id": "1", "sector_name": "Pearl Boulders",
+        "grade": "V6", "style": "boulder", "description": "Crimps", "rating": 4.0,
+        "location": {"lat": 39.33, "lon": -120.18},
+    }}
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([_hit("1", "A"), _hit("2", "B")], [_hit("2", "B"), _hit("3", "C")], rank_constant=60)
+
+    assert [hit["_id"] for hit in fused] == ["2", "1", "3"]
+    assert fused[0]["_score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1]["_score"] == pytest.approx(1 / 61)
+
+def test_search_climbs_hybrid_description(mock_elastic_client):
+    mock_elastic_client.embed_query = Mock(return_value=[0.1, 0.2])
+    mock_elastic_client.num_candidates = 200
+    mock_elastic_client.es.msearch.return_value = {"responses": [
+        {"hits": {"total": {"value": 2}, "hits": [_hit("1", "The Pearl"), _hit("2", "Crimp Scene")]}},
+        {"hits": {"total": {"value": 2}, "hits": [_hit("2", "Crimp Scene"), _hit("3", "Sharp")]}},
+    ]}
+
+    result = mock_elastic_client.search_climbs(description="crimpy", grades=["V6"])
+
+    grade_filter = [{"terms": {"grade": ["V6"]}}]
+    mock_elastic_client.es.msearch.assert_called_once_with(searches=[
+        {"index": ELASTICSEARCH_INDEX_NAME},
+        {"query": {"bool": {
+            "must": [{"match": {"description": {"query": "crimpy", "fuzziness": "AUTO"}}}],
+            "filter": grade_filter,
+        }}, "size": RRF_WINDOW_SIZE, "_source": ROUTE_FIELDS},
+        {"index": ELASTICSEARCH_INDEX_NAME},
+        {"knn": {
+            "field": "description_vector", "query_vector": [0.1, 0.2], "k": RRF_WINDOW_SIZE,
+            "num_candidates": 200, "filter": grade_filter,
+        }, "size": RRF_WINDOW_SIZE, "_source": ROUTE_FIELDS},
+    ])
+    mock_elastic_client.es.search.assert_not_called()
+    assert result["total"] == 3
+    assert [route["route_name"] for route in result["routes"]] == ["Crimp Scene", "The Pearl", "Sharp"]
+    assert result["search_after"] is None
+
+    second_page = mock_elastic_client.search_climbs(description="crimpy", grades=["V6"], size=1, search_after=[
+        result["routes"][0]["score"], result["routes"][0]["route_id"],
+    ])
+    assert [route["route_name"] for route in second_page["routes"]] == ["The Pearl"]
+    assert second_page["search_after"] == [second_page["routes"][0]["score"], "1"]
+
+def test_query_embedder_caches_normalized_queries():
+    openai_client = Mock()
+    openai_client.embeddings.create.return_value = Mock(data=[Mock(embedding=[0.5, 0.5])])
+    embed_query = QueryEmbedder(openai_client)
+
+    assert embed_query("Crimpy  overhang") == [0.5, 0.5]
+    assert embed_query("crimpy overhang ") == [0.5, 0.5]
+    openai_client.embeddings.create.assert_called_once_with(model=EMBEDDING_MODEL, input=["crimpy overhang"])
+    assert embed_query.cache_info().hits == 1
+
+    QueryEmbedder(openai_client, dimensions=512)("crimpy overhang")
+    openai_client.embeddings.create.assert_called_with(model=EMBEDDING_MODEL, input=["crimpy overhang"], dimensions=512)
+
+def test_search_climbs_paging_and_compact(mock_elastic_client, mock_es_response):
+    for hit, sort in zip(mock_es_response["hits"]["hits"], ([12.844319, "105757642"], [10.123456, "105757643"])):
+        hit["sort"] = sort
+        del hit["_source"]["description"]
+    mock_es_response["hits"]["hits"][0]["highlight"] = {"description": ["Classic crack climb"]}
+    mock_elastic_client.es.search.return_value = mock_es_response
+
+    result = mock_elastic_client.search_climbs(style="trad", size=2, search_after=[13.0, "1"], compact=True)
+
+    mock_elastic_client.es.search.assert_called_once_with(
+        index=ELASTICSEARCH_INDEX_NAME,
+        query={"bool": {"must": [{"match": {"style": "trad"}}]}},
+        size=2,
+        sort=SORT,
+        search_after=[13.0, "1"],
+        source=[field for field in ROUTE_FIELDS if field != "description"],
+        highlight=COMPACT_HIGHLIGHT,
+    )
+    assert [route["description"] for route in result["routes"]] == ["Classic crack climb", ""]
+    assert result["search_after"] == [10.123456, "105757643"]
+
+def test_index_version_follows_alias_and_generation(mock_elastic_client):
+    mock_elastic_client.es.indices.get_mapping.return_value = {"openbeta-20250204171641": {"mappings": {"properties": {}}}}
+    assert mock_elastic_client.index_version() == "openbeta-20250204171641@0"
+
+    mock_elastic_client.es.indices.get_mapping.return_value = {
+        "openbeta-20250204171641": {"mappings": {"_meta": {"generation": 3}, "properties": {}}},
+    }
+    assert mock_elastic_client.index_version() == "openbeta-20250204171641@3"
+
+    mock_elastic_client.es.indices.get_mapping.side_effect = NotFoundError("index [openbeta] missing", Mock(), {})
+    assert mock_elastic_client.index_version() is None
+
+def test_search_climbs_grade_range(mock_elastic_client, mock_es_response):
+    mock_elastic_client.es.search.return_value = mock_es_response
+
+    mock_elastic_client.search_climbs(grade_min="5.10a", grade_max="5.11")
+
+    assert mock_elastic_client.es.search.call_args.kwargs["query"] == {"bool": {"must": [
+        {"term": {"grade_system": "yds"}},
+        {"range": {"grade_numeric": {"gte": 10.0, "lte": 11.75}}},
+    ]}}
+
+def test_search_sectors_scores_each_climber(mock_elastic_client):
+    bucket = {"style": "boulder", "grade": "V5", "grade_system": "v", "grade_numeric": 5.0, "count": 3}
+    mock_elastic_client.es.search.return_value = {"hits": {"total": {"value": 1}, "hits": [{"_score": 0.6, "_source": {
+        "sector_id": "s1", "sector_name": "Pearl Boulders", "location": {"lat": 39.33, "lon": -120.18},
+        "route_count": 3, "rating": 4.0, "style_counts": {"boulder": 3}, "grade_buckets": [bucket],
+    }}]}}
+
+    result = mock_elastic_client.search_sectors(
+        [{"grade_min": "V4", "grade_max": "V6", "style": "boulder"}, {"grade_max": "5.10"}], sector_name="pearl",
+    )
+
+    kwargs = mock_elastic_client.es.search.call_args.kwargs
+    assert kwargs["index"] == "sectors"
+    first, second = kwargs["query"]["bool"]["should"]
+    # each climber's matching routes are summed over the grade buckets before log1p, as coverage_score does
+    nested = first["function_score"]["query"]["nested"]
+    assert nested["score_mode"] == "sum"
+    assert nested["query"]["function_score"]["query"]["bool"]["filter"] == [
+        {"term": {"grade_buckets.grade_system": "v"}},
+        {"range": {"grade_buckets.grade_numeric": {"gte": 3.7, "lte": 6.3}}},
+        {"term": {"grade_buckets.style": "boulder"}},
+    ]
+    assert nested["query"]["function_score"]["field_value_factor"] == {"field": "grade_buckets.count"}
+    assert first["function_score"]["script_score"]["script"] == {
+        "source": "params.tier + Math.log1p(_score)", "params": {"tier": COVERAGE_TIER},
+    }
+    assert second["function_score"]["query"]["nested"]["query"]["function_score"]["query"]["bool"]["filter"][1] == {
+        "range": {"grade_buckets.grade_numeric": {"lte": 10.75}}
+    }
+    assert kwargs["query"]["bool"]["minimum_should_match"] == 1
+    assert result["total"] == 1
+    assert result["sectors"][0]["climber_route_counts"] == [3, 0]
+    assert result["sectors"][0]["grade_histogram"] == {"boulder": {"V5": 3}}
+
+def test_lookup_route_resolves_names_in_memory(mock_elastic_client, mock_es_response):
+    mock_elastic_client.es.search.return_value = mock_es_response
+    fallback = mock_elastic_client.lookup_route("Transgression", size=3)
+    assert mock_elastic_client.es.search.call_count == 1
+    assert [route["route_id"] for route in fallback["routes"]] == [105757642, 105757643]
+
+    mock_elastic_client.route_name_index = RouteNameIndex.from_documents(
+        hit["_source"] for hit in mock_es_response["hits"]["hits"]
+    )
+    result = mock_elastic_client.lookup_route("transgresion", location={"lat": 36.1, "lon": -115.4})
+    assert mock_elastic_client.es.search.call_count == 1
+    assert result["total"] == 1
+    assert result["routes"][0]["route_id"] == 105757642
+    assert result["routes"][0]["distance_miles"] == 2.5
+
+def test_async_client_plans_the_same_hybrid_search():
+    embed_query = AsyncMock(return_value=[0.1, 0.2])
+    with patch("clients.async_elastic_client.AsyncElasticsearch") as mock_es:
+        client = AsyncElasticClient("http://localhost:9200", "test-key", embed_query=embed_query, num_candidates=200)
+    assert mock_es.call_args.kwargs["node_class"] == "httpxasync"
+    client.es = AsyncMock()
+    client.es.indices.exists.return_value = True
+    client.es.msearch.return_value = {"responses": [
+        {"hits": {"total": {"value": 2}, "hits": [_hit("1", "The Pearl"), _hit("2", "Crimp Scene")]}},
+        {"hits": {"total": {"value": 2}, "hits": [_hit("2", "Crimp Scene"), _hit("3", "Sharp")]}},
+    ]}
+
+    result = asyncio.run(client.search_climbs(description="crimpy", grades=["V6"]))
+
+    embed_query.assert_awaited_once_with("crimpy")
+    searches = client.es.msearch.call_args.kwargs["searches"]
+    assert searches[3]["knn"]["query_vector"] == [0.1, 0.2]
+    assert searches[3]["knn"]["num_candidates"] == 200
+    assert [route["route_name"] for route in result["routes"]] == ["Crimp Scene", "The Pearl", "Sharp"]
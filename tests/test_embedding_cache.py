@@ -0,0 +1,79 @@
+import json
+import numpy as np
+from core.embedding_cache import EmbeddingCache
+
+
+def test_add_and_reload(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    cache.add_many(["crimpy face", "splitter crack"], [[0.1, 0.2, 0.3], [0.4, 0.5, 0.6]])
+    cache.add("slabby arete", [0.7, 0.8, 0.9])
+
+    reloaded = EmbeddingCache(tmp_path)
+    assert len(reloaded) == 3
+    assert "splitter crack" in reloaded
+    assert "overhanging roof" not in reloaded
+    np.testing.assert_allclose(reloaded["crimpy face"], [0.1, 0.2, 0.3], rtol=1e-6)
+    np.testing.assert_allclose(reloaded["slabby arete"], [0.7, 0.8, 0.9], rtol=1e-6)
+
+
+def test_appends_only_new_rows(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    cache.add_many(["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    cache.add_many(["a", "c"], [[9.0, 9.0], [1.0, 1.0]])
+
+    assert len(cache) == 3
+    assert (tmp_path / "vectors.bin").stat().st_size == 3 * 2 * 4
+    np.testing.assert_allclose(cache["a"], [1.0, 0.0])
+    np.testing.assert_allclose(cache["c"], [1.0, 1.0])
+
+
+def test_repeats_within_a_batch_are_written_once(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    cache.add_many(["x", "x", "y"], [[1.0, 0.0], [9.0, 9.0], [0.0, 1.0]])
+
+    assert len(cache) == 2
+    assert (tmp_path / "vectors.bin").stat().st_size == 2 * 2 * 4
+    np.testing.assert_allclose(cache["x"], [1.0, 0.0])
+    np.testing.assert_allclose(EmbeddingCache(tmp_path)["y"], [0.0, 1.0])
+
+
+def test_reload_drops_partial_row(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    cache.add_many(["a", "b"], [[1.0, 0.0], [0.0, 1.0]])
+    # simulate a crash after the vector was written but before its key
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(np.array([5.0, 5.0], dtype=np.float32).tobytes())
+
+    reloaded = EmbeddingCache(tmp_path)
+    assert len(reloaded) == 2
+    reloaded.add("c", [2.0, 2.0])
+    np.testing.assert_allclose(EmbeddingCache(tmp_path)["c"], [2.0, 2.0])
+
+
+def test_migrate_from_json(tmp_path):
+    legacy_path = tmp_path / "embedding_cache.json"
+    legacy_path.write_text(json.dumps({"a": [1.0, 2.0], "b": [3.0, 4.0]}))
+
+    cache = EmbeddingCache(tmp_path / "embedding_cache")
+    assert cache.migrate_from_json(legacy_path) == 2
+    assert not legacy_path.exists()
+    assert cache.migrate_from_json(legacy_path) == 0
+    np.testing.assert_allclose(EmbeddingCache(tmp_path / "embedding_cache")["b"], [3.0, 4.0])
+
+
+def test_reduced_precision_storage(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3, 64)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    for dtype, itemsize, tolerance in [("float16", 2, 1e-3), ("int8", 1, 1e-2)]:
+        cache = EmbeddingCache(tmp_path / dtype, dtype=dtype)
+        cache.add_many(["a", "b", "c"], vectors)
+        # the dtype sticks to the cache, whatever later callers ask for
+        reloaded = EmbeddingCache(tmp_path / dtype)
+
+        assert reloaded.dtype == dtype
+        assert (tmp_path / dtype / "vectors.bin").stat().st_size == 3 * 64 * itemsize
+        assert reloaded["b"].dtype == np.float32
+        np.testing.assert_allclose(reloaded["b"], vectors[1], atol=tolerance)
+        np.testing.assert_allclose(reloaded.vectors(), vectors, atol=tolerance)
@@ -0,0 +1,153 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from openai import OpenAI
+
+from core.embedding import MAX_TOKENS_PER_BATCH, add_embeddings
+from core.embedding_scheduler import EmbeddingBatch, EmbeddingScheduler, RateLimiter
+
+
+class FakeEmbeddingsServer(ThreadingHTTPServer):
+    def __init__(self, rate_limited_requests=0, latency_seconds=0.0):
+        super().__init__(("127.0.0.1", 0), FakeEmbeddingsHandler)
+        self.rate_limited_requests = rate_limited_requests
+        self.latency_seconds = latency_seconds
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+class FakeEmbeddingsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.requests += 1
+            rate_limited = server.requests <= server.rate_limited_requests
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if rate_limited:
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": "0"})
+                return
+            time.sleep(server.latency_seconds)
+            # the embedding is just the token count, so tests can check docs got their own vector back
+            data = [
+                {"object": "embedding", "index": i, "embedding": [float(len(tokens)), 1.0]}
+                for i, tokens in enumerate(body["input"])
+            ]
+            self._send_json(200, {
+                "object": "list",
+                "data": data,
+                "model": body["model"],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+@pytest.fixture
+def fake_server_factory():
+    servers = []
+
+    def start(**kwargs):
+        server = FakeEmbeddingsServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+pytestmark = pytest.mark.usefixtures("fake_tiktoken")
+
+
+def _openai_client(server):
+    return OpenAI(api_key="test-key", base_url=f"http://127.0.0.1:{server.server_address[1]}/v1")
+
+
+def test_add_embeddings_against_fake_endpoint(fake_server_factory, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    monkeypatch.setenv("EMBEDDING_MAX_IN_FLIGHT", "4")
+    server = fake_server_factory(rate_limited_requests=2, latency_seconds=0.05)
+    # each description is ~3000 fake tokens, so every batch holds two documents
+    documents = {
+        i: {"route_id": i, "description": chr(ord("a") + i) * (3000 + i), "description_vector": None}
+        for i in range(12)
+    }
+    documents[99] = {"route_id": 99, "description": "", "description_vector": None}
+
+    add_embeddings(documents, _openai_client(server))
+
+    for route_id, doc in documents.items():
+        if route_id == 99:
+            assert doc["description_vector"] is None
+        else:
+            assert list(doc["description_vector"]) == [float(3000 + route_id), 1.0]
+    assert server.requests == 6 + 2  # 6 batches plus the two rate limited attempts
+    assert server.max_in_flight > 1
+
+    # a rerun is served entirely from the cache
+    for doc in documents.values():
+        doc["description_vector"] = None
+    add_embeddings(documents, _openai_client(server))
+    assert server.requests == 8
+    assert list(documents[3]["description_vector"]) == [3003.0, 1.0]
+
+
+def test_add_embeddings_truncates_at_token_limit(fake_server_factory, tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    server = fake_server_factory()
+    documents = {1: {"route_id": 1, "description": "x" * 20000, "description_vector": None}}
+
+    add_embeddings(documents, _openai_client(server))
+
+    assert documents[1]["description"] == "x" * (MAX_TOKENS_PER_BATCH - 1)
+    assert list(documents[1]["description_vector"]) == [float(MAX_TOKENS_PER_BATCH - 1), 1.0]
+    assert server.requests == 1
+
+
+def test_scheduler_raises_after_max_retries(fake_server_factory):
+    server = fake_server_factory(rate_limited_requests=100)
+    client = _openai_client(server).with_options(max_retries=0)
+    scheduler = EmbeddingScheduler(
+        lambda inputs: client.embeddings.create(model="text-embedding-3-small", input=inputs).data,
+        max_retries=2,
+    )
+
+    with pytest.raises(Exception) as exc_info:
+        list(scheduler.run([EmbeddingBatch([[1, 2, 3]], 3)]))
+
+    assert exc_info.value.status_code == 429
+    assert server.requests == 3
+    assert scheduler.stats.rate_limited == 2
+
+
+def test_rate_limiter_spreads_requests():
+    limiter = RateLimiter(limit_per_minute=600)  # 10 per second
+    limiter.available = 0
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(1)
+    assert time.monotonic() - start >= 0.25
@@ -0,0 +1,34 @@
+import pytest
+from core.grades import V_SCALE, YDS, grade_range, parse_grade
+
+
+def test_grades_sort_within_each_system():
+    yds = ["5.7", "5.9-", "5.9", "5.9+", "5.10a", "5.10-", "5.10b/c", "5.10", "5.10+", "5.10d", "5.10-11", "5.11a", "5.12a PG13"]
+    v_scale = ["V-easy", "V0", "V0+", "V3/4", "V4-", "V4", "V4+", "V4-5", "V5", "V10"]
+
+    assert [parse_grade(grade).numeric for grade in yds] == sorted(parse_grade(grade).numeric for grade in yds)
+    assert [parse_grade(grade).numeric for grade in v_scale] == sorted(parse_grade(grade).numeric for grade in v_scale)
+    assert {parse_grade(grade).system for grade in yds} == {YDS}
+    assert {parse_grade(grade).system for grade in v_scale} == {V_SCALE}
+    assert parse_grade("5.10a").numeric == 10.0 and parse_grade("V4").numeric == 4.0
+
+
+@pytest.mark.parametrize("grade", ["WI4", "5.easy", "M6", "", None, float("nan")])
+def test_unparseable_grades(grade):
+    assert parse_grade(grade) is None
+
+
+def test_grade_range_includes_variants():
+    system, low, high = grade_range("V4", "V5")
+    assert system == V_SCALE
+    assert all(low <= parse_grade(grade).numeric <= high for grade in ["V4-", "V4", "V4-5", "V5+"])
+    assert not low <= parse_grade("V3+").numeric <= high
+
+    system, low, high = grade_range("5.10", "5.10")
+    assert all(low <= parse_grade(grade).numeric <= high for grade in ["5.10a", "5.10-", "5.10+", "5.10d"])
+    assert grade_range(grade_max="5.9") == (YDS, None, 9.3)
+
+    with pytest.raises(ValueError):
+        grade_range("V4", "5.10a")
+    with pytest.raises(ValueError):
+        grade_range("hard")
@@ -1,24 +1,293 @@
+import numpy as np
 import pandas as pd
-from scripts.load_climbing_data import transform_data
-from unittest.mock import patch
+import pytest
+from scripts.load_climbing_data import (
+    INDEX_MAPPINGS,
+    hash_documents,
+    index_mappings,
+    iter_documents,
+    load_sectors,
+    load_to_elasticsearch,
+    rebuild_elasticsearch,
+    save_route_name_index,
+    tap_route_summaries,
+    transform_data,
+    update_elasticsearch,
+)
+from unittest.mock import Mock, patch
+from core.load_manifest import LoadManifest, content_hash, mappings_hash
+from core.grades import parse_grade
+from core.route_names import RouteNameIndex
+
+def test_index_mappings_sets_dimensions_and_quantization():
+    assert index_mappings() == INDEX_MAPPINGS
+
+    vector = index_mappings(dimensions=512, vector_index_type="int8_hnsw")["properties"]["description_vector"]
+    assert vector["dims"] == 512
+    assert vector["index_options"] == {"type": "int8_hnsw"}
+    assert "index_options" not in INDEX_MAPPINGS["properties"]["description_vector"]
+    assert mappings_hash(index_mappings(dimensions=512)) != mappings_hash(INDEX_MAPPINGS)
+
+    with pytest.raises(ValueError):
+        index_mappings(dimensions=32, vector_index_type="bbq_hnsw")
+    with pytest.raises(ValueError):
+        index_mappings(vector_index_type="flat_ivf")
+
 
 @patch("scripts.load_climbing_data.load_dotenv")
-@patch("scripts.load_climbing_data.OpenAI")
-@patch("scripts.load_climbing_data.add_embeddings")
-def test_transform_data(mock_add_embeddings, mock_openai, mock_load_dotenv):
+def test_transform_data(mock_load_dotenv):
     df = pd.DataFrame([{'route_name': 'Stairway to Heaven', 'parent_sector': 'Drive In Wall', 'route_ID': 106956280, 'sector_ID': '106947227', 'type_string': 'trad', 'fa': 'unknown', 'YDS': '5.7', 'Vermin': None, 'nopm_YDS': '5.7', 'nopm_Vermin': None, 'YDS_rank': 73.0, 'Vermin_rank': None, 'safety': '', 'parent_loc': [-91.5625, 42.614], 
     'description': ['Climb the large flake...'], 'location': '', 'protection': ['SR, tricams are handy.'], 
     'corrected_users_ratings': [('e9977e5af38e002307bada00a10a9e3cdd990c80', 1.0), ('a4a0781ac4f40e0fe97b6d39713d745486d91095', 3.0)]}])
     transformed_data = transform_data(df)
-    assert transformed_data[0] == {
+    expected = {
         "route_name": "Stairway to Heaven",
         "route_id": 106956280,
         "sector_id": "106947227",
         "grade": "5.7",
+        "grade_system": "yds",
+        "grade_numeric": 7.0,
         "sector_name": "Drive In Wall",
         "location": {"lat": 42.614, "lon": -91.5625},
         "style": "trad",
         "description": "Climb the large flake...",
         "description_vector": None,
         "rating": 2.0
-    }
\ No newline at end of file
+    }
+    assert transformed_data[0] == {**expected, "content_hash": content_hash(expected)}
+
+def _legacy_extract_coordinates(location):
+    try:
+        if pd.isna(location).any():
+            return None
+        if not hasattr(location, '__len__') or len(location) != 2:
+            return None
+        lon, lat = float(location[0]), float(location[1])
+        if not (np.isfinite(lon) and np.isfinite(lat)):
+            return None
+        return {"lat": lat, "lon": lon}
+    except Exception:
+        return None
+
+
+def _legacy_transform(df):
+    # the row-by-row transform that iter_documents replaced, kept as the reference for parity
+    documents = []
+    for _, row in df.iterrows():
+        description = "\n".join(row["description"] or [])
+        doc = {
+            "route_name": row["route_name"],
+            "route_id": row["route_ID"],
+            "sector_id": row["sector_ID"],
+            "grade": row["YDS"] if pd.notna(row["YDS"]) else row["Vermin"],
+            "grade_system": None,
+            "grade_numeric": None,
+            "sector_name": row["parent_sector"],
+            "location": _legacy_extract_coordinates(row["parent_loc"]),
+            "style": row["type_string"],
+            "description": description,
+            "description_vector": None,
+            "rating": float(np.mean([rating[1] for rating in row["corrected_users_ratings"]])) if isinstance(row["corrected_users_ratings"], (list, np.ndarray)) and len(row["corrected_users_ratings"]) > 0 else None
+        }
+        if doc["route_name"] and doc["grade"] and doc["route_id"]:
+            parsed_grade = parse_grade(doc["grade"])
+            if parsed_grade:
+                doc["grade_system"], doc["grade_numeric"] = parsed_grade.system, parsed_grade.numeric
+            documents.append(doc)
+    return documents
+
+
+def _route(**overrides):
+    route = {
+        'route_name': 'Stairway to Heaven', 'parent_sector': 'Drive In Wall', 'route_ID': 106956280,
+        'sector_ID': '106947227', 'type_string': 'trad', 'YDS': '5.7', 'Vermin': None,
+        'parent_loc': [-91.5625, 42.614], 'description': ['Climb the large flake...', 'Then the crack.'],
+        'corrected_users_ratings': [('e99', 1.0), ('a4a', 3.0), ('b12', 2.5)],
+    }
+    route.update(overrides)
+    return route
+
+
+def test_iter_documents_matches_row_by_row_transform():
+    df = pd.DataFrame([
+        _route(),
+        _route(route_ID=2, YDS=None, Vermin='V4', type_string='boulder'),
+        _route(route_ID=13, YDS='WI4'),
+        _route(route_ID=3, YDS=np.nan, Vermin='V-easy', description=None, corrected_users_ratings=[]),
+        _route(route_ID=4, description=[], corrected_users_ratings=None, parent_loc=[np.nan, 42.0]),
+        _route(route_ID=5, parent_loc=[1.0, 2.0, 3.0]),
+        _route(route_ID=6, parent_loc=None),
+        _route(route_ID=7, parent_loc=[np.inf, 2.0]),
+        _route(route_ID=8, parent_loc=["-120.1", "39.3"]),
+        _route(route_ID=12, parent_loc=(-120.1, 39.3)),
+        _route(route_ID=9, YDS=None, Vermin=None),
+        _route(route_ID=10, route_name=''),
+        _route(route_ID=0),
+        _route(route_ID=11, corrected_users_ratings=np.array([('x', 4.0), ('y', 2.0)], dtype=object)),
+    ], index=[5, 5, 13, 3, 2, 9, 1, 0, 7, 8, 6, 4, 10, 11])
+
+    documents = list(iter_documents(df))
+    expected = _legacy_transform(df)
+
+    assert [doc["route_id"] for doc in documents] == [doc["route_id"] for doc in expected]
+    for doc, expected_doc in zip(documents, expected):
+        assert doc["rating"] == pytest.approx(expected_doc["rating"])
+        assert {**doc, "rating": None} == {**expected_doc, "rating": None}
+
+
+@patch("scripts.load_climbing_data.time.sleep")
+@patch("scripts.load_climbing_data.versioned_index_name", return_value="openbeta-20250101000000")
+@patch("scripts.load_climbing_data.helpers.parallel_bulk")
+@patch("scripts.load_climbing_data.get_elasticsearch_client")
+def test_load_to_elasticsearch_swaps_alias(mock_get_client, mock_parallel_bulk, mock_index_name, mock_sleep):
+    es = Mock()
+    es.indices.exists_alias.return_value = True
+    es.indices.get_alias.return_value = {"openbeta-20240101000000": {"aliases": {"openbeta": {}}}}
+    es.indices.get.return_value = {
+        "openbeta-20250101000000": {}, "openbeta-20240101000000": {}, "openbeta-20230101000000": {},
+    }
+    mock_get_client.return_value = es
+    attempts = []
+
+    def parallel_bulk(client, actions, **kwargs):
+        actions = list(actions)
+        attempts.append([action["_source"]["route_id"] for action in actions])
+        for action in actions:
+            # route 2 is rejected the first time around
+            yield (len(attempts) > 1 or action["_source"]["route_id"] != 2), {}
+    mock_parallel_bulk.side_effect = parallel_bulk
+
+    load_to_elasticsearch(({"route_id": i} for i in range(4)), chunk_size=2, thread_count=3)
+
+    assert attempts == [[0, 1, 2, 3], [2]]
+    assert mock_parallel_bulk.call_args.kwargs["chunk_size"] == 2
+    assert mock_parallel_bulk.call_args.kwargs["thread_count"] == 3
+    es.indices.create.assert_called_once()
+    assert es.indices.create.call_args.kwargs["index"] == "openbeta-20250101000000"
+    assert es.indices.create.call_args.kwargs["settings"]["refresh_interval"] == "-1"
+    es.indices.update_aliases.assert_called_once_with(actions=[
+        {"remove": {"index": "openbeta-20240101000000", "alias": "openbeta"}},
+        {"add": {"index": "openbeta-20250101000000", "alias": "openbeta"}},
+    ])
+    es.indices.delete.assert_called_once_with(index="openbeta-20230101000000")
+
+
+def _fake_bulk_index(indexed):
+    def iter_bulk_index(es, index_name, documents, chunk_size, thread_count):
+        for doc in documents:
+            indexed.append(doc["route_id"])
+            yield True, doc
+    return iter_bulk_index
+
+
+@patch("scripts.load_climbing_data.OpenAI")
+def test_update_elasticsearch_only_loads_changes(mock_openai, tmp_path):
+    unchanged = {"route_id": 1, "description": "a"}
+    changed = {"route_id": 2, "description": "b"}
+    new = {"route_id": 3, "description": "c"}
+    documents = [unchanged, changed, new]
+    manifest = LoadManifest(tmp_path / "load_manifest.json", "openbeta-20250101000000", "mappings", {
+        "1": content_hash(unchanged), "2": "stale", "4": "removed",
+    })
+    es = Mock()
+    es.indices.get_mapping.return_value = {"openbeta-20250101000000": {"mappings": {"_meta": {"generation": 1}}}}
+    embedded = []
+    indexed = []
+
+    def embed_documents_stream(documents, openai_client, dimensions=None):
+        for doc in documents:
+            embedded.append(doc["route_id"])
+            yield doc
+
+    with patch("scripts.load_climbing_data.embed_documents_stream", side_effect=embed_documents_stream), \
+            patch("scripts.load_climbing_data.iter_bulk_index", side_effect=_fake_bulk_index(indexed)), \
+            patch("scripts.load_climbing_data.delete_documents") as mock_delete:
+        update_elasticsearch(es, manifest, documents)
+
+    assert embedded == [2, 3]
+    assert indexed == [2, 3]
+    mock_delete.assert_called_once_with(es, "openbeta-20250101000000", ["4"])
+    expected_routes = {"1": content_hash(unchanged), "2": content_hash(changed), "3": content_hash(new)}
+    assert LoadManifest.load(tmp_path / "load_manifest.json").routes == expected_routes
+    # the alias stays put, so the generation is how the app sees the index changed
+    es.indices.put_mapping.assert_called_once_with(index="openbeta-20250101000000", meta={"generation": 2})
+
+    # a rerun on the same data is a no-op
+    es.indices.put_mapping.reset_mock()
+    embedded.clear()
+    indexed.clear()
+    with patch("scripts.load_climbing_data.embed_documents_stream", side_effect=embed_documents_stream), \
+            patch("scripts.load_climbing_data.iter_bulk_index", side_effect=_fake_bulk_index(indexed)), \
+            patch("scripts.load_climbing_data.delete_documents") as mock_delete:
+        update_elasticsearch(es, LoadManifest.load(tmp_path / "load_manifest.json"), documents)
+    assert embedded == []
+    assert indexed == []
+    mock_delete.assert_not_called()
+    es.indices.put_mapping.assert_not_called()
+
+
+@patch("scripts.load_climbing_data.finalize_index")
+@patch("scripts.load_climbing_data.OpenAI")
+def test_rebuild_elasticsearch_resumes_from_checkpoint(mock_openai, mock_finalize, tmp_path):
+    documents = [{"route_id": i, "description": str(i)} for i in range(5)]
+    manifest_path = tmp_path / "load_manifest.json"
+    checkpoint_path = tmp_path / "load_checkpoint.json"
+    # an earlier run indexed the first two routes before crashing
+    checkpoint = LoadManifest(checkpoint_path, "openbeta-20250101000000", mappings_hash(INDEX_MAPPINGS))
+    checkpoint.save()
+    checkpoint.record(list(hash_documents(dict(doc) for doc in documents[:2])))
+    checkpoint.close()
+    es = Mock()
+    es.indices.exists.return_value = True
+    indexed = []
+
+    with patch("scripts.load_climbing_data.embed_documents_stream", side_effect=lambda docs, client, dimensions=None: docs), \
+            patch("scripts.load_climbing_data.iter_bulk_index", side_effect=_fake_bulk_index(indexed)):
+        rebuild_elasticsearch(es, documents, manifest_path, checkpoint_path)
+
+    es.indices.create.assert_not_called()
+    assert indexed == [2, 3, 4]
+    mock_finalize.assert_called_once_with(es, "openbeta-20250101000000")
+    assert not checkpoint_path.exists()
+    manifest = LoadManifest.load(manifest_path)
+    assert manifest.index_name == "openbeta-20250101000000"
+    assert sorted(manifest.routes) == ["0", "1", "2", "3", "4"]
+
+
+@patch("scripts.load_climbing_data.versioned_index_name", return_value="sectors-20250101000000")
+@patch("scripts.load_climbing_data.helpers.parallel_bulk")
+def test_load_sectors_swaps_sectors_alias(mock_parallel_bulk, mock_index_name):
+    es = Mock()
+    es.indices.exists_alias.return_value = False
+    es.indices.exists.return_value = False
+    es.indices.get.return_value = {"sectors-20250101000000": {}}
+    loaded = []
+
+    def parallel_bulk(client, actions, **kwargs):
+        for action in actions:
+            loaded.append((action["_id"], action["_source"]["route_count"]))
+            yield True, {}
+    mock_parallel_bulk.side_effect = parallel_bulk
+
+    df = pd.DataFrame([_route(route_ID=1, sector_ID="10"), _route(route_ID=2, sector_ID="10"), _route(route_ID=3, sector_ID="20")])
+    summaries = []
+    assert len(list(tap_route_summaries(iter_documents(df), summaries))) == 3
+    assert "description" not in summaries[0]
+    load_sectors(es, summaries)
+
+    assert loaded == [("10", 2), ("20", 1)]
+    assert es.indices.create.call_args.kwargs["index"] == "sectors-20250101000000"
+    assert es.indices.create.call_args.kwargs["mappings"]["properties"]["grade_buckets"]["type"] == "nested"
+    es.indices.update_aliases.assert_called_once_with(actions=[
+        {"add": {"index": "sectors-20250101000000", "alias": "sectors"}},
+    ])
+
+
+def test_save_route_name_index(tmp_path):
+    df = pd.DataFrame([_route(route_ID=1), _route(route_ID=2, route_name="Highway to Hell", parent_loc=[-118.5, 37.3])])
+    save_route_name_index(iter_documents(df), tmp_path / "route_name_index.npz")
+
+    result = RouteNameIndex.load(tmp_path / "route_name_index.npz").lookup("highway to hel")
+    assert [route["route_id"] for route in result["routes"]] == [2]
+    assert result["routes"][0]["location"] == {"lat": 37.3, "lon": -118.5}
+    assert result["routes"][0]["sector_name"] == "Drive In Wall"
@@ -0,0 +1,141 @@
+import pytest
+from clients.climbing_data_client import COMPACT_DESCRIPTION_CHARS
+from clients.local_client import LocalClimbingDataClient
+
+TRUCKEE = {"lat": 39.328, "lon": -120.183}
+
+
+def _doc(route_id, route_name, sector_name, grade, style, location, rating=3.0, description="", vector=None):
+    return {
+        "route_name": route_name,
+        "route_id": route_id,
+        "sector_id": f"s-{sector_name}",
+        "grade": grade,
+        "sector_name": sector_name,
+        "location": location,
+        "style": style,
+        "description": description,
+        "description_vector": vector,
+        "rating": rating,
+    }
+
+
+@pytest.fixture
+def client():
+    documents = [
+        _doc(1, "The Pearl", "Pearl Boulders", "V6", "boulder", {"lat": 39.33, "lon": -120.18}, 4.5,
+             "Crimpy face to a committing topout", [1.0, 0.0, 0.0]),
+        _doc(2, "Black Pearl", "Bishop Bowl", "V4", "boulder", {"lat": 37.4, "lon": -118.5}, 3.5,
+             "Slopey arete", [0.0, 1.0, 0.0]),
+        _doc(3, "Transgression", "Hole in the Wall", "5.10b", "trad", {"lat": 36.131, "lon": -115.424}, 3.5,
+             "Classic crack climb", [0.0, 0.0, 1.0]),
+        _doc(4, "Crimp Scene", "Pearl Boulders", "V7", "boulder", {"lat": 39.331, "lon": -120.181}, None,
+             "Sharp crimps over a flat landing", [0.9, 0.1, 0.0]),
+        _doc(5, "Lost Route", "Nowhere", "5.9", "sport", None, 2.0, "Bolted face"),
+    ]
+    # stand-in for a query embedding: crimpy queries point at the first axis
+    return LocalClimbingDataClient(documents, embed_query=lambda text: [1.0, 0.0, 0.0] if "crimp" in text else [0.0, 0.0, 1.0])
+
+
+def test_fuzzy_route_name(client):
+    result = client.search_climbs(route_name="the perl")
+    assert result["routes"][0]["route_name"] == "The Pearl"
+    assert {route["route_id"] for route in result["routes"]} <= {1, 2}
+
+    assert client.search_climbs(route_name="Transgresion")["routes"][0]["route_id"] == 3
+    assert client.search_climbs(route_name="zzzz") == {"total": 0, "routes": [], "search_after": None}
+
+
+def test_sector_and_filters(client):
+    result = client.search_climbs(sector_name="pearl boulders", grades=["V6", "V7"], style="boulder")
+    assert sorted(route["route_id"] for route in result["routes"]) == [1, 4]
+
+    result = client.search_climbs(sector_name="pearl boulders", rating_min=4)
+    assert [route["route_id"] for route in result["routes"]] == [1]
+
+
+def test_location_radius(client):
+    result = client.search_climbs(location=TRUCKEE, location_radius_miles=5)
+    assert sorted(route["route_id"] for route in result["routes"]) == [1, 4]
+
+    result = client.search_climbs(location=TRUCKEE, location_radius_miles=250)
+    assert sorted(route["route_id"] for route in result["routes"]) == [1, 2, 4]
+
+    with pytest.raises(ValueError):
+        client.search_climbs(location=TRUCKEE, location_radius_miles=None)
+
+
+def test_description_vector_search(client):
+    result = client.search_climbs(description="crimpy problems", location=TRUCKEE, location_radius_miles=250)
+    assert [route["route_id"] for route in result["routes"]] == [1, 4, 2]
+    assert result["routes"][0]["score"] > result["routes"][2]["score"]
+
+
+def test_description_keyword_fallback(client):
+    client.embed_query = None
+    result = client.search_climbs(description="crack classic")
+    assert [route["route_id"] for route in result["routes"]] == [3]
+
+
+def test_route_shape_and_size(client):
+    result = client.search_climbs(size=2)
+    assert result["total"] == 5
+    assert len(result["routes"]) == 2
+    lost = client.search_climbs(route_name="Lost Route")["routes"][0]
+    assert lost == {
+        "route_name": "Lost Route", "route_id": 5, "sector_id": "s-Nowhere", "sector_name": "Nowhere",
+        "grade": "5.9", "style": "sport", "description": "Bolted face", "rating": 2.0, "location": None,
+        "score": lost["score"],
+    }
+
+
+def test_search_after_pages_through_results(client):
+    first = client.search_climbs(style="boulder", size=2)
+    second = client.search_climbs(style="boulder", size=2, search_after=first["search_after"])
+
+    assert first["total"] == second["total"] == 3
+    assert first["search_after"] == [first["routes"][1]["score"], first["routes"][1]["route_id"]]
+    assert [route["route_id"] for route in first["routes"] + second["routes"]] == [1, 2, 4]
+    assert second["search_after"] is None
+
+
+def test_compact_truncates_descriptions():
+    long_description = "Start on the obvious jug and follow the seam up and right. " * 10
+    client = LocalClimbingDataClient([_doc(1, "Long One", "Somewhere", "5.10a", "trad", None, description=long_description)])
+
+    description = client.search_climbs(compact=True)["routes"][0]["description"]
+    assert len(description) <= COMPACT_DESCRIPTION_CHARS
+    assert description.endswith("…") and long_description.startswith(description[:-1])
+    assert client.search_climbs()["routes"][0]["description"] == long_description
+
+
+def test_grade_range(client):
+    result = client.search_climbs(grade_min="V5", grade_max="V7")
+    assert sorted(route["route_id"] for route in result["routes"]) == [1, 4]
+
+    result = client.search_climbs(grade_max="5.10")
+    assert sorted(route["route_id"] for route in result["routes"]) == [3, 5]
+
+    with pytest.raises(ValueError):
+        client.search_climbs(grade_min="V5", grade_max="5.10a")
+
+
+def test_search_sectors_covers_every_climber(client):
+    result = client.search_sectors([{"grade_min": "V5", "grade_max": "V7"}, {"grade_max": "5.10", "style": "trad"}])
+
+    assert [sector["sector_name"] for sector in result["sectors"]] == ["Pearl Boulders", "Hole in the Wall"]
+    pearl = result["sectors"][0]
+    assert pearl["climber_route_counts"] == [2, 0]
+    assert pearl["grade_histogram"] == {"boulder": {"V6": 1, "V7": 1}}
+    assert pearl["route_count"] == 2
+    assert "grade_buckets" not in pearl
+
+    nearby = client.search_sectors([{"grade_min": "V0"}], location=TRUCKEE, location_radius_miles=5)
+    assert [sector["sector_name"] for sector in nearby["sectors"]] == ["Pearl Boulders"]
+
+
+def test_lookup_route_prefers_nearby_routes(client):
+    result = client.lookup_route("the perl", location=TRUCKEE)
+    assert result["routes"][0]["route_id"] == 1
+    assert result["routes"][0]["sector_name"] == "Pearl Boulders"
+    assert client.lookup_route("Lost Route")["routes"][0]["location"] is None
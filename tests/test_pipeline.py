@@ -0,0 +1,43 @@
+import pytest
+from core.pipeline import Pipeline
+
+
+def test_pipeline_runs_stages_in_order():
+    seen = []
+
+    def sink(items):
+        for item in items:
+            seen.append(item)
+            yield item
+
+    stats = (
+        Pipeline(range(100), queue_size=3)
+        .add_stage("double", lambda items: (item * 2 for item in items))
+        .add_stage("evens", lambda items: (item for item in items if item % 4 == 0))
+        .add_stage("sink", sink)
+        .run()
+    )
+
+    assert seen == [i * 2 for i in range(100) if (i * 2) % 4 == 0]
+    assert [(s.name, s.items) for s in stats] == [("double", 100), ("evens", 50), ("sink", 50)]
+
+
+def test_pipeline_raises_stage_errors():
+    consumed = []
+
+    def source():
+        for i in range(10000):
+            consumed.append(i)
+            yield i
+
+    def fail(items):
+        for item in items:
+            if item == 5:
+                raise ValueError("bad item")
+            yield item
+
+    with pytest.raises(ValueError, match="bad item"):
+        Pipeline(source(), queue_size=2).add_stage("read", lambda items: items).add_stage("fail", fail).run()
+
+    # the bounded queues stop the source from running far ahead of the failure
+    assert len(consumed) < 100
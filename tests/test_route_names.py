@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from core.ngram_index import NGramIndex
+from core.route_names import RouteNameIndex
+
+BISHOP = {"lat": 37.36, "lon": -118.4}
+TRUCKEE = {"lat": 39.328, "lon": -120.183}
+
+
+def _doc(route_id, route_name, sector_name, location):
+    return {
+        "route_name": route_name,
+        "route_id": route_id,
+        "sector_id": f"s-{sector_name}",
+        "sector_name": sector_name,
+        "location": location,
+    }
+
+
+@pytest.fixture
+def index():
+    return RouteNameIndex.from_documents([
+        _doc(1, "The Pearl", "Pearl Boulders", {"lat": 39.33, "lon": -120.18}),
+        _doc(2, "The Pearl", "Buttermilks", {"lat": 37.33, "lon": -118.58}),
+        _doc(3, "The Pearl Direct", "Buttermilks", {"lat": 37.33, "lon": -118.58}),
+        _doc(4, "Black Pearl", "Bishop Bowl", {"lat": 37.4, "lon": -118.5}),
+        _doc(5, "Transgression", "Hole in the Wall", None),
+    ])
+
+
+def test_exact_names_are_disambiguated_by_distance(index):
+    result = index.lookup("the pearl!", location=BISHOP)
+    assert result["total"] == 2
+    assert [route["route_id"] for route in result["routes"]] == [2, 1]
+    assert result["routes"][0] == {
+        "route_name": "The Pearl", "route_id": 2, "sector_id": "s-Buttermilks", "sector_name": "Buttermilks",
+        "location": {"lat": 37.33, "lon": -118.58}, "score": 1.0, "distance_miles": 10.1,
+    }
+    assert [route["route_id"] for route in index.lookup("The Pearl", location=TRUCKEE)["routes"]] == [1, 2]
+    assert "distance_miles" not in index.lookup("The Pearl")["routes"][0]
+
+
+def test_prefix_and_misspelled_names(index):
+    assert [route["route_id"] for route in index.lookup("the pearl dir")["routes"]] == [3]
+    assert index.lookup("Transgresion")["routes"][0]["route_id"] == 5
+    assert index.lookup("Transgresion", location=BISHOP)["routes"][0]["distance_miles"] is None
+    assert index.lookup("zzzz") == {"total": 0, "routes": []}
+    assert index.lookup("  ") == {"total": 0, "routes": []}
+    assert len(index.lookup("pearl", size=2)["routes"]) == 2
+
+
+def test_save_and_load(index, tmp_path):
+    path = tmp_path / "route_name_index.npz"
+    index.save(path)
+    loaded = RouteNameIndex.load(path)
+
+    assert len(loaded) == 5
+    for name in ("The Pearl", "the pearl dir", "Transgresion"):
+        assert loaded.lookup(name, location=BISHOP) == index.lookup(name, location=BISHOP)
+
+
+def test_ngram_search_counts_common_ngrams_like_rare_ones():
+    # most names share "the", so the search counts matches per row instead of sorting postings
+    texts = [f"the crimp {i}" for i in range(50)] + ["the pearl", "black pearl"]
+    index = NGramIndex(texts)
+    restored = NGramIndex.from_arrays(index.to_arrays())
+    for query in ("the crimp 7", "the perl", "pearl"):
+        rows, scores = index.search(query)
+        restored_rows, restored_scores = restored.search(query)
+        assert rows.tolist() == restored_rows.tolist()
+        np.testing.assert_allclose(scores, restored_scores)
+    rows, _ = index.search("the crimp 7")
+    assert 7 in rows.tolist() and 50 not in rows.tolist()
@@ -0,0 +1,64 @@
+import math
+
+from core.sectors import COVERAGE_TIER, build_sector_documents, climber_route_counts, coverage_score, grade_histogram
+
+
+def _route(sector_id, grade, style, rating=3.0, location=None, sector_name="Crag"):
+    return {"sector_id": sector_id, "sector_name": sector_name, "grade": grade, "style": style, "rating": rating,
+            "location": location}
+
+
+def test_build_sector_documents():
+    sectors = build_sector_documents([
+        _route("a", "V3", "boulder", 4.0, {"lat": 1.0, "lon": 2.0}),
+        _route("a", "V3", "boulder", None, {"lat": 3.0, "lon": 4.0}),
+        _route("a", "5.10a", "sport", 2.0),
+        _route("b", None, "trad", None, sector_name=None),
+    ])
+
+    a, b = sectors
+    assert a["sector_id"] == "a"
+    assert a["location"] == {"lat": 2.0, "lon": 3.0}
+    assert a["route_count"] == 3
+    assert a["rating"] == 3.0
+    assert a["style_counts"] == {"boulder": 2, "sport": 1}
+    assert sorted(a["grade_buckets"], key=lambda bucket: bucket["grade"]) == [
+        {"style": "sport", "grade": "5.10a", "grade_system": "yds", "grade_numeric": 10.0, "count": 1},
+        {"style": "boulder", "grade": "V3", "grade_system": "v", "grade_numeric": 3.0, "count": 2},
+    ]
+    assert b["sector_name"] is None and b["location"] is None and b["rating"] is None
+    assert b["grade_buckets"] == [{"style": "trad", "grade": None, "grade_system": None, "grade_numeric": None, "count": 1}]
+
+
+def test_build_sector_documents_skips_routes_without_a_sector():
+    sectors = build_sector_documents([_route("a", "V3", "boulder"), _route(None, "V4", "boulder"), _route(math.nan, "V5", "boulder")])
+
+    assert [(sector["sector_id"], sector["route_count"]) for sector in sectors] == [("a", 1)]
+    assert build_sector_documents([_route(math.nan, "V5", "boulder")]) == []
+
+
+def test_coverage_prefers_sectors_suiting_every_climber():
+    climbers = [{"grade_min": "V2", "grade_max": "V4"}, {"grade_min": "5.10a", "grade_max": "5.10d", "style": "sport"}]
+    one_sided = build_sector_documents([_route("a", "V3", "boulder")] * 20)[0]["grade_buckets"]
+    balanced = build_sector_documents([_route("b", "V3", "boulder")] * 5 + [_route("b", "5.10b", "sport")] * 5)[0]["grade_buckets"]
+
+    assert climber_route_counts(one_sided, climbers) == [20, 0]
+    assert climber_route_counts(balanced, climbers) == [5, 5]
+    assert math.isclose(coverage_score(one_sided, climbers), COVERAGE_TIER + math.log1p(20))
+    assert math.isclose(coverage_score(balanced, climbers), 2 * (COVERAGE_TIER + math.log1p(5)))
+    assert coverage_score(balanced, climbers) > coverage_score(one_sided, climbers)
+
+
+def test_coverage_scores_climbers_not_grade_buckets():
+    climbers = [{"grade_min": "V0", "grade_max": "V10"}, {"grade_min": "5.10a", "grade_max": "5.10d", "style": "sport"}]
+    # one climber's routes spread over many grades don't add up to covering the whole party
+    spread = build_sector_documents([_route("a", f"V{grade}", "boulder") for grade in range(8)])[0]["grade_buckets"]
+    party = build_sector_documents([_route("b", "V3", "boulder")] * 5 + [_route("b", "5.10b", "sport")] * 5)[0]["grade_buckets"]
+
+    assert math.isclose(coverage_score(spread, climbers), COVERAGE_TIER + math.log1p(8))
+    assert coverage_score(party, climbers) > coverage_score(spread, climbers)
+
+
+def test_grade_histogram_orders_by_difficulty():
+    buckets = build_sector_documents([_route("a", grade, "boulder") for grade in ["V10", "V2", "V2", "VB"]])[0]["grade_buckets"]
+    assert list(grade_histogram(buckets)["boulder"].items()) == [("VB", 1), ("V2", 2), ("V10", 1)]
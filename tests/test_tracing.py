@@ -0,0 +1,82 @@
+import json
+import logging
+import urllib.request
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import pytest
+from core import tracing
+from core.completion import get_completions_stream
+
+
+@pytest.fixture
+def metrics():
+    metrics = tracing.Metrics()
+    with patch.object(tracing.tracer, "log_spans", True), patch.object(tracing.tracer, "metrics", metrics):
+        yield metrics
+
+
+def _spans(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records if record.name == tracing.logger.name]
+
+
+def test_disabled_tracer_hands_out_noop_span():
+    tracer = tracing.Tracer()
+    with tracer.span("search", index="openbeta") as span:
+        span.set(hits=3)
+        span.mark("ttft_seconds")
+    assert span is tracing.NOOP_SPAN
+    assert not span.recording
+
+
+def test_span_logs_json_and_feeds_metrics(metrics, caplog):
+    caplog.set_level(logging.INFO, logger=tracing.logger.name)
+
+    with tracing.span("elasticsearch.search", index="openbeta") as span:
+        span.set(took_seconds=0.004, hits=2, prompt_tokens=12)
+    with pytest.raises(ValueError):
+        with tracing.span("elasticsearch.search"):
+            raise ValueError("boom")
+
+    first, second = _spans(caplog)
+    assert first["span"] == "elasticsearch.search" and first["index"] == "openbeta" and first["hits"] == 2
+    assert second["error"] == "ValueError"
+    rendered = metrics.render()
+    assert "climbing_guide_elasticsearch_search_seconds_count 2" in rendered
+    assert 'climbing_guide_elasticsearch_search_took_seconds_bucket{le="0.005"} 1' in rendered
+    assert "climbing_guide_elasticsearch_search_prompt_tokens_total 12" in rendered
+    assert "climbing_guide_elasticsearch_search_errors_total 1" in rendered
+
+
+@pytest.mark.usefixtures("fake_tiktoken")
+def test_chat_turn_records_ttft_tokens_and_tool_calls(metrics, caplog, chat_chunks, streaming_openai_client):
+    caplog.set_level(logging.INFO, logger=tracing.logger.name)
+    climbing_data_client = Mock()
+    climbing_data_client.search_climbs.return_value = {"total": 1, "routes": [], "search_after": None}
+    usage = SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=50, completion_tokens=7))
+    openai_client = streaming_openai_client(
+        chat_chunks.tool_calls(0, "a", {"route_name": "The Pearl"}) + [usage],
+        chat_chunks.answer("Try The Pearl") + [usage],
+    )
+
+    list(get_completions_stream(openai_client, climbing_data_client, "gpt-4o", [{"role": "user", "content": "hi"}]))
+
+    spans = {span["span"] + str(span.get("round", "")): span for span in _spans(caplog)}
+    assert spans["tool_call"]["tool"] == "search_climbs" and spans["tool_call"]["total"] == 1
+    assert spans["llm_round1"]["tool_calls"] == ["search_climbs"]
+    assert spans["llm_round2"]["prompt_tokens"] == 50 and spans["llm_round2"]["tool_calls"] == []
+    assert 0 <= spans["chat_turn"]["ttft_seconds"] <= spans["chat_turn"]["duration_ms"] / 1000
+    assert "climbing_guide_llm_round_completion_tokens_total 14" in metrics.render()
+
+
+def test_metrics_server_serves_prometheus_text():
+    metrics = tracing.Metrics()
+    metrics.observe("climbing_guide_chat_turn_seconds", 1.5)
+    server = tracing.start_metrics_server(metrics, port=0, host="127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        server.shutdown()
+    assert 'climbing_guide_chat_turn_seconds_bucket{le="2.5"} 1' in body
+    assert "climbing_guide_chat_turn_seconds_sum 1.5" in body
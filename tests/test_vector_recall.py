@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from core.vector_recall import normalize, quantize, recall_at_k, rescored_top_k, shorten_embeddings, top_k
+
+
+def vectors(count=300, dimensions=64, seed=0):
+    return normalize(np.random.default_rng(seed).standard_normal((count, dimensions)))
+
+
+def test_shorten_embeddings_truncates_and_renormalizes():
+    matrix = vectors()
+    short = shorten_embeddings(matrix, 16)
+    assert short.shape == (300, 16)
+    assert np.allclose(np.linalg.norm(short, axis=1), 1)
+    assert np.allclose(short, normalize(matrix[:, :16]))
+
+
+def test_top_k_and_recall():
+    corpus = vectors()
+    queries = corpus[:5]
+    found = top_k(queries, corpus, 3)
+    assert found.shape == (5, 3)
+    # each query is its own nearest neighbour
+    assert found[:, 0].tolist() == [0, 1, 2, 3, 4]
+    assert recall_at_k(found, found) == 1.0
+    assert recall_at_k(found, found[:, ::-1]) == 1.0
+    assert recall_at_k(found, np.repeat(found[:, :1], 3, axis=1)) == pytest.approx(1 / 3)
+
+
+def test_quantized_search_with_rescoring_keeps_recall():
+    corpus, queries = vectors(), vectors(20, seed=1)
+    expected = top_k(queries, corpus, 10)
+    for representation in ("float16", "int8"):
+        assert recall_at_k(expected, top_k(queries, quantize(corpus, representation), 10)) >= 0.9
+    rescored = rescored_top_k(queries, quantize(corpus, "bbq"), corpus, 10, oversample=5)
+    assert recall_at_k(expected, rescored) > recall_at_k(expected, top_k(queries, quantize(corpus, "bbq"), 10))
+
+    with pytest.raises(ValueError):
+        quantize(corpus, "int2")